@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from core.search import SearchAdminMixin
 from .models import CustomUser
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 
 @admin.register(CustomUser)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(SearchAdminMixin, UserAdmin):
     add_form = CustomUserCreationForm
     form = CustomUserChangeForm
     model = CustomUser
@@ -12,7 +13,7 @@ class CustomUserAdmin(UserAdmin):
     list_display = ['email', 'name', 'phone', 'is_staff', 'is_active']
     list_filter = ['is_staff', 'is_active']
     ordering = ['email']
-    search_fields = ['email', 'name']
+    search_fields = ['email', 'name']  # Só exibe a caixa de busca: ver core.search
 
     # EDIÇÃO
     fieldsets = (
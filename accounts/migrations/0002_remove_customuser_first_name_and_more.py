@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='customuser',
+            name='first_name',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='last_name',
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='email',
+            field=models.EmailField(db_index=True, max_length=254, unique=True, verbose_name='Endereço de Email'),
+        ),
+    ]
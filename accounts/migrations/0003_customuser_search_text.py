@@ -0,0 +1,52 @@
+import unicodedata
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models, transaction
+
+from core.operations import PostgresAddIndex, PostgresExtension
+
+BATCH_SIZE = 5000
+
+
+def _normalize(*values):
+    # Cópia de core.search.normalize_search_text na época da migração
+    text = unicodedata.normalize('NFKD', ' '.join(v for v in values if v).lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def backfill_search_text(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    last_pk = 0
+    while True:
+        batch = list(CustomUser.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'name', 'email')[:BATCH_SIZE])
+        if not batch:
+            break
+        for user in batch:
+            user.search_text = _normalize(user.name, user.email)
+        with transaction.atomic():
+            CustomUser.objects.bulk_update(batch, ['search_text'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Sem transação única: em tabelas grandes cada lote é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0002_remove_customuser_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='Texto de busca'),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        # Índices criados depois do backfill (mais rápido que atualizar índice linha a linha),
+        # CONCURRENTLY: tabela grande não fica com as escritas travadas durante o build
+        PostgresExtension('pg_trgm'),
+        PostgresAddIndex('customuser', GinIndex(fields=['search_text'], opclasses=['gin_trgm_ops'], name='user_search_trgm_idx'), concurrently=True),
+        PostgresAddIndex('customuser', GinIndex(SearchVector('search_text', config='portuguese'), name='user_search_fts_idx'), concurrently=True),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from core.models import DerivedFieldsMixin
+from core.search import normalize_search_text
 
 # 1. O Manager (O "Gerente" que sabe criar usuários sem username)
 class CustomUserManager(BaseUserManager):
@@ -18,7 +20,7 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 # 2. O Modelo de Usuário (A Tabela no Banco)
-class CustomUser(AbstractUser):
+class CustomUser(DerivedFieldsMixin, AbstractUser):
     username = None  
     first_name = None 
     last_name = None 
@@ -28,12 +30,20 @@ class CustomUser(AbstractUser):
     name = models.CharField('Nome Completo', max_length=255)
     phone = models.CharField('Telefone', max_length=20, blank=True)
 
+    # Nome e email em minúsculas e sem acento (busca indexada, ver core.search)
+    search_text = models.TextField('Texto de busca', blank=True, editable=False)
+
     # Configurações do Django
     USERNAME_FIELD = 'email'  # O login será pelo email
     REQUIRED_FIELDS = ['name']  # Campos obrigatórios no terminal (createsuperuser)
 
     objects = CustomUserManager()
 
+    DERIVED_FIELDS = {'search_text': ['name', 'email']}
+
+    def refresh_derived_fields(self):
+        self.search_text = normalize_search_text(self.name, self.email)
+
     def get_short_name(self):    
         return self.name.split()[0] if self.name else self.email.split('@')[0]
 
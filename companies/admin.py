@@ -1,20 +1,44 @@
 from django.contrib import admin
-from .models import Company, Membership
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.template.response import TemplateResponse
+from core.paginator import EstimatedCountPaginator
+from core.search import SearchAdminMixin
+from .exports import export_response
+from .filters import CompanyFilter
+from .forms import CompanyAdminForm
+from .audit import describe
+from .models import ChangeEvent, Company, Membership, Partner
+
+HISTORY_PAGE_SIZE = 50
 
 class MembershipInline(admin.TabularInline):
     model = Membership
     extra = 0 # Começa sem linhas extras para ficar limpo
     autocomplete_fields = ['user']
 
+class PartnerInline(admin.TabularInline):
+    model = Partner
+    extra = 0
+    fields = ['name', 'cpf', 'email', 'phone']
+
 @admin.register(Company)
-class CompanyAdmin(admin.ModelAdmin):
+class CompanyAdmin(SearchAdminMixin, admin.ModelAdmin):
     # Colunas da tabela
     list_display = ['get_name', 'cnpj', 'city', 'state', 'updated_at', 'updated_by']
+    list_select_related = ['updated_by']  # JOIN em vez de uma query por linha
+    form = CompanyAdminForm  # Valida e normaliza o CNPJ como no cadastro
+
+    # Tabelas grandes: total estimado e sem o segundo COUNT(*) do "mostrar todos"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     # Filtros laterais
     list_filter = ['state', 'created_at']
     
-    # Campo de busca
+    # Campo de busca (só liga a caixa de busca; a consulta usa o search_text indexado, ver core.search)
     search_fields = ['legal_name', 'trade_name', 'cnpj']
     
     # Organização do Formulário (Abas visuais)
@@ -22,15 +46,17 @@ class CompanyAdmin(admin.ModelAdmin):
         ('Identificação', {
             'fields': ('cnpj', 'legal_name', 'trade_name', 'state_registration')
         }),
-        ('Sócios', {
-            'fields': ('partners',)
-        }),
         ('Contato', {
             'fields': ('email', 'phone', 'website')
         }),
         ('Endereço', {
             'fields': ('zip_code', 'address', 'number', 'complement', 'neighborhood', 'city', 'state')
         }),
+        ('Permissões', {
+            # Ex.: {"broker": {"grant": ["export_data"], "revoke": ["view_clients"]}}
+            'fields': ('role_capabilities',),
+            'classes': ('collapse',)
+        }),
         ('Auditoria', {
             'fields': ('updated_by', 'created_at', 'updated_at'),
             'classes': ('collapse',) # Esconde essa parte por padrão
@@ -40,12 +66,58 @@ class CompanyAdmin(admin.ModelAdmin):
     # Campos que não podem ser editados manualmente
     readonly_fields = ['created_at', 'updated_at', 'updated_by']
     
-    inlines = [MembershipInline]
+    inlines = [PartnerInline, MembershipInline]
+
+    actions = ['export_companies', 'export_partners', 'export_memberships']
 
     def get_name(self, obj):
         return str(obj)
     get_name.short_description = 'Empresa'
 
+    # Exportações em streaming (não carregam tudo na memória)
+    @admin.action(description='Exportar empresas selecionadas (CSV)')
+    def export_companies(self, request, queryset):
+        return export_response('companies', queryset.values('pk'), 'csv', filename='empresas')
+
+    @admin.action(description='Exportar sócios das empresas selecionadas (CSV)')
+    def export_partners(self, request, queryset):
+        return export_response('partners', queryset.values('pk'), 'csv', filename='socios')
+
+    @admin.action(description='Exportar membros das empresas selecionadas (CSV)')
+    def export_memberships(self, request, queryset):
+        return export_response('memberships', queryset.values('pk'), 'csv', filename='membros')
+
+    def history_view(self, request, object_id, extra_context=None):
+        # Histórico campo a campo (ChangeEvent) da empresa, dos sócios e dos membros.
+        # Paginação por id (?before=<id>): cada página é um range scan no índice, sem OFFSET nem COUNT
+        company = self.get_object(request, unquote(object_id))
+        if company is None:
+            raise Http404
+        if not self.has_view_or_change_permission(request, company):
+            raise PermissionDenied
+
+        # Admin é de várias empresas (sem empresa ativa): for_company explícito
+        events = ChangeEvent.objects.for_company(company).select_related('actor').order_by('-id')
+        before = request.GET.get('before')
+        if before and before.isdigit():
+            events = events.filter(id__lt=int(before))
+        events = list(events[:HISTORY_PAGE_SIZE + 1])
+        next_before = events[HISTORY_PAGE_SIZE - 1].id if len(events) > HISTORY_PAGE_SIZE else None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Histórico: {company}',
+            'subtitle': None,
+            'object': company,
+            'opts': self.opts,
+            'events': [(event, describe(event)) for event in events[:HISTORY_PAGE_SIZE]],
+            'next_before': next_before,
+            'is_first_page': not before,
+            **(extra_context or {}),
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/companies/company/change_history.html', context)
+
     # --- O PULO DO GATO ---
     # Sobrescrevemos o método salvar para preencher o 'updated_by'
     def save_model(self, request, obj, form, change):
@@ -53,8 +125,20 @@ class CompanyAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 @admin.register(Membership)
-class MembershipAdmin(admin.ModelAdmin):
+class MembershipAdmin(SearchAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'company', 'role', 'is_active']
-    list_filter = ['role', 'is_active', 'company']
+    list_select_related = ['user', 'company']
+    # Empresa com busca (select2) em vez de listar todas as empresas na lateral
+    list_filter = ['role', 'is_active', CompanyFilter]
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ['user__email', 'user__name', 'company__legal_name']
-    autocomplete_fields = ['user', 'company']
\ No newline at end of file
+    # A busca vai no search_text do usuário e da empresa (subqueries indexados, sem join)
+    search_related = ['user', 'company']
+    autocomplete_fields = ['user', 'company']
+
+    @property
+    def media(self):
+        # select2 do filtro de empresa (os mesmos arquivos do autocomplete_fields)
+        return super().media + AutocompleteSelect(self.model._meta.get_field('company'), self.admin_site).media
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CompaniesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'companies'
+
+    def ready(self):
+        # Registra os signals (invalidação do cache do tenant)
+        from . import signals  # noqa: F401
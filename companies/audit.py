@@ -0,0 +1,234 @@
+"""
+Histórico de alterações (ChangeEvent) sem custo de escrita no request.
+
+1. post_init guarda uma cópia dos valores carregados (_audit_snapshot)
+2. post_save/post_delete comparam com a cópia e montam o ChangeEvent (em memória)
+3. Depois do commit o evento vai para uma fila; uma thread do worker grava
+   a fila em lote (bulk_create), a cada AUDIT_BATCH_SIZE eventos ou
+   AUDIT_FLUSH_INTERVAL segundos
+
+Rollback: o on_commit não roda e o evento é descartado junto.
+bulk_create/bulk_update não disparam signals: quem usa (ex.: formset de
+sócios) chama record() direto. Com AUDIT_ASYNC=False (testes, scripts)
+os eventos são gravados na hora, depois do commit.
+"""
+import atexit
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import ChangeEvent, Company, Membership, Partner
+
+logger = logging.getLogger(__name__)
+
+AUDITED_MODELS = (Company, Partner, Membership)
+
+# Campos que não entram no histórico (derivados ou de controle)
+EXCLUDED_FIELDS = {
+    'id', 'search_text', 'cnpj_normalized', 'cpf_normalized',
+    'created_at', 'updated_at', 'updated_by_id', 'date_joined',
+}
+
+_fields_cache = {}
+
+# Request atual (AuditMiddleware): de onde sai o usuário que fez a alteração
+_current_request = ContextVar('audit_request', default=None)
+
+
+def audited_fields(model):
+    if model not in _fields_cache:
+        _fields_cache[model] = [f.attname for f in model._meta.concrete_fields if f.attname not in EXCLUDED_FIELDS]
+    return _fields_cache[model]
+
+
+def snapshot(instance):
+    # Só o que já está carregado: campo adiado (.only/.defer) não dispara query
+    values = instance.__dict__
+    return {
+        name: copy.deepcopy(values[name]) if isinstance(values[name], (dict, list)) else values[name]
+        for name in audited_fields(type(instance)) if name in values
+    }
+
+
+def diff(instance):
+    """{campo: [antes, depois]} desde o último snapshot (carga ou último save)."""
+    before = getattr(instance, '_audit_snapshot', None) or {}
+    after = snapshot(instance)
+    return {name: [before.get(name), value] for name, value in after.items() if name in before and before[name] != value}
+
+
+def _company_id(instance):
+    return instance.pk if isinstance(instance, Company) else instance.company_id
+
+
+def _actor_id():
+    request = _current_request.get()
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def build_event(instance, action):
+    """Monta o ChangeEvent (sem gravar) e atualiza o snapshot. None se nada mudou."""
+    if action == ChangeEvent.ACTION_CREATE:
+        changes = {name: [None, value] for name, value in snapshot(instance).items() if value not in (None, '', {}, [])}
+    elif action == ChangeEvent.ACTION_DELETE:
+        before = getattr(instance, '_audit_snapshot', None) or snapshot(instance)
+        changes = {name: [value, None] for name, value in before.items() if value not in (None, '', {}, [])}
+    else:
+        changes = diff(instance)
+        if not changes:
+            return None
+
+    instance._audit_snapshot = snapshot(instance)
+    return ChangeEvent(
+        company_id=_company_id(instance), model=type(instance)._meta.model_name, object_id=instance.pk,
+        action=action, changes=changes, actor_id=_actor_id(),
+    )
+
+
+def record(instances, action, using=None):
+    """Registra a alteração dos objetos; a gravação fica para depois do commit."""
+    events = [event for event in (build_event(instance, action) for instance in instances) if event is not None]
+    if events:
+        transaction.on_commit(lambda: writer.put(events), using=using)
+
+
+# Sinal de parada na fila: a thread grava o lote que está montando e termina
+_STOP = object()
+
+
+class AuditWriter:
+    """Fila do processo + thread que grava os eventos em lote."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def put(self, events):
+        if not getattr(settings, 'AUDIT_ASYNC', True):
+            ChangeEvent.objects.bulk_create(events)
+            return
+        self._ensure_thread()
+        for event in events:
+            self.queue.put(event)
+
+    def _ensure_thread(self):
+        # Uma thread por processo (o fork do gunicorn não copia threads)
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.SimpleQueue()
+                self.thread = threading.Thread(target=self._run, args=(self.queue,), name='audit-writer', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def _run(self, events):
+        batch_size = getattr(settings, 'AUDIT_BATCH_SIZE', 500)
+        interval = getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0)
+        stop = False
+        while not stop:
+            # Espera o primeiro evento e junta o que chegar até o lote encher ou o tempo acabar
+            event = events.get()
+            if event is _STOP:
+                break
+            batch = [event]
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            close_old_connections()
+            ChangeEvent.objects.bulk_create(batch, batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500))
+        except Exception:
+            logger.exception('Falha ao gravar %s eventos de auditoria', len(batch))
+
+    def flush(self, timeout=10):
+        """
+        Saída do processo (atexit; o gunicorn recicla workers por max_requests):
+        para a thread, esperando ela gravar o lote em andamento, e grava o que
+        sobrou na fila. O próximo put() sobe uma thread nova.
+        """
+        with self.lock:
+            thread = self.thread if self.pid == os.getpid() else None
+            events = self.queue
+            self.pid = None
+        if thread is not None and thread.is_alive():
+            events.put(_STOP)
+            thread.join(timeout)
+
+        batch = []
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                batch.append(event)
+        if batch:
+            self._write(batch)
+
+
+writer = AuditWriter()
+atexit.register(writer.flush)
+
+
+class AuditMiddleware:
+    """Guarda o request num ContextVar: o evento registra quem fez a alteração."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+def describe(event):
+    """Linhas (rótulo, antes, depois) de um evento, com os nomes dos campos do model."""
+    model = next((m for m in AUDITED_MODELS if m._meta.model_name == event.model), None)
+    fields = {f.attname: f for f in model._meta.concrete_fields} if model else {}
+    rows = []
+    for name, (before, after) in event.changes.items():
+        field = fields.get(name)
+        rows.append((field.verbose_name if field else name, before, after))
+    return rows
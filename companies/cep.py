@@ -0,0 +1,167 @@
+"""
+Consulta de CEP offline: índice binário ordenado, aberto com mmap.
+
+O comando build_cep_index compila um CSV de CEPs (cep;logradouro;bairro;
+cidade;uf) no arquivo settings.CEP_INDEX_PATH:
+
+    cabeçalho   b'CEP1' + quantidade de CEPs + início da tabela de textos
+    chaves      um uint32 por CEP, em ordem (busca binária)
+    registros   4 uint32 por CEP: offsets de logradouro, bairro, cidade e UF
+    textos      uint16 (tamanho) + UTF-8, sem repetição (cidades, bairros)
+
+O arquivo é aberto com mmap somente leitura: as páginas ficam no cache do
+sistema operacional e são compartilhadas por todos os workers do gunicorn.
+A busca é O(log n) direto no mmap, sem carregar nada para a memória do
+processo e sem rede.
+"""
+import mmap
+import os
+import re
+import struct
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+MAGIC = b'CEP1'
+HEADER = struct.Struct('<4sII')   # magic, quantidade, offset dos textos
+KEY = struct.Struct('<I')
+RECORD = struct.Struct('<IIII')   # logradouro, bairro, cidade, uf
+TEXT_LENGTH = struct.Struct('<H')
+
+FIELDS = ('address', 'neighborhood', 'city', 'state')
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_cep(value):
+    return _NON_DIGITS.sub('', value or '')
+
+
+def format_cep(cep):
+    return f'{cep[:5]}-{cep[5:]}' if len(cep) == 8 else cep
+
+
+def write_index(rows, path):
+    """
+    Grava o índice a partir de (cep, logradouro, bairro, cidade, uf).
+    CEPs inválidos são ignorados; CEP repetido fica com a última linha.
+    Retorna a quantidade de CEPs gravados.
+    """
+    # 1. Ordena por CEP (numérico) e deduplica
+    entries = {}
+    for cep, *values in rows:
+        cep = normalize_cep(cep)
+        if len(cep) == 8:
+            entries[int(cep)] = [(value or '').strip() for value in values]
+    keys = sorted(entries)
+
+    # 2. Tabela de textos sem repetição
+    texts = bytearray()
+    offsets = {}
+    records = bytearray()
+    for key in keys:
+        record = []
+        for value in entries[key]:
+            if value not in offsets:
+                encoded = value.encode('utf-8')[:0xFFFF]
+                offsets[value] = len(texts)
+                texts += TEXT_LENGTH.pack(len(encoded)) + encoded
+            record.append(offsets[value])
+        records += RECORD.pack(*record)
+
+    # 3. Cabeçalho + chaves + registros + textos. Grava num arquivo temporário e
+    # troca de uma vez: workers com o arquivo antigo aberto continuam lendo o antigo
+    texts_start = HEADER.size + len(keys) * (KEY.size + RECORD.size)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys), texts_start))
+        f.write(b''.join(KEY.pack(key) for key in keys))
+        f.write(records)
+        f.write(texts)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+class _Keys:
+    """Sequência (só leitura) das chaves dentro do mmap, para o bisect."""
+
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return KEY.unpack_from(self.buffer, HEADER.size + index * KEY.size)[0]
+
+
+class CepIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.texts_start = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} não é um índice de CEP (rode manage.py build_cep_index).')
+        self.keys = _Keys(self.buffer, self.count)
+        self.records_start = HEADER.size + self.count * KEY.size
+
+    def __len__(self):
+        return self.count
+
+    def _text(self, offset):
+        start = self.texts_start + offset
+        (length,) = TEXT_LENGTH.unpack_from(self.buffer, start)
+        start += TEXT_LENGTH.size
+        return self.buffer[start:start + length].decode('utf-8')
+
+    def lookup(self, cep):
+        """Endereço do CEP (dict) ou None."""
+        cep = normalize_cep(cep)
+        if len(cep) != 8:
+            return None
+        key = int(cep)
+        position = bisect_left(self.keys, key)
+        if position == self.count or self.keys[position] != key:
+            return None
+        offsets = RECORD.unpack_from(self.buffer, self.records_start + position * RECORD.size)
+        return {'cep': format_cep(cep), **{field: self._text(offset) for field, offset in zip(FIELDS, offsets)}}
+
+    def close(self):
+        self.buffer.close()
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Índice do processo, aberto no primeiro uso (depois do fork de cada
+    worker, ou antes com preload_app: o mmap é compartilhado nos dois casos).
+    Retorna None se o arquivo ainda não foi gerado.
+    """
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                try:
+                    _index = CepIndex(settings.CEP_INDEX_PATH)
+                except FileNotFoundError:
+                    return None
+    return _index
+
+
+def reset_index():
+    # Depois de recompilar o arquivo (ou nos testes): o próximo uso reabre
+    global _index
+    with _lock:
+        if _index is not None:
+            _index.close()
+        _index = None
+
+
+def lookup_cep(cep):
+    index = get_index()
+    return index.lookup(cep) if index is not None else None
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .tenancy import shell_version
+
+
+def company_switcher(request):
+    # Empresas do seletor da sidebar: lista pronta, carregada pelo CompanyMiddleware.
+    # Nada de query lazy aqui: numa view async o render é síncrono e a query falharia
+    return {'user_companies': getattr(request, 'user_companies', [])}
+
+
+def shell_cache(request):
+    # Chave dos fragmentos do shell ({% cache %} em includes/sidebar.html). A versão só é lida se o template usar
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'shell_cache_timeout': 0}
+    return {
+        'shell_cache_timeout': getattr(settings, 'SHELL_CACHE_TIMEOUT', 600),
+        'shell_version': SimpleLazyObject(lambda: shell_version(user.pk)),
+    }
@@ -1,24 +1,52 @@
+from asgiref.sync import iscoroutinefunction
 from django.core.exceptions import PermissionDenied
 from functools import wraps
 from .models import Membership
+from .permissions import to_mask
+
+# Um bit por cargo: role_required vira um AND de inteiros
+ROLE_BITS = {role: 1 << i for i, (role, _) in enumerate(Membership.ROLE_CHOICES)}
+
+def _check(request, test):
+    # O middleware já garante que request.membership existe se tiver empresa
+    membership = getattr(request, 'membership', None)
+    if not membership:
+        raise PermissionDenied
+
+    if not test(membership):
+        # Opcional: Redirecionar para uma página de "Sem Permissão" amigável
+        # ou apenas lançar o erro 403 padrão do Django
+        raise PermissionDenied("Você não tem permissão para acessar esta área.")
+
+def _guard(test):
+    # Aplica o teste antes da view, síncrona ou assíncrona (async def)
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                _check(request, test)
+                return await view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                _check(request, test)
+                return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
 
 def role_required(allowed_roles):
     """
     Decorador para restringir acesso baseado no Cargo (Role) na empresa atual.
     Uso: @role_required(['admin', 'financial'])
+    Prefira capability_required: respeita os ajustes de permissão da empresa.
     """
-    def decorator(view_func):
-        @wraps(view_func)
-        def _wrapped_view(request, *args, **kwargs):
-            # O middleware já garante que request.membership existe se tiver empresa
-            if not request.membership:
-                 raise PermissionDenied
-            
-            if request.membership.role not in allowed_roles:
-                # Opcional: Redirecionar para uma página de "Sem Permissão" amigável
-                # ou apenas lançar o erro 403 padrão do Django
-                raise PermissionDenied("Você não tem permissão para acessar esta área.")
-                
-            return view_func(request, *args, **kwargs)
-        return _wrapped_view
-    return decorator
\ No newline at end of file
+    allowed = sum(ROLE_BITS[role] for role in set(allowed_roles))
+    return _guard(lambda membership: ROLE_BITS.get(membership.role, 0) & allowed)
+
+def capability_required(*capabilities):
+    """
+    Decorador que exige todas as capacidades (ver companies/permissions.py).
+    Uso: @capability_required('edit_company') ou @capability_required(Capability.EXPORT_DATA)
+    """
+    mask = to_mask(*capabilities)  # Compilado uma vez, na definição da view
+    return _guard(lambda membership: membership.capabilities & mask == mask)
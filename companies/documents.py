@@ -0,0 +1,73 @@
+"""
+Normalização e validação de documentos brasileiros (CPF e CNPJ).
+
+O CNPJ é normalizado para letras maiúsculas e números: desde 2026 a Receita
+emite CNPJ alfanumérico (12 caracteres + 2 dígitos verificadores). Para o
+CNPJ só numérico o resultado é o mesmo que "somente dígitos".
+"""
+import re
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+CNPJ_WEIGHTS = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+
+def normalize_cpf(value):
+    return _NON_DIGITS.sub('', value or '')
+
+
+def normalize_cnpj(value):
+    return _NON_ALPHANUMERIC.sub('', (value or '').upper())
+
+
+def is_valid_cpf(cpf):
+    """Recebe o CPF normalizado (11 dígitos) e confere os dígitos verificadores."""
+    if len(cpf) != 11 or not cpf.isdigit() or cpf == cpf[0] * 11:
+        return False
+
+    numbers = [int(d) for d in cpf]
+    for position in (9, 10):
+        total = sum(n * (position + 1 - i) for i, n in enumerate(numbers[:position]))
+        if (total * 10) % 11 % 10 != numbers[position]:
+            return False
+    return True
+
+
+def is_valid_cnpj(cnpj):
+    """Recebe o CNPJ normalizado (14 caracteres) e confere os dígitos verificadores."""
+    if len(cnpj) != 14 or not cnpj[12:].isdigit() or cnpj == cnpj[0] * 14:
+        return False
+
+    # Cada caractere vale (código ASCII - 48): '0'..'9' -> 0..9, 'A' -> 17 ...
+    values = [ord(c) - 48 for c in cnpj]
+    for position in (12, 13):
+        weights = CNPJ_WEIGHTS[13 - position:]
+        remainder = sum(v * w for v, w in zip(values[:position], weights)) % 11
+        if (0 if remainder < 2 else 11 - remainder) != values[position]:
+            return False
+    return True
+
+
+def format_cpf(cpf):
+    return f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}'
+
+
+def format_cnpj(cnpj):
+    return f'{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}'
+
+
+def companies_for_document(document):
+    """
+    Empresas ligadas a um documento: pelo CNPJ da própria empresa ou
+    pelo CPF de um sócio. As duas buscas usam só índices B-tree
+    (cnpj_normalized e (cpf_normalized, company_id), este último index-only).
+    """
+    from .models import Company, Partner
+
+    key = normalize_cnpj(document)
+    if len(key) == 11:
+        partner_companies = Partner.objects.filter(cpf_normalized=key).values('company_id')
+        return Company.objects.filter(pk__in=partner_companies)
+
+    return Company.objects.filter(cnpj_normalized=key)
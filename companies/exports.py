@@ -0,0 +1,217 @@
+"""
+Exportação em streaming (CSV/XLSX) de Company, Partner e Membership.
+
+As linhas saem do banco com QuerySet.iterator(chunk_size=...) e vão direto
+para o StreamingHttpResponse: a memória fica estável e o primeiro byte sai
+imediatamente, independente do número de linhas.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Company, Membership, Partner
+from .scoping import require_current_company_id
+
+CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def _companies(companies):
+    # None: só a empresa ativa (telas do tenant); lista: as escolhidas (admin)
+    if companies is None:
+        return Company.objects.filter(pk=require_current_company_id('Exportação'))
+    return Company.objects.filter(pk__in=companies)
+
+
+def _tenant(model, companies):
+    if companies is None:
+        return model.scoped.all()
+    return model.objects.filter(company__in=companies)
+
+
+# Cada dataset: (colunas, função que monta o queryset a partir das empresas)
+# Colunas: (cabeçalho, função que extrai o valor do objeto)
+DATASETS = {
+    'companies': (
+        [
+            ('CNPJ', lambda c: c.cnpj),
+            ('Razão Social', lambda c: c.legal_name),
+            ('Nome Fantasia', lambda c: c.trade_name),
+            ('Inscrição Estadual', lambda c: c.state_registration),
+            ('Email', lambda c: c.email),
+            ('Telefone', lambda c: c.phone),
+            ('CEP', lambda c: c.zip_code),
+            ('Cidade', lambda c: c.city),
+            ('Estado', lambda c: c.state),
+            ('Atualizado em', lambda c: c.updated_at),
+        ],
+        lambda companies: _companies(companies).order_by('pk'),
+    ),
+    'partners': (
+        [
+            ('Empresa', lambda p: str(p.company)),
+            ('Nome', lambda p: p.name),
+            ('CPF', lambda p: p.cpf),
+            ('Email', lambda p: p.email),
+            ('Telefone', lambda p: p.phone),
+        ],
+        lambda companies: _tenant(Partner, companies).select_related('company').order_by('pk'),
+    ),
+    'memberships': (
+        [
+            ('Empresa', lambda m: str(m.company)),
+            ('Email', lambda m: m.user.email),
+            ('Nome', lambda m: m.user.name),
+            ('Cargo', lambda m: m.get_role_display()),
+            ('Ativo', lambda m: 'Sim' if m.is_active else 'Não'),
+            ('Desde', lambda m: m.date_joined),
+        ],
+        lambda companies: _tenant(Membership, companies).select_related('user', 'company').order_by('pk'),
+    ),
+}
+
+
+def _format(value):
+    if hasattr(value, 'tzinfo'):
+        value = timezone.localtime(value).strftime('%d/%m/%Y %H:%M')
+    return '' if value is None else str(value)
+
+
+def iter_rows(dataset, companies):
+    """Gera o cabeçalho e depois uma lista de strings por objeto."""
+    columns, build_queryset = DATASETS[dataset]
+    # Monta o queryset já: o streaming roda depois do middleware soltar a empresa ativa
+    queryset = build_queryset(companies)
+
+    def rows():
+        yield [header for header, _ in columns]
+        for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield [_format(getter(obj)) for _, getter in columns]
+
+    return rows()
+
+
+# Início de célula que o Excel/LibreOffice interpretam como fórmula (CSV injection)
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_safe(value):
+    # Texto digitado pelo usuário (nome, razão social) não pode virar fórmula ao abrir o CSV
+    return "'" + value if value.startswith(_FORMULA_PREFIXES) else value
+
+
+class Echo:
+    """Buffer "falso": o csv.writer escreve e a gente devolve a linha pronta."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff'  # BOM: o Excel abre os acentos corretamente
+    for row in rows:
+        yield writer.writerow([_csv_safe(value) for value in row])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino sem seek para o zipfile: acumula bytes até o gerador repassar."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# Caracteres de controle não são permitidos em XML
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_STATIC_FILES = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def stream_xlsx(rows, flush_every=500):
+    """
+    Gera um .xlsx mínimo (uma planilha, strings inline) em streaming.
+    Toda célula é string (t="inlineStr"): "=..." aparece como texto, nunca como fórmula.
+    O zipfile escreve num destino sem seek, então cada bloco de linhas já
+    comprimido pode ser enviado ao cliente sem montar o arquivo em memória.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_STATIC_FILES.items():
+            workbook.writestr(name, content)
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for count, row in enumerate(rows, start=1):
+                cells = ''.join(
+                    f'<c t="inlineStr"><is><t>{escape(_ILLEGAL_XML.sub("", value))}</t></is></c>' for value in row
+                )
+                sheet.write(f'<row>{cells}</row>'.encode())
+                if count % flush_every == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def export_response(dataset, companies=None, file_format='csv', filename=None):
+    """
+    StreamingHttpResponse com os dados do dataset para as empresas informadas
+    (queryset ou lista de ids) ou, sem elas, para a empresa ativa (scoped).
+    """
+    filename = filename or dataset
+    rows = iter_rows(dataset, companies)
+    if file_format == 'xlsx':
+        response = StreamingHttpResponse(stream_xlsx(rows), content_type=XLSX_CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
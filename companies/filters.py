@@ -0,0 +1,56 @@
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import ValidationError
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filtro lateral de FK com busca (o mesmo select2 do autocomplete_fields)
+    em vez de listar todos os objetos relacionados. Só carrega o objeto
+    selecionado; as opções vêm do endpoint de autocomplete do admin.
+
+    O ModelAdmin precisa incluir o media do select2 (ver MembershipAdmin.media).
+    """
+    template = 'admin/filters/autocomplete.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.title = self.field.verbose_name
+        self.parameter_name = f'{self.field_name}__pk__exact'
+        self.model_meta = model._meta
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        # As opções vêm por AJAX
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{f'{self.field_name}__pk': self.value()})
+        except ValidationError as e:
+            # Valor inválido na URL: o admin volta para a lista com ?e=1
+            raise IncorrectLookupParameters(e)
+
+    def choices(self, changelist):
+        selected = None
+        if self.value():
+            selected = self.field.related_model._default_manager.filter(pk=self.value()).first()
+        yield {
+            'selected': selected,
+            'value': self.value(),
+            'parameter_name': self.parameter_name,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'app_label': self.model_meta.app_label,
+            'model_name': self.model_meta.model_name,
+            'field_name': self.field_name,
+        }
+
+
+class CompanyFilter(AutocompleteFilter):
+    field_name = 'company'
@@ -1,6 +1,10 @@
 from django import forms
-from django.forms import inlineformset_factory # <--- Importe isso
-from .models import Company, Partner
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, inlineformset_factory # <--- Importe isso
+from . import audit, stats
+from .models import ChangeEvent, Company, Membership, Partner
+from .documents import format_cnpj, format_cpf, is_valid_cnpj, is_valid_cpf, normalize_cnpj, normalize_cpf
+from .invitations import MAX_INVITATIONS, parse_invitations
 
 class CompanyCreateForm(forms.ModelForm):
     class Meta:
@@ -12,17 +16,206 @@ class CompanyCreateForm(forms.ModelForm):
             # Note que removemos 'partners' daqui, pois agora é uma tabela separada
         ]
 
+    def clean_cnpj(self):
+        # Valida os dígitos verificadores e grava sempre no mesmo formato (com máscara)
+        cnpj = normalize_cnpj(self.cleaned_data['cnpj'])
+        if not is_valid_cnpj(cnpj):
+            raise forms.ValidationError('CNPJ inválido.')
+        return format_cnpj(cnpj)
+
+    def validate_unique(self):
+        super().validate_unique()
+        # Duplicado mesmo que digitado com outra pontuação (índice em cnpj_normalized)
+        cnpj = normalize_cnpj(self.cleaned_data.get('cnpj'))
+        if cnpj and Company.objects.filter(cnpj_normalized=cnpj).exclude(pk=self.instance.pk).exists():
+            self.add_error('cnpj', 'Já existe uma empresa cadastrada com este CNPJ.')
+
+class CompanyAdminForm(CompanyCreateForm):
+    # Admin: mesma limpeza do CNPJ (dígitos verificadores, máscara, duplicado com outra pontuação)
+    class Meta(CompanyCreateForm.Meta):
+        fields = CompanyCreateForm.Meta.fields + ['role_capabilities']
+
 # Formulário individual do Sócio
 class PartnerForm(forms.ModelForm):
     class Meta:
         model = Partner
         fields = ['name', 'cpf', 'email', 'phone']
 
+    def clean_cpf(self):
+        cpf = normalize_cpf(self.cleaned_data['cpf'])
+        if not is_valid_cpf(cpf):
+            raise forms.ValidationError('CPF inválido.')
+        return format_cpf(cpf)
+
+class LoadedObjectChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField que procura o valor em objetos já carregados (sem query)."""
+
+    def __init__(self, objects, *args, **kwargs):
+        self.objects = objects
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            obj = self.objects.get(self.queryset.model._meta.pk.to_python(value))
+        except ValidationError:
+            obj = None
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
+class PartnerInlineFormSet(BaseInlineFormSet):
+    """
+    Sócios da empresa, paginados e salvos em lote.
+
+    GET: carrega só uma página (per_page) de sócios.
+    POST: carrega só os sócios enviados (pelos ids do formulário) e o save()
+    grava a diferença com uma query por tipo de operação (bulk_create,
+    bulk_update e um DELETE), pulando as linhas que não mudaram.
+    """
+    per_page = 50
+
+    def __init__(self, *args, page=1, **kwargs):
+        try:
+            self.page = max(int(page), 1)
+        except (TypeError, ValueError):
+            self.page = 1
+        self.has_next = False
+        super().__init__(*args, **kwargs)
+
+    def get_queryset(self):
+        if not hasattr(self, '_partners'):
+            queryset = super().get_queryset().order_by('name', 'pk')
+            if self.is_bound:
+                # 1. POST: só os sócios que vieram no formulário (a página editada)
+                self._partners = list(queryset.filter(pk__in=self._submitted_ids()))
+            else:
+                # 2. GET: uma página (um a mais para saber se existe a próxima)
+                start = (self.page - 1) * self.per_page
+                self._partners = list(queryset[start:start + self.per_page + 1])
+                self.has_next = len(self._partners) > self.per_page
+                del self._partners[self.per_page:]
+        return self._partners
+
+    def _submitted_ids(self):
+        pk_field = self.model._meta.pk
+        ids = []
+        for i in range(self.initial_form_count()):
+            try:
+                pk = pk_field.to_python(self.data.get(f'{self.add_prefix(i)}-{pk_field.name}'))
+            except ValidationError:
+                # id adulterado: o campo do form acusa o erro na validação
+                continue
+            if pk is not None:
+                ids.append(pk)
+        return ids
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # O "id" oculto de cada sócio faria um SELECT por linha ao validar (N+1):
+        # validamos contra os sócios que o formset já carregou numa query só
+        name = self._pk_field.name
+        if self.is_bound and name in form.fields:
+            if not hasattr(self, '_loaded_objects'):
+                self._loaded_objects = {obj.pk: obj for obj in self.get_queryset()}
+            field = form.fields[name]
+            form.fields[name] = LoadedObjectChoiceField(
+                self._loaded_objects, field.queryset, initial=field.initial, required=False, widget=field.widget,
+            )
+
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit=False)
+
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        changed_fields = set()
+
+        # 1. Separa o que mudou (linhas sem alteração são ignoradas)
+        for form in self.initial_forms:
+            obj = form.instance
+            if obj.pk is None:
+                continue
+            if form in self.deleted_forms:
+                self.deleted_objects.append(obj)
+            elif form.has_changed():
+                obj.refresh_derived_fields()
+                self.changed_objects.append((obj, form.changed_data))
+                changed_fields.update(form.changed_data)
+
+        for form in self.extra_forms:
+            if form.has_changed() and not (self.can_delete and self._should_delete_form(form)):
+                obj = form.instance
+                setattr(obj, self.fk.name, self.instance)
+                obj.refresh_derived_fields()
+                self.new_objects.append(obj)
+
+        # 2. Uma query por operação (bulk_* não chama save(): os campos derivados foram calculados acima)
+        # O DELETE dispara os signals (histórico, contadores); bulk_update/bulk_create registram aqui
+        # Contadores do dashboard: um UPDATE só no fim, com o saldo de exclusões e inclusões
+        with stats.batched():
+            if self.deleted_objects:
+                self.model.objects.filter(pk__in=[obj.pk for obj in self.deleted_objects], **{self.fk.name: self.instance}).delete()
+            if self.changed_objects:
+                for derived, sources in self.model.DERIVED_FIELDS.items():
+                    if changed_fields.intersection(sources):
+                        changed_fields.add(derived)
+                self.model.objects.bulk_update([obj for obj, _ in self.changed_objects], sorted(changed_fields))
+                audit.record([obj for obj, _ in self.changed_objects], ChangeEvent.ACTION_UPDATE)
+            if self.new_objects:
+                self.model.objects.bulk_create(self.new_objects)
+                audit.record(self.new_objects, ChangeEvent.ACTION_CREATE)
+                stats.adjust(self.instance.pk, partner_count=len(self.new_objects))
+
+        return [obj for obj, _ in self.changed_objects] + self.new_objects
+
 # A "Fábrica" de lista de sócios
 PartnerFormSet = inlineformset_factory(
     Company, 
     Partner,
     form=PartnerForm,
+    formset=PartnerInlineFormSet,
     extra=0,          # Começa sem linhas vazias (adicionamos via botão)
     can_delete=True   # Permite deletar
-)
\ No newline at end of file
+)
+
+# Convite em massa: lista colada e/ou arquivo (ver companies/invitations.py)
+class InviteMembersForm(forms.Form):
+    MAX_FILE_SIZE = 1024 * 1024
+
+    emails = forms.CharField(label='E-mails', required=False, widget=forms.Textarea(attrs={
+        'rows': 10, 'placeholder': 'ana@exemplo.com\nbruno@exemplo.com,financial',
+    }))
+    file = forms.FileField(label='Arquivo (.csv ou .txt)', required=False)
+    role = forms.ChoiceField(label='Cargo padrão', choices=Membership.ROLE_CHOICES, initial=Membership.ROLE_BROKER)
+
+    def __init__(self, *args, allowed_roles=None, **kwargs):
+        # allowed_roles: cargos que quem convida pode dar (permissions.grantable_roles)
+        super().__init__(*args, **kwargs)
+        self.allowed_roles = allowed_roles
+        if allowed_roles is not None:
+            self.fields['role'].choices = [(role, label) for role, label in Membership.ROLE_CHOICES if role in allowed_roles]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('emails') or ''
+        upload = cleaned_data.get('file')
+        if upload:
+            if upload.size > self.MAX_FILE_SIZE:
+                raise forms.ValidationError('Arquivo muito grande (máximo 1 MB).')
+            try:
+                text += '\n' + upload.read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise forms.ValidationError('O arquivo precisa estar em UTF-8.')
+
+        # Linhas inválidas não barram o resto: ficam em line_errors para o aviso
+        invitations, self.line_errors = parse_invitations(
+            text, cleaned_data.get('role') or Membership.ROLE_BROKER, self.allowed_roles,
+        )
+        if not invitations:
+            raise forms.ValidationError('Nenhum e-mail válido informado.')
+        if len(invitations) > MAX_INVITATIONS:
+            raise forms.ValidationError(f'No máximo {MAX_INVITATIONS} convites por vez.')
+        cleaned_data['invitations'] = invitations
+        return cleaned_data
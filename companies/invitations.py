@@ -0,0 +1,219 @@
+"""
+Convite de membros em massa (centenas de e-mails de uma vez).
+
+Número fixo de queries, qualquer que seja o tamanho da lista:
+
+1. Usuários que já existem: um SELECT (e-mail sem diferenciar maiúsculas)
+2. Usuários novos: um INSERT em lote (ignore_conflicts) + um SELECT para
+   pegar os ids, e os EmailAddress do allauth num INSERT em lote
+3. Vínculos que já existiam: um SELECT; os novos num INSERT em lote
+   (ignore_conflicts) + um SELECT dos que entraram de fato, que são os
+   que movem contadores, histórico e e-mails
+4. Contadores do dashboard: um UPDATE
+5. E-mails de convite: um INSERT na fila (OutboxEmail); o envio fica
+   para o send_outbox, fora do request
+
+Usuário novo entra sem senha (unusable) e recebe o link de definição de
+senha do allauth; quem já tem conta recebe só o aviso. Vínculo inativo volta
+a valer com o cargo do convite. Ninguém convida para um cargo acima do seu
+(permissions.grantable_roles).
+"""
+import re
+from collections import Counter
+from typing import NamedTuple
+
+from allauth.account.forms import EmailAwarePasswordResetTokenGenerator
+from allauth.account.models import EmailAddress
+from allauth.account.utils import user_pk_to_url_str
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.core.validators import validate_email
+from django.db.models.functions import Lower
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import audit, stats
+from .models import ChangeEvent, CompanyStats, Membership
+from .permissions import grantable_roles
+from .tenancy import invalidate_tenants
+
+MAX_INVITATIONS = 1000  # Linhas por envio
+
+_SEPARATORS = re.compile(r'[,;\t]')
+
+# Cargo pela chave ('broker') ou pelo rótulo ('Corretor')
+ROLE_NAMES = {
+    **{role: role for role, _ in Membership.ROLE_CHOICES},
+    **{label.lower(): role for role, label in Membership.ROLE_CHOICES},
+}
+ROLE_LABELS = dict(Membership.ROLE_CHOICES)
+
+
+class NewAccountTokenGenerator(EmailAwarePasswordResetTokenGenerator):
+    """
+    Mesmo token do allauth para uma conta recém-criada, cujo único e-mail é
+    user.email: sem as duas queries por usuário (EmailAddress) do original.
+    """
+
+    def _make_hash_value(self, user, timestamp):
+        return PasswordResetTokenGenerator._make_hash_value(self, user, timestamp) + user.email
+
+
+token_generator = NewAccountTokenGenerator()
+
+
+class Invitation(NamedTuple):
+    email: str
+    role: str
+
+
+def parse_invitations(text, default_role=Membership.ROLE_BROKER, allowed_roles=None):
+    """
+    Uma linha por pessoa: "email" ou "email,cargo" (também ; ou tab).
+    Retorna (convites, erros [(número da linha, mensagem)]). E-mail repetido vale a primeira linha.
+    allowed_roles: cargos que quem convida pode dar (None: todos).
+    """
+    invitations, errors, seen = [], [], set()
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        parts = [part.strip() for part in _SEPARATORS.split(line)]
+        if not parts[0]:
+            continue
+        # Minúsculo: chave do convite (a busca no banco ignora maiúsculas, ver _users_by_email)
+        email = parts[0].lower()
+        role_name = parts[1].lower() if len(parts) > 1 and parts[1] else default_role
+        try:
+            validate_email(email)
+        except ValidationError:
+            if line_number == 1 and email in ('email', 'e-mail'):
+                continue  # Cabeçalho do CSV
+            errors.append((line_number, f'E-mail inválido: {parts[0]}'))
+            continue
+        if role_name not in ROLE_NAMES:
+            errors.append((line_number, f'Cargo inválido: {parts[1]}'))
+            continue
+        if allowed_roles is not None and ROLE_NAMES[role_name] not in allowed_roles:
+            errors.append((line_number, f'Cargo acima do seu: {ROLE_LABELS[ROLE_NAMES[role_name]]}'))
+            continue
+        if email in seen:
+            continue
+        seen.add(email)
+        invitations.append(Invitation(email, ROLE_NAMES[role_name]))
+    return invitations, errors
+
+
+class InviteResult(NamedTuple):
+    created_users: int   # Contas novas
+    added: int           # Vínculos novos (contas novas + existentes)
+    already_members: int
+
+
+def _users_by_email(User, emails):
+    """
+    Usuários por e-mail em minúsculo. O cadastro só normaliza o domínio
+    (Ana.Silva@example.com fica assim), então compara sem maiúsculas;
+    com duas contas para o mesmo e-mail vale a mais antiga.
+    """
+    users = {}
+    queryset = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).order_by('pk')
+    for user in queryset:
+        users.setdefault(user.email_lower, user)
+    return users
+
+
+def invite_members(request, invitations):
+    """Convida para a empresa atual (request.company). Rodar dentro de transaction.atomic()."""
+    User = get_user_model()
+    company = request.company
+    roles = {invitation.email: invitation.role for invitation in invitations}
+    # O formulário já barra; aqui é a última linha de defesa
+    if set(roles.values()) - set(grantable_roles(request.membership.role)):
+        raise PermissionDenied('Você não pode convidar para um cargo acima do seu.')
+
+    # 1. Quem já tem conta (chave: e-mail em minúsculo, como em roles)
+    users = _users_by_email(User, roles)
+
+    # 2. Contas novas, sem senha (o convite leva o link para definir)
+    new_users = []
+    for email in roles.keys() - users.keys():
+        user = User(email=email, name=email.split('@')[0])
+        user.set_unusable_password()
+        user.refresh_derived_fields()
+        new_users.append(user)
+    created_ids = set()
+    if new_users:
+        # ignore_conflicts não devolve os ids: busca de novo (inclui quem foi criado em paralelo)
+        User.objects.bulk_create(new_users, ignore_conflicts=True)
+        created = _users_by_email(User, [user.email for user in new_users])
+        EmailAddress.objects.bulk_create(
+            [EmailAddress(user=user, email=user.email, primary=True, verified=False) for user in created.values()],
+            ignore_conflicts=True,
+        )
+        # Conta criada em paralelo (outro convite, cadastro) não é nossa: recebe só o aviso.
+        # A senha inutilizável é aleatória por objeto, então só bate com a linha que inserimos
+        built = {user.email: user.password for user in new_users}
+        created_ids = {user.pk for email, user in created.items() if built.get(email) == user.password}
+        users.update(created)
+
+    # 3. Vínculos: só os que ainda não existem; os inativos voltam com o cargo do convite.
+    # select_for_update: desativação/convite em paralelo espera este terminar
+    existing = {
+        membership.user_id: membership
+        for membership in Membership.scoped.select_for_update().filter(user_id__in=[user.pk for user in users.values()])
+    }
+    reactivated = []
+    for email, user in users.items():
+        membership = existing.get(user.pk)
+        if membership is not None and not membership.is_active:
+            membership.is_active, membership.role, membership.user = True, roles[email], user
+            reactivated.append(membership)
+    Membership.objects.bulk_update(reactivated, ['is_active', 'role'])
+    audit.record(reactivated, ChangeEvent.ACTION_UPDATE)
+
+    memberships = [
+        Membership(user=user, company=company, role=roles[email])
+        for email, user in users.items() if user.pk not in existing
+    ]
+    Membership.objects.bulk_create(memberships, ignore_conflicts=True)
+    # Convite em paralelo pode ter criado o mesmo vínculo (user/company únicos) e o
+    # ignore_conflicts descarta o nosso em silêncio: o id (uuid) só existe no banco
+    # para os que entraram de fato
+    memberships = list(
+        Membership.scoped.filter(pk__in=[membership.pk for membership in memberships]).select_related('user')
+    )
+    audit.record(memberships, ChangeEvent.ACTION_CREATE)
+    memberships += reactivated
+
+    # bulk_create não dispara signals: cache do tenant, contadores e histórico aqui
+    invalidate_tenants([membership.user_id for membership in memberships], company.pk)
+    stats.adjust(company.pk, **Counter(CompanyStats.ROLE_FIELDS[membership.role] for membership in memberships))
+
+    # 4. E-mails na fila (um INSERT pelo OutboxEmailBackend)
+    emails = [_invitation_message(request, membership, membership.user_id in created_ids) for membership in memberships]
+    if emails:
+        get_connection().send_messages(emails)
+
+    return InviteResult(len(created_ids), len(memberships), len(existing) - len(reactivated))
+
+
+def _invitation_message(request, membership, new_account):
+    user = membership.user
+    context = {
+        'company': request.company,
+        'invited_by': request.user,
+        'role': membership.get_role_display(),
+        'new_account': new_account,
+    }
+    if new_account:
+        # Link do allauth para definir a senha (vale por PASSWORD_RESET_TIMEOUT)
+        context['url'] = request.build_absolute_uri(reverse(
+            'account_reset_password_from_key',
+            kwargs={'uidb36': user_pk_to_url_str(user), 'key': token_generator.make_token(user)},
+        ))
+    else:
+        context['url'] = request.build_absolute_uri(reverse('account_login'))
+
+    subject = render_to_string('companies/email/invitation_subject.txt', context).strip()
+    body = render_to_string('companies/email/invitation_message.txt', context)
+    return EmailMessage(subject, body, to=[user.email])
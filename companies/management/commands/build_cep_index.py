@@ -0,0 +1,63 @@
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from companies.cep import CepIndex, write_index
+
+# Nomes aceitos para cada coluna do CSV (bases públicas usam nomes diferentes)
+COLUMNS = {
+    'cep': ('cep',),
+    'address': ('logradouro', 'endereco', 'address'),
+    'neighborhood': ('bairro', 'neighborhood'),
+    'city': ('cidade', 'localidade', 'municipio', 'city'),
+    'state': ('uf', 'estado', 'state'),
+}
+
+
+def iter_ceps(path, delimiter):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        header = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {}
+        for field, aliases in COLUMNS.items():
+            match = next((header[alias] for alias in aliases if alias in header), None)
+            if match is None:
+                raise CommandError(f'Coluna "{aliases[0]}" não encontrada no CSV (colunas: {", ".join(header)}).')
+            columns[field] = match
+        for row in reader:
+            yield tuple(row[columns[field]] for field in COLUMNS)
+
+
+class Command(BaseCommand):
+    help = 'Compila um CSV de CEPs (cep, logradouro, bairro, cidade, uf) no índice binário usado no autopreenchimento.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--output', default=None, help='Padrão: settings.CEP_INDEX_PATH')
+        parser.add_argument('--delimiter', default=';')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.CEP_INDEX_PATH
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+        start = time.perf_counter()
+        total = write_index(iter_ceps(options['csv_path'], options['delimiter']), output)
+        elapsed = time.perf_counter() - start
+
+        size_mb = os.path.getsize(output) / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(f'{total} CEPs em {output} ({size_mb:.1f} MB, {elapsed:.1f} s).'))
+
+        # Tempo de consulta no índice recém-gravado
+        if total:
+            index = CepIndex(output)
+            sample = index.keys[total // 2]
+            runs = 10000
+            start = time.perf_counter()
+            for _ in range(runs):
+                index.lookup(f'{sample:08d}')
+            self.stdout.write(f'Consulta: {(time.perf_counter() - start) / runs * 1e6:.1f} µs')
+            index.close()
+        self.stdout.write('Reinicie os workers para carregarem o índice novo.')
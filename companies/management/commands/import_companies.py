@@ -0,0 +1,300 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models.functions import Lower
+
+from companies.documents import normalize_cnpj
+from companies.forms import CompanyCreateForm, PartnerForm
+from companies.models import Company, Membership, Partner
+from companies.stats import reconcile
+from companies.tenancy import invalidate_tenants
+
+
+class BatchCompanyForm(CompanyCreateForm):
+    # A unicidade do CNPJ é checada em lote (uma query por lote, não por linha)
+    def validate_unique(self):
+        pass
+
+
+def iter_rows(path, file_format):
+    """Lê o arquivo linha a linha (memória constante). Gera (número da linha, dict)."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if file_format == 'jsonl':
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa empresas, sócios ou vínculos em massa a partir de CSV/JSONL, '
+        'em lotes, com checkpoint para retomar de onde parou.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo CSV ou JSONL')
+        parser.add_argument(
+            '--kind', choices=['companies', 'partners', 'memberships'], default='companies',
+            help='companies: colunas do CompanyCreateForm | partners: cnpj + colunas do PartnerForm | '
+                 'memberships: cnpj, email, role',
+        )
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Padrão: pela extensão do arquivo')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--errors', help='Arquivo de erros por linha (padrão: <arquivo>.errors.jsonl)')
+        parser.add_argument('--checkpoint', help='Arquivo de checkpoint (padrão: <arquivo>.checkpoint.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignora o checkpoint e começa do zero')
+        parser.add_argument('--no-copy', action='store_true', help='Não usar COPY no PostgreSQL (usa bulk_create)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Arquivo não encontrado: {path}')
+
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint.json'
+        errors_path = options['errors'] or f'{path}.errors.jsonl'
+        batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        import_batch = getattr(self, f"import_{options['kind']}")
+
+        # 1. Retoma do checkpoint (linhas já processadas são só puladas, sem validar)
+        state = {'kind': options['kind'], 'rows_done': 0, 'created': 0, 'errors': 0, 'errors_offset': 0}
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('kind') != options['kind']:
+                raise CommandError(f"O checkpoint {checkpoint_path} é de outro tipo ({saved.get('kind')}).")
+            state.update(saved)
+            if 'errors_offset' not in saved:
+                # Checkpoint de versão anterior: mantém o arquivo de erros como está
+                state['errors_offset'] = os.path.getsize(errors_path) if os.path.exists(errors_path) else 0
+            self.stdout.write(f"Retomando a partir da linha de dados {state['rows_done'] + 1}.")
+
+        rows = islice(iter_rows(path, file_format), state['rows_done'], None)
+        started = time.perf_counter()
+        processed = 0
+
+        # Binário: o checkpoint guarda o tamanho exato do arquivo de erros
+        with open(errors_path, 'r+b' if state['rows_done'] and os.path.exists(errors_path) else 'wb') as errors_file:
+            # Erros de um lote que não chegou ao checkpoint (interrompido) são descartados:
+            # o lote roda de novo e escreveria as mesmas linhas outra vez
+            errors_file.seek(state['errors_offset'])
+            errors_file.truncate()
+
+            # 2. Lotes: valida, deduplica e insere; o checkpoint só avança depois do commit
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                self.batch_errors = []
+                with transaction.atomic():
+                    created, errors = import_batch(batch)
+
+                # Erros do lote só depois do commit, junto com o checkpoint
+                errors_file.write(b''.join(self.batch_errors))
+                errors_file.flush()
+                state['rows_done'] += len(batch)
+                state['created'] += created
+                state['errors'] += errors
+                state['errors_offset'] = errors_file.tell()
+                self._save_checkpoint(checkpoint_path, state)
+
+                processed += len(batch)
+                rate = processed / (time.perf_counter() - started)
+                self.stdout.write(
+                    f"{state['rows_done']} linhas | {rate:.0f} linhas/s | "
+                    f"{state['created']} criados | {state['errors']} erros"
+                )
+
+        # 3. Terminou: o checkpoint não é mais necessário
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Importação concluída: {state['created']} criados, {state['errors']} erros (detalhes em {errors_path})."
+        ))
+
+    # --- Lotes por tipo -------------------------------------------------
+
+    def import_companies(self, batch):
+        errors = 0
+        valid = []
+        for line_number, row in batch:
+            form = BatchCompanyForm(row)
+            if form.is_valid():
+                valid.append((line_number, row, form.save(commit=False)))
+            else:
+                errors += self._log_error(line_number, row, form.errors)
+
+        # Deduplica pelo CNPJ normalizado: contra o banco (uma query) e dentro do próprio arquivo
+        for _, _, company in valid:
+            company.refresh_derived_fields()
+        cnpjs = [company.cnpj_normalized for _, _, company in valid]
+        seen = set(Company.objects.filter(cnpj_normalized__in=cnpjs).values_list('cnpj_normalized', flat=True))
+        companies = []
+        for line_number, row, company in valid:
+            if company.cnpj_normalized in seen:
+                errors += self._log_error(line_number, row, {'cnpj': ['CNPJ já cadastrado.']})
+                continue
+            seen.add(company.cnpj_normalized)
+            companies.append(company)
+
+        self._insert(Company, companies)
+        # COPY/bulk_create não disparam signals: contadores do dashboard das empresas novas
+        reconcile([company.pk for company in companies])
+        return len(companies), errors
+
+    def _company_ids(self, batch):
+        # {CNPJ normalizado: id} das empresas citadas no lote (aceita CNPJ com ou sem máscara)
+        cnpjs = [normalize_cnpj(row.get('cnpj')) for _, row in batch]
+        return dict(Company.objects.filter(cnpj_normalized__in=cnpjs).values_list('cnpj_normalized', 'id'))
+
+    def import_partners(self, batch):
+        errors = 0
+        company_ids = self._company_ids(batch)
+
+        valid = []
+        for line_number, row in batch:
+            company_id = company_ids.get(normalize_cnpj(row.get('cnpj')))
+            if company_id is None:
+                errors += self._log_error(line_number, row, {'cnpj': ['Empresa não encontrada.']})
+                continue
+            form = PartnerForm(row)
+            if not form.is_valid():
+                errors += self._log_error(line_number, row, form.errors)
+                continue
+            partner = form.save(commit=False)
+            partner.company_id = company_id
+            partner.refresh_derived_fields()
+            valid.append((line_number, row, partner))
+
+        # Deduplica por (empresa, CPF): permite reprocessar um lote sem duplicar sócios
+        existing = set(
+            Partner.objects.filter(
+                cpf_normalized__in=[p.cpf_normalized for _, _, p in valid], company_id__in=company_ids.values()
+            ).values_list('company_id', 'cpf_normalized')
+        )
+        partners = []
+        for line_number, row, partner in valid:
+            key = (partner.company_id, partner.cpf_normalized)
+            if key in existing:
+                errors += self._log_error(line_number, row, {'cpf': ['Sócio já cadastrado nesta empresa.']})
+                continue
+            existing.add(key)
+            partners.append(partner)
+
+        self._insert(Partner, partners)
+        reconcile({partner.company_id for partner in partners})
+        return len(partners), errors
+
+    def import_memberships(self, batch):
+        errors = 0
+        roles = dict(Membership.ROLE_CHOICES)
+        company_ids = self._company_ids(batch)
+        # E-mail sem diferenciar maiúsculas: o cadastro só normaliza o domínio
+        emails = {(row.get('email') or '').strip().lower() for _, row in batch}
+        user_ids = {}
+        users = (
+            get_user_model().objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+            .order_by('pk').values_list('email_lower', 'id')
+        )
+        for email, user_id in users:
+            user_ids.setdefault(email, user_id)  # Duas contas só na caixa: vale a mais antiga
+
+        # Deduplica por (usuário, empresa): contra o banco (uma query) e dentro do próprio arquivo
+        existing = set(
+            Membership.objects.filter(user_id__in=user_ids.values(), company_id__in=company_ids.values())
+            .values_list('user_id', 'company_id')
+        )
+        memberships = []
+        for line_number, row in batch:
+            role = row.get('role') or Membership.ROLE_BROKER
+            company_id = company_ids.get(normalize_cnpj(row.get('cnpj')))
+            user_id = user_ids.get((row.get('email') or '').strip().lower())
+            if company_id is None:
+                errors += self._log_error(line_number, row, {'cnpj': ['Empresa não encontrada.']})
+            elif user_id is None:
+                errors += self._log_error(line_number, row, {'email': ['Usuário não encontrado.']})
+            elif role not in roles:
+                errors += self._log_error(line_number, row, {'role': [f'Cargo inválido: {role}.']})
+            elif (user_id, company_id) in existing:
+                errors += self._log_error(line_number, row, {'email': ['Usuário já é membro desta empresa.']})
+            else:
+                existing.add((user_id, company_id))
+                memberships.append(Membership(user_id=user_id, company_id=company_id, role=role))
+
+        # Vínculo gravado em paralelo é ignorado pelo banco: conta só os que entraram (id uuid gerado aqui)
+        Membership.objects.bulk_create(memberships, ignore_conflicts=True)
+        inserted = Membership.objects.filter(pk__in=[membership.pk for membership in memberships]).values_list('company_id', 'user_id')
+
+        # bulk_create não dispara signals: limpa o cache do tenant desses usuários
+        users_by_company = {}
+        for company_id, user_id in inserted:
+            users_by_company.setdefault(company_id, []).append(user_id)
+        for company_id, users in users_by_company.items():
+            invalidate_tenants(users, company_id)
+        reconcile(users_by_company)
+
+        return sum(map(len, users_by_company.values())), errors
+
+    # --- Apoio ------------------------------------------------------------
+
+    def _insert(self, model, objs):
+        if not objs:
+            return
+        if self.use_copy:
+            self._copy(model, objs)
+        else:
+            model.objects.bulk_create(objs)
+
+    def _copy(self, model, objs):
+        # PostgreSQL: COPY ... FROM STDIN é bem mais rápido que INSERT em lote
+        fields = model._meta.concrete_fields
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objs:
+            writer.writerow([self._copy_value(field, obj) for field in fields])
+        buffer.seek(0)
+
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+
+    def _copy_value(self, field, obj):
+        # Texto de uma coluna no CSV do COPY (\N = NULL)
+        value = field.pre_save(obj, add=True)
+        if isinstance(field, models.JSONField):
+            # get_db_prep_save devolve o adaptador Json do psycopg2, cujo str() não é JSON
+            value = field.get_prep_value(value)
+            return r'\N' if value is None else json.dumps(value, cls=field.encoder)
+        value = field.get_db_prep_save(value, connection)
+        return r'\N' if value is None else str(value)
+
+    def _log_error(self, line_number, row, errors):
+        # errors: form.errors ou dict {campo: [mensagens]}; vai para o arquivo depois do commit do lote
+        errors = {field: list(messages) for field, messages in errors.items()}
+        line = json.dumps({'line': line_number, 'errors': errors, 'row': row}, ensure_ascii=False, default=str) + '\n'
+        self.batch_errors.append(line.encode('utf-8'))
+        return 1
+
+    def _save_checkpoint(self, checkpoint_path, state):
+        # Grava num temporário e troca: o checkpoint nunca fica pela metade
+        tmp_path = f'{checkpoint_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, checkpoint_path)
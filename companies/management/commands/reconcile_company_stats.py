@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from companies.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula os números do dashboard (CompanyStats) a partir das tabelas e corrige os divergentes. '
+        'Rodar periodicamente (ex.: cron de hora em hora).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', action='append', dest='companies', help='Só esta empresa (id); pode repetir')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Empresas por lote (uma transação curta cada)')
+
+    def handle(self, *args, **options):
+        checked, fixed = reconcile(options['companies'], batch_size=options['batch_size'])
+        style = self.style.WARNING if fixed else self.style.SUCCESS
+        self.stdout.write(style(f'{checked} empresas conferidas, {fixed} com números corrigidos.'))
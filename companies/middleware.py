@@ -1,70 +1,120 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.shortcuts import redirect
-from django.urls import reverse
-from .models import Membership, Company
+from core.instrumentation import tag_tenant, timed
+from core.routing import TENANT, get_route_matcher
+from functools import partial
+from .permissions import has_capabilities
+from .scoping import reset_current_company, set_current_company
+from .tenancy import TENANT_SESSION_KEY, aresolve_tenant, auser_companies, resolve_tenant, tenant_session_context, user_companies
 
 class CompanyMiddleware:
+    # Sync no WSGI; async nativo no ASGI quando settings.ASYNC_GATES estiver ligado
+    sync_capable = True
+    async_capable = settings.ASYNC_GATES
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.route_policy = get_route_matcher()
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         # 1. Se não estiver logado, passa
         if not request.user.is_authenticated:
             return self.get_response(request)
 
-        # 2. Rotas isentas
-        path = request.path_info
-        exempt_paths = [
-            reverse('create_company'),
-            '/admin/',
-            '/accounts/logout/',
-            '/static/',
-            '/media/',
-        ]
-        
-        if any(path.startswith(p) for p in exempt_paths):
+        # 2. Rotas que não exigem empresa (declaradas nos urls.py, ver core/routing.py)
+        policy = getattr(request, 'route_policy', None) or self.route_policy(request.path_info)
+        if policy != TENANT:
             return self.get_response(request)
 
-        # 3. Busca Empresa na Sessão
-        company_id = request.session.get('company_id')
-        active_company = None
-        membership = None # Variável auxiliar
-
-        if company_id:
-            try:
-                membership = Membership.objects.get(user=request.user, company__id=company_id, is_active=True)
-                active_company = membership.company
-            except Membership.DoesNotExist:
-                del request.session['company_id']
-
-        # 4. Fallback: Busca a primeira do banco se não achou na sessão
-        if not active_company:
-            membership = Membership.objects.filter(user=request.user, is_active=True).first()
-            if membership:
-                active_company = membership.company
-                request.session['company_id'] = str(active_company.id)
-
-        # 5. DECISÃO FINAL (A lógica corrigida)
-        if active_company:
-            # SUCESSO: Temos uma empresa
-            request.company = active_company
-            
-            # Garante que o request.membership esteja preenchido
-            if membership:
-                request.membership = membership
-            else:
-                # Caso raro onde active_company existe mas a var membership se perdeu
-                try:
-                    request.membership = Membership.objects.get(
-                        user=request.user, 
-                        company=active_company, 
-                        is_active=True
-                    )
-                except Membership.DoesNotExist:
-                    request.membership = None
-        else:
+        with timed('tenant'):
+            # 3. Busca Empresa na Sessão (LRU local -> Redis -> banco, ver tenancy.py)
+            # A sessão guarda o contexto compacto [company_id, membership_id, role]
+            context = request.session.get(TENANT_SESSION_KEY)
+            membership = None
+
+            if context:
+                membership = resolve_tenant(request.user, context[0])
+
+            # 4. Fallback: Busca o primeiro vínculo ativo se não achou na sessão
+            if membership is None:
+                membership = resolve_tenant(request.user)
+
+            # Só grava a sessão quando o contexto mudou (troca de empresa, cargo alterado)
+            new_context = tenant_session_context(membership) if membership else None
+            if new_context != context:
+                if new_context:
+                    request.session[TENANT_SESSION_KEY] = new_context
+                else:
+                    request.session.pop(TENANT_SESSION_KEY, None)
+
+        # 5. DECISÃO FINAL
+        if membership is None:
             # FRACASSO: Não tem empresa nenhuma -> Redireciona
-            # (Note que este ELSE agora está alinhado com o IF ACTIVE_COMPANY)
             return redirect('create_company')
 
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        # SUCESSO: O Membership já vem com a empresa carregada (sem query extra)
+        request.company = membership.company
+        request.membership = membership
+        # request.can('edit_company'): bitset já calculado no cache do tenant
+        request.can = partial(has_capabilities, membership)
+        # Tags do Sentry antes da view: erros dela já saem com empresa e cargo
+        tag_tenant(membership)
+        # Seletor de empresa da sidebar: carregado aqui (cache do tenant), nunca de forma lazy no template
+        request.user_companies = user_companies(request.user)
+
+        # Empresa ativa para os managers `scoped` (ContextVar: isolada por thread/task)
+        token = set_current_company(membership.company)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_company(token)
+
+    async def __acall__(self, request):
+        # Mesmos passos do __call__, com sessão, cache e ORM assíncronos
+        user = await request.auser()
+        if not user.is_authenticated:
+            return await self.get_response(request)
+
+        policy = getattr(request, 'route_policy', None) or self.route_policy(request.path_info)
+        if policy != TENANT:
+            return await self.get_response(request)
+
+        with timed('tenant'):
+            context = await request.session.aget(TENANT_SESSION_KEY)
+            membership = None
+
+            if context:
+                membership = await aresolve_tenant(user, context[0])
+
+            if membership is None:
+                membership = await aresolve_tenant(user)
+
+            new_context = tenant_session_context(membership) if membership else None
+            if new_context != context:
+                if new_context:
+                    await request.session.aset(TENANT_SESSION_KEY, new_context)
+                else:
+                    await request.session.apop(TENANT_SESSION_KEY, None)
+
+        if membership is None:
+            return redirect('create_company')
+
+        request.company = membership.company
+        request.membership = membership
+        request.can = partial(has_capabilities, membership)
+        tag_tenant(membership)
+        request.user_companies = await auser_companies(user)
+
+        token = set_current_company(membership.company)
+        try:
+            return await self.get_response(request)
+        finally:
+            reset_current_company(token)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_remove_company_partners_partner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='cnpj_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=14, verbose_name='CNPJ normalizado'),
+        ),
+        migrations.AddField(
+            model_name='partner',
+            name='cpf_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=11, verbose_name='CPF normalizado'),
+        ),
+        migrations.AddIndex(
+            model_name='partner',
+            index=models.Index(fields=['cpf_normalized', 'company'], name='partner_cpf_company_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import re
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+
+def _backfill(model, source, target, normalize):
+    # Percorre a tabela pela PK em lotes; cada lote é uma transação curta
+    last_pk = None
+    while True:
+        queryset = model.objects.order_by('pk').only('pk', source)
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        batch = list(queryset[:BATCH_SIZE])
+        if not batch:
+            break
+
+        for obj in batch:
+            setattr(obj, target, normalize(getattr(obj, source)))
+        with transaction.atomic():
+            model.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def backfill_documents(apps, schema_editor):
+    # As funções de companies.documents podem mudar; aqui fica a versão da época da migração
+    _backfill(apps.get_model('companies', 'Company'), 'cnpj', 'cnpj_normalized',
+              lambda value: re.sub(r'[^0-9A-Z]', '', (value or '').upper()))
+    _backfill(apps.get_model('companies', 'Partner'), 'cpf', 'cpf_normalized',
+              lambda value: re.sub(r'\D', '', value or ''))
+
+
+class Migration(migrations.Migration):
+    # Sem transação única: em tabelas grandes cada lote é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('companies', '0003_document_normalized_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
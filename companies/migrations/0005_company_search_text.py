@@ -0,0 +1,55 @@
+import unicodedata
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models, transaction
+
+from core.operations import PostgresAddIndex, PostgresExtension
+
+BATCH_SIZE = 5000
+
+
+def _normalize(*values):
+    # Cópia de core.search.normalize_search_text na época da migração
+    text = unicodedata.normalize('NFKD', ' '.join(v for v in values if v).lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def backfill_search_text(apps, schema_editor):
+    Company = apps.get_model('companies', 'Company')
+    last_pk = None
+    while True:
+        queryset = Company.objects.order_by('pk').only('pk', 'legal_name', 'trade_name', 'cnpj', 'cnpj_normalized')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        batch = list(queryset[:BATCH_SIZE])
+        if not batch:
+            break
+        for company in batch:
+            company.search_text = _normalize(company.legal_name, company.trade_name, company.cnpj, company.cnpj_normalized)
+        with transaction.atomic():
+            Company.objects.bulk_update(batch, ['search_text'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Sem transação única: em tabelas grandes cada lote é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('companies', '0004_backfill_document_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='Texto de busca'),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        # Índices criados depois do backfill (mais rápido que atualizar índice linha a linha),
+        # CONCURRENTLY: tabela grande não fica com as escritas travadas durante o build
+        PostgresExtension('pg_trgm'),
+        PostgresAddIndex('company', GinIndex(fields=['search_text'], opclasses=['gin_trgm_ops'], name='company_search_trgm_idx'), concurrently=True),
+        PostgresAddIndex('company', GinIndex(SearchVector('search_text', config='portuguese'), name='company_search_fts_idx'), concurrently=True),
+    ]
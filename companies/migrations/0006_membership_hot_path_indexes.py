@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação
+    atomic = False
+
+    dependencies = [
+        ('companies', '0005_company_search_text'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='membership',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'id'], name='membership_user_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='membership',
+            index=models.Index(fields=['company', 'is_active', 'role'], name='membership_company_role_idx'),
+        ),
+    ]
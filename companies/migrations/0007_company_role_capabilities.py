@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0006_membership_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='role_capabilities',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Ajustes de permissões por cargo'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:36
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0007_company_role_capabilities'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('company_id', models.UUIDField(verbose_name='Empresa')),
+                ('model', models.CharField(max_length=20, verbose_name='Tipo')),
+                ('object_id', models.UUIDField(verbose_name='Objeto')),
+                ('action', models.CharField(choices=[('create', 'Criação'), ('update', 'Alteração'), ('delete', 'Exclusão')], max_length=6, verbose_name='Ação')),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Alterações')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Quando')),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Alteração',
+                'verbose_name_plural': 'Histórico de alterações',
+                'indexes': [models.Index(fields=['company_id', '-id'], name='changeevent_company_idx'), models.Index(fields=['object_id', '-id'], name='changeevent_object_idx')],
+            },
+        ),
+    ]
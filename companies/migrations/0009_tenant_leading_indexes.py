@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação
+    atomic = False
+
+    dependencies = [
+        ('companies', '0008_change_event'),
+    ]
+
+    operations = [
+        # 1. Índice composto começando por company_id (antes de remover o índice simples)
+        AddIndexConcurrently(
+            model_name='partner',
+            index=models.Index(fields=['company', 'name', 'id'], name='partner_company_name_idx'),
+        ),
+        # 2. Índices só de company_id ficam redundantes (membership_company_role_idx e o de cima cobrem)
+        migrations.AlterField(
+            model_name='membership',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='companies.company'),
+        ),
+        migrations.AlterField(
+            model_name='partner',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='partners_list', to='companies.company'),
+        ),
+    ]
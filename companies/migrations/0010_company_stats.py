@@ -0,0 +1,68 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Count
+
+BATCH_SIZE = 5000
+
+ROLE_FIELDS = {'admin': 'admin_count', 'financial': 'financial_count', 'broker': 'broker_count'}
+
+
+def backfill_stats(apps, schema_editor):
+    # Contagem inicial das empresas existentes, em lotes pela PK (cada lote é uma transação curta)
+    Company = apps.get_model('companies', 'Company')
+    CompanyStats = apps.get_model('companies', 'CompanyStats')
+    Partner = apps.get_model('companies', 'Partner')
+    Membership = apps.get_model('companies', 'Membership')
+
+    last_pk = None
+    while True:
+        queryset = Company.objects.order_by('pk').values_list('pk', flat=True)
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        company_ids = list(queryset[:BATCH_SIZE])
+        if not company_ids:
+            break
+
+        stats = {company_id: CompanyStats(company_id=company_id) for company_id in company_ids}
+        partners = Partner.objects.filter(company_id__in=company_ids).values('company_id').annotate(n=Count('pk'))
+        for row in partners:
+            stats[row['company_id']].partner_count = row['n']
+        members = (
+            Membership.objects.filter(company_id__in=company_ids, is_active=True)
+            .values('company_id', 'role').annotate(n=Count('pk'))
+        )
+        for row in members:
+            if row['role'] in ROLE_FIELDS:
+                setattr(stats[row['company_id']], ROLE_FIELDS[row['role']], row['n'])
+
+        with transaction.atomic():
+            CompanyStats.objects.bulk_create(stats.values(), ignore_conflicts=True)
+        last_pk = company_ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Sem transação única: em tabelas grandes cada lote é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('companies', '0009_tenant_leading_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyStats',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='companies.company')),
+                ('partner_count', models.IntegerField(default=0, verbose_name='Sócios')),
+                ('admin_count', models.IntegerField(default=0, verbose_name='Administradores')),
+                ('financial_count', models.IntegerField(default=0, verbose_name='Financeiro')),
+                ('broker_count', models.IntegerField(default=0, verbose_name='Corretores')),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True, verbose_name='Conferido em')),
+            ],
+            options={
+                'verbose_name': 'Números da empresa',
+                'verbose_name_plural': 'Números das empresas',
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
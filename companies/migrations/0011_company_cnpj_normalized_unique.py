@@ -0,0 +1,48 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+# Empresas listadas por CNPJ no relatório (o resto fica só na contagem)
+REPORT_LIMIT = 50
+
+
+def check_duplicate_companies(apps, schema_editor):
+    """
+    Antes do unique: para se houver empresas com o mesmo CNPJ normalizado.
+    Cada uma é um tenant (membros, cargos, permissões próprias): juntar ou
+    apagar é decisão de quem opera, não da migração. O relatório lista os
+    CNPJs e as empresas; depois de resolver (no admin), é só migrar de novo.
+    """
+    Company = apps.get_model('companies', 'Company')
+
+    duplicated = list(
+        Company.objects.exclude(cnpj_normalized='').values('cnpj_normalized')
+        .annotate(n=Count('pk')).filter(n__gt=1).order_by('cnpj_normalized').values_list('cnpj_normalized', flat=True)
+    )
+    if not duplicated:
+        return
+
+    lines = [f'{len(duplicated)} CNPJs com mais de uma empresa; resolva antes de migrar:']
+    for cnpj in duplicated[:REPORT_LIMIT]:
+        companies = Company.objects.filter(cnpj_normalized=cnpj).order_by('created_at', 'pk')
+        lines.append(f'  {cnpj}: ' + ', '.join(f'{company.legal_name} ({company.pk})' for company in companies))
+    if len(duplicated) > REPORT_LIMIT:
+        lines.append(f'  ... e mais {len(duplicated) - REPORT_LIMIT} CNPJs.')
+    raise RuntimeError('\n'.join(lines))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_company_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_companies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='company',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('cnpj_normalized', ''), _negated=True),
+                fields=('cnpj_normalized',), name='company_cnpj_normalized_uniq',
+            ),
+        ),
+    ]
@@ -1,8 +1,15 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.functional import cached_property
 import uuid
+from core.models import DerivedFieldsMixin
+from core.search import normalize_search_text
+from .documents import normalize_cnpj, normalize_cpf
+from .scoping import TenantQuerySet, TenantScopedManager
 
-class Company(models.Model):
+class Company(DerivedFieldsMixin, models.Model):
     # Lista de Estados Brasileiros para o Select
     STATE_CHOICES = [
         ('AC', 'Acre'), ('AL', 'Alagoas'), ('AP', 'Amapá'), ('AM', 'Amazonas'),
@@ -19,10 +26,15 @@ class Company(models.Model):
     # --- Dados Obrigatórios ---
     legal_name = models.CharField('Razão Social', max_length=255)
     cnpj = models.CharField('CNPJ', max_length=20, unique=True) # Ideal usar máscara no front
+    # CNPJ sem máscara, preenchido no save(): é por ele que buscamos e evitamos duplicados
+    cnpj_normalized = models.CharField('CNPJ normalizado', max_length=14, blank=True, db_index=True, editable=False)
     
     # --- Dados Opcionais ---
     trade_name = models.CharField('Nome Fantasia', max_length=255, blank=True)
     state_registration = models.CharField('Inscrição Estadual', max_length=20, blank=True)
+
+    # Razão social, fantasia e CNPJ em minúsculas e sem acento (busca indexada, ver core.search)
+    search_text = models.TextField('Texto de busca', blank=True, editable=False)
     
     
 
@@ -44,6 +56,10 @@ class Company(models.Model):
     created_at = models.DateTimeField('Criado em', auto_now_add=True)
     updated_at = models.DateTimeField('Última atualização', auto_now=True) # Atualiza data sozinho
     
+    # --- Permissões ---
+    # Ajustes das capacidades de cada cargo nesta empresa (ver companies/permissions.py)
+    role_capabilities = models.JSONField('Ajustes de permissões por cargo', default=dict, blank=True)
+
     updated_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL, # Se o usuário for deletado, mantemos o histórico
@@ -63,11 +79,32 @@ class Company(models.Model):
         verbose_name = 'Empresa'
         verbose_name_plural = 'Empresas'
         ordering = ['trade_name', 'legal_name']
+        constraints = [
+            # Mesmo CNPJ com outra pontuação é duplicado (o unique do cnpj compara o texto digitado)
+            models.UniqueConstraint(
+                fields=['cnpj_normalized'], condition=~models.Q(cnpj_normalized=''),
+                name='company_cnpj_normalized_uniq',
+            ),
+        ]
+
+    # Campos calculados a partir de outros (bulk_create/COPY precisam chamar refresh_derived_fields)
+    DERIVED_FIELDS = {
+        'cnpj_normalized': ['cnpj'],
+        'search_text': ['legal_name', 'trade_name', 'cnpj'],
+    }
 
     def __str__(self):
         # Retorna o Fantasia. Se não tiver, retorna a Razão Social
         return self.trade_name if self.trade_name else self.legal_name
 
+    def clean(self):
+        from .permissions import validate_role_capabilities
+        validate_role_capabilities(self.role_capabilities)
+
+    def refresh_derived_fields(self):
+        self.cnpj_normalized = normalize_cnpj(self.cnpj)
+        self.search_text = normalize_search_text(self.legal_name, self.trade_name, self.cnpj, self.cnpj_normalized)
+
 
 class Membership(models.Model):
     # ... (O Membership continua IGUAL ao anterior) ...
@@ -83,33 +120,149 @@ class Membership(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='memberships')
-    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='memberships')
+    # Sem índice próprio: o membership_company_role_idx já começa por company_id
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='memberships', db_index=False)
     role = models.CharField('Cargo / Perfil', max_length=20, choices=ROLE_CHOICES, default=ROLE_BROKER)
     is_active = models.BooleanField('Ativo?', default=True)
     date_joined = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantQuerySet.as_manager()
+    scoped = TenantScopedManager()  # Só a empresa ativa (ver companies/scoping.py)
+
     class Meta:
         verbose_name = 'Membro'
         verbose_name_plural = 'Membros'
-        unique_together = ('user', 'company')
+        unique_together = ('user', 'company')  # Também atende (user, company, is_active)
+        indexes = [
+            # CompanyMiddleware/resolve_tenant sem empresa escolhida: primeiro vínculo ativo do usuário (ORDER BY id)
+            models.Index(fields=['user', 'id'], condition=models.Q(is_active=True), name='membership_user_active_idx'),
+            # Lado da empresa: membros por situação e cargo (admin, listagens, signals)
+            models.Index(fields=['company', 'is_active', 'role'], name='membership_company_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.company} ({self.get_role_display()})"
+
+    @cached_property
+    def capabilities(self):
+        # Bitset efetivo (cargo + ajustes da empresa). Calculado antes de ir para
+        # o cache do tenant, então vem pronto nos requests seguintes
+        from .permissions import compile_capabilities
+        return compile_capabilities(self.role, self.company.role_capabilities)
     
     # ... (Classe Company acima)
 
-class Partner(models.Model):
+class Partner(DerivedFieldsMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='partners_list')
+    # Sem índice próprio: o partner_company_name_idx já começa por company_id
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='partners_list', db_index=False)
     
     name = models.CharField('Nome Completo', max_length=255)
     cpf = models.CharField('CPF', max_length=14)
+    # CPF só com dígitos, preenchido no save(): usado nas buscas "empresas deste CPF"
+    cpf_normalized = models.CharField('CPF normalizado', max_length=11, blank=True, editable=False)
     email = models.EmailField('Email', blank=True)
     phone = models.CharField('Telefone', max_length=20, blank=True)
     
+    DERIVED_FIELDS = {'cpf_normalized': ['cpf']}
+
+    objects = TenantQuerySet.as_manager()
+    scoped = TenantScopedManager()  # Só a empresa ativa (ver companies/scoping.py)
+
     class Meta:
         verbose_name = 'Sócio'
         verbose_name_plural = 'Sócios'
+        indexes = [
+            # Sócios da empresa em ordem de nome (formset paginado, detalhe): faixa do índice, já ordenada
+            models.Index(fields=['company', 'name', 'id'], name='partner_company_name_idx'),
+            # (cpf, empresa): a busca por CPF responde só com o índice (index-only scan)
+            models.Index(fields=['cpf_normalized', 'company'], name='partner_cpf_company_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def refresh_derived_fields(self):
+        self.cpf_normalized = normalize_cpf(self.cpf)
+
+class ChangeEvent(models.Model):
+    """
+    Histórico de alterações (campo a campo) de Company, Partner e Membership.
+    Só recebe INSERT, em lote, fora do request (ver companies/audit.py).
+    """
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+
+    ACTION_CHOICES = [
+        (ACTION_CREATE, 'Criação'),
+        (ACTION_UPDATE, 'Alteração'),
+        (ACTION_DELETE, 'Exclusão'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # Sem ForeignKey: o histórico continua existindo depois que a empresa/objeto é excluído
+    company_id = models.UUIDField('Empresa')
+    model = models.CharField('Tipo', max_length=20)  # company, partner, membership
+    object_id = models.UUIDField('Objeto')
+    action = models.CharField('Ação', max_length=6, choices=ACTION_CHOICES)
+    changes = models.JSONField('Alterações', default=dict, encoder=DjangoJSONEncoder)  # {campo: [antes, depois]}
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name='Usuário',
+    )
+    created_at = models.DateTimeField('Quando', default=timezone.now)  # Hora da alteração, não do INSERT
+
+    objects = TenantQuerySet.as_manager()
+    scoped = TenantScopedManager()  # Só a empresa ativa (ver companies/scoping.py)
+
+    class Meta:
+        verbose_name = 'Alteração'
+        verbose_name_plural = 'Histórico de alterações'
+        indexes = [
+            # Histórico da empresa, do mais novo para o mais antigo (paginação por id)
+            models.Index(fields=['company_id', '-id'], name='changeevent_company_idx'),
+            models.Index(fields=['object_id', '-id'], name='changeevent_object_idx'),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.model} {self.object_id} ({self.get_action_display()})'
+
+
+class CompanyStats(models.Model):
+    """
+    Números do dashboard, um registro por empresa. Mantidos pelos signals com
+    UPDATE ... SET x = x + 1 (ver companies/stats.py) e conferidos pelo
+    comando reconcile_company_stats: a home não faz COUNT.
+    """
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    partner_count = models.IntegerField('Sócios', default=0)
+    # Membros ativos por cargo
+    admin_count = models.IntegerField('Administradores', default=0)
+    financial_count = models.IntegerField('Financeiro', default=0)
+    broker_count = models.IntegerField('Corretores', default=0)
+    reconciled_at = models.DateTimeField('Conferido em', null=True, blank=True)
+
+    objects = TenantQuerySet.as_manager()
+    scoped = TenantScopedManager()  # Só o registro da empresa ativa (ver scoping.py)
+
+    ROLE_FIELDS = {
+        Membership.ROLE_ADMIN: 'admin_count',
+        Membership.ROLE_FINANCIAL: 'financial_count',
+        Membership.ROLE_BROKER: 'broker_count',
+    }
+
+    class Meta:
+        verbose_name = 'Números da empresa'
+        verbose_name_plural = 'Números das empresas'
+
+    def __str__(self):
+        return f'Números de {self.company_id}'
+
+    @property
+    def member_count(self):
+        return sum(getattr(self, field) for field in self.ROLE_FIELDS.values())
+
+    def members_by_role(self):
+        # [(rótulo do cargo, quantidade)] na ordem do ROLE_CHOICES
+        return [(label, getattr(self, self.ROLE_FIELDS[role])) for role, label in Membership.ROLE_CHOICES]
@@ -0,0 +1,96 @@
+"""
+Permissões por cargo como bitsets (IntFlag).
+
+Cada cargo tem um conjunto de capacidades (ROLE_CAPABILITIES), compilado em
+inteiros no import. A empresa pode ajustar o conjunto de um cargo em
+Company.role_capabilities:
+
+    {"broker": {"grant": ["export_data"], "revoke": ["view_clients"]}}
+
+O bitset efetivo é calculado quando o tenant entra no cache (ver
+tenancy.resolve_tenant) e fica em membership.capabilities: conferir uma
+permissão no request é um AND de inteiros, sem query.
+"""
+from enum import IntFlag, auto
+
+from django.core.exceptions import ValidationError
+
+from .models import Membership
+
+
+class Capability(IntFlag):
+    VIEW_DASHBOARD = auto()
+    VIEW_CLIENTS = auto()
+    VIEW_PROPOSALS = auto()
+    MANAGE_FINANCING = auto()
+    MANAGE_USERS = auto()
+    VIEW_COMPANY = auto()
+    EDIT_COMPANY = auto()
+    EXPORT_DATA = auto()
+
+
+NONE = Capability(0)
+ALL = Capability(sum(Capability))
+
+ROLE_CAPABILITIES = {
+    Membership.ROLE_ADMIN: ALL,
+    Membership.ROLE_FINANCIAL: (
+        Capability.VIEW_DASHBOARD | Capability.VIEW_CLIENTS | Capability.VIEW_PROPOSALS
+        | Capability.MANAGE_FINANCING | Capability.MANAGE_USERS
+        | Capability.VIEW_COMPANY | Capability.EDIT_COMPANY | Capability.EXPORT_DATA
+    ),
+    Membership.ROLE_BROKER: Capability.VIEW_DASHBOARD | Capability.VIEW_CLIENTS | Capability.VIEW_PROPOSALS,
+}
+
+# Compilado uma vez: cargo -> int
+_ROLE_MASKS = {role: int(capabilities) for role, capabilities in ROLE_CAPABILITIES.items()}
+
+# Hierarquia dos cargos: ROLE_CHOICES vai do maior para o menor
+_ROLE_ORDER = [role for role, _ in Membership.ROLE_CHOICES]
+
+
+def grantable_roles(role):
+    """Cargos que quem tem `role` pode dar a outra pessoa: o próprio e os abaixo dele."""
+    return _ROLE_ORDER[_ROLE_ORDER.index(role):] if role in _ROLE_ORDER else []
+
+
+def to_mask(*capabilities):
+    """Aceita Capability ou nomes ('export_data') e devolve o int com todos os bits."""
+    mask = 0
+    for capability in capabilities:
+        if isinstance(capability, str):
+            capability = Capability[capability.upper()]
+        mask |= capability
+    return int(mask)
+
+
+def compile_capabilities(role, overrides=None):
+    """Bitset efetivo do cargo com os ajustes da empresa (grant/revoke)."""
+    mask = _ROLE_MASKS.get(role, 0)
+    override = (overrides or {}).get(role) or {}
+    mask |= to_mask(*override.get('grant', ()))
+    mask &= ~to_mask(*override.get('revoke', ()))
+    return mask
+
+
+def validate_role_capabilities(value):
+    # Validador do Company.role_capabilities: cargos e capacidades conhecidos
+    if not isinstance(value, dict):
+        raise ValidationError('Use um objeto {cargo: {"grant": [...], "revoke": [...]}}.')
+    for role, override in value.items():
+        if role not in _ROLE_MASKS:
+            raise ValidationError(f'Cargo desconhecido: {role}.')
+        if not isinstance(override, dict) or set(override) - {'grant', 'revoke'}:
+            raise ValidationError(f'{role}: use apenas as chaves "grant" e "revoke".')
+        for names in override.values():
+            unknown = [name for name in names if not isinstance(name, str) or name.upper() not in Capability.__members__]
+            if unknown:
+                raise ValidationError(f'{role}: capacidades desconhecidas: {", ".join(map(str, unknown))}.')
+
+
+def has_capabilities(membership, *capabilities):
+    """True se o vínculo tem todas as capacidades (membership None -> False)."""
+    if membership is None:
+        return False
+    mask = to_mask(*capabilities)
+    return membership.capabilities & mask == mask
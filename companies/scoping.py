@@ -0,0 +1,76 @@
+"""
+Consultas presas à empresa ativa (multi-tenant).
+
+O CompanyMiddleware marca a empresa do request num ContextVar (isolado por
+thread e por task async). Os models do tenant ganham o manager `scoped`,
+que já filtra por ela:
+
+    Partner.scoped.all()            # só os sócios da empresa ativa
+    Partner.objects.for_company(c)  # explícito (scripts, admin, relatórios)
+
+Sem empresa ativa o `scoped` levanta NoActiveCompany em vez de devolver os
+dados de todas as empresas. Fora de um request (comandos, testes):
+
+    with use_company(company):
+        ...
+
+Os índices dessas tabelas começam por company_id: o filtro vira uma faixa
+do índice, do mesmo tamanho para 10 ou 10 mil empresas.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models
+
+_current_company = ContextVar('current_company', default=None)
+
+
+class NoActiveCompany(RuntimeError):
+    pass
+
+
+def _company_id(company):
+    return getattr(company, 'pk', company)
+
+
+def get_current_company_id():
+    return _current_company.get()
+
+
+def require_current_company_id(label='Consulta'):
+    """Empresa ativa ou NoActiveCompany (nunca "todas as empresas")."""
+    company_id = _current_company.get()
+    if company_id is None:
+        raise NoActiveCompany(f'{label} usado sem empresa ativa (use_company ou CompanyMiddleware).')
+    return company_id
+
+
+def set_current_company(company):
+    """Marca a empresa ativa; devolve o token para reset_current_company."""
+    return _current_company.set(_company_id(company))
+
+
+def reset_current_company(token):
+    _current_company.reset(token)
+
+
+@contextmanager
+def use_company(company):
+    token = set_current_company(company)
+    try:
+        yield
+    finally:
+        reset_current_company(token)
+
+
+class TenantQuerySet(models.QuerySet):
+    def for_company(self, company):
+        return self.filter(company_id=_company_id(company))
+
+
+class TenantScopedManager(models.Manager.from_queryset(TenantQuerySet)):
+    """Manager que filtra pela empresa ativa (ver módulo)."""
+
+    def get_queryset(self):
+        company_id = require_current_company_id(f'{self.model.__name__}.scoped')
+        return super().get_queryset().filter(company_id=company_id)
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import audit, stats
+from .models import ChangeEvent, Company, CompanyStats, Membership, Partner
+from .tenancy import invalidate_shell, invalidate_tenants
+
+
+@receiver([post_save, post_delete], sender=Membership)
+def invalidate_membership_tenant(sender, instance, **kwargs):
+    # Vínculo mudou (cargo, ativo, removido): limpa o cache daquele usuário
+    invalidate_tenants([instance.user_id], instance.company_id)
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_company_tenant(sender, instance, created=False, **kwargs):
+    # Empresa recém-criada ainda não tem membros em cache
+    if created:
+        return
+
+    # Dados da empresa mudaram: limpa o cache de todos os membros dela
+    user_ids = Membership.objects.filter(company=instance).values_list('user_id', flat=True)
+    invalidate_tenants(user_ids, instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_shell(sender, instance, created=False, **kwargs):
+    # Nome/e-mail aparecem na sidebar em cache
+    if not created:
+        invalidate_shell([instance.pk])
+
+
+# --- Histórico de alterações (companies/audit.py) ---
+
+@receiver(post_init, sender=Company)
+@receiver(post_init, sender=Partner)
+@receiver(post_init, sender=Membership)
+def audit_snapshot(sender, instance, **kwargs):
+    # Valores como foram carregados: o save compara com eles
+    instance._audit_snapshot = audit.snapshot(instance)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Partner)
+@receiver(post_save, sender=Membership)
+def audit_save(sender, instance, created=False, raw=False, using=None, **kwargs):
+    if raw:  # loaddata
+        return
+    audit.record([instance], ChangeEvent.ACTION_CREATE if created else ChangeEvent.ACTION_UPDATE, using=using)
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Partner)
+@receiver(post_delete, sender=Membership)
+def audit_delete(sender, instance, using=None, **kwargs):
+    audit.record([instance], ChangeEvent.ACTION_DELETE, using=using)
+
+
+# --- Números do dashboard (companies/stats.py) ---
+
+@receiver(post_save, sender=Company)
+def stats_company_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        CompanyStats.objects.create(company=instance)
+
+
+@receiver(post_save, sender=Partner)
+def stats_partner_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust(instance.company_id, partner_count=1)
+
+
+@receiver(post_delete, sender=Partner)
+def stats_partner_deleted(sender, instance, **kwargs):
+    stats.adjust(instance.company_id, partner_count=-1)
+
+
+@receiver(post_init, sender=Membership)
+def stats_membership_loaded(sender, instance, **kwargs):
+    # Contador em que o vínculo está hoje: o save compara com ele
+    instance._stats_field = stats.loaded_membership_field(instance)
+
+
+@receiver(post_save, sender=Membership)
+def stats_membership_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        stats.membership_changed(instance, created=created)
+
+
+@receiver(post_delete, sender=Membership)
+def stats_membership_deleted(sender, instance, **kwargs):
+    stats.membership_changed(instance, deleted=True)
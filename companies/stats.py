@@ -0,0 +1,161 @@
+"""
+Contadores do dashboard (CompanyStats) mantidos de forma incremental.
+
+1. Empresa criada: cria o registro zerado
+2. Sócio criado/excluído, membro criado/excluído/mudou de cargo ou situação:
+   UPDATE ... SET campo = campo + delta (F()), na mesma transação da alteração
+   (rollback desfaz os dois)
+3. reconcile() recalcula a partir das tabelas (comando reconcile_company_stats,
+   periódico): corrige o que escapou dos signals (update()/bulk_create/SQL
+   direto) e cria registros que faltam
+
+Operações em lote (formset de sócios) usam batched(): os deltas se somam e
+viram um UPDATE por empresa no final.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Company, CompanyStats, Membership, Partner
+from .scoping import get_current_company_id
+
+# Deltas acumulados dentro de batched(): {company_id: Counter({campo: delta})}
+_pending = ContextVar('stats_pending', default=None)
+
+# Vínculo carregado sem role/is_active (.only/.defer): não sabemos onde estava contado.
+# String e não object(): o Membership vai para o cache do tenant (pickle)
+UNKNOWN = 'unknown'
+
+
+def _apply(company_id, deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        # Registro que ainda não existe fica para o reconcile (não recria durante a exclusão da empresa)
+        CompanyStats.objects.filter(company_id=company_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+
+
+def adjust(company_id, **deltas):
+    """Soma os deltas aos contadores da empresa (ou acumula, dentro de batched())."""
+    pending = _pending.get()
+    if pending is None:
+        _apply(company_id, deltas)
+    else:
+        pending.setdefault(company_id, Counter()).update(deltas)
+
+
+@contextmanager
+def batched():
+    """Junta os ajustes do bloco num UPDATE por empresa, aplicado no fim (se não houve erro)."""
+    if _pending.get() is not None:
+        yield  # Já dentro de outro batched(): ele aplica
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    for company_id, deltas in pending.items():
+        _apply(company_id, deltas)
+
+
+def membership_field(membership):
+    """Contador em que o vínculo entra (None se inativo)."""
+    return CompanyStats.ROLE_FIELDS.get(membership.role) if membership.is_active else None
+
+
+def loaded_membership_field(membership):
+    # Só com os campos já carregados: campo adiado não dispara query no post_init
+    if 'role' not in membership.__dict__ or 'is_active' not in membership.__dict__:
+        return UNKNOWN
+    return membership_field(membership)
+
+
+def membership_changed(membership, created=False, deleted=False):
+    # O post_init guardou onde o vínculo estava contado (_stats_field)
+    before = None if created else getattr(membership, '_stats_field', UNKNOWN)
+    after = None if deleted else membership_field(membership)
+    if before != UNKNOWN and before != after:
+        deltas = Counter()
+        if before:
+            deltas[before] -= 1
+        if after:
+            deltas[after] += 1
+        adjust(membership.company_id, **deltas)
+    membership._stats_field = after
+
+
+def reconcile(company_ids=None, batch_size=1000):
+    """
+    Recalcula os contadores (COUNT agrupado, em lotes pela PK) e grava só o que
+    estava diferente. Retorna (empresas conferidas, registros corrigidos).
+    """
+    companies = Company.objects.order_by('pk').values_list('pk', flat=True)
+    if company_ids is not None:
+        companies = companies.filter(pk__in=list(company_ids))
+
+    checked = fixed = 0
+    last_pk = None
+    while True:
+        queryset = companies.filter(pk__gt=last_pk) if last_pk is not None else companies
+        batch = list(queryset[:batch_size])
+        if not batch:
+            break
+
+        with transaction.atomic():
+            # 1. Trava os registros antes de contar: quem alterar agora espera e soma depois
+            existing = {stats.pk: stats for stats in CompanyStats.objects.select_for_update().filter(pk__in=batch)}
+
+            # 2. Valores corretos, direto das tabelas
+            expected = {company_id: Counter() for company_id in batch}
+            partners = Partner.objects.filter(company_id__in=batch).values('company_id').annotate(n=Count('pk'))
+            for row in partners:
+                expected[row['company_id']]['partner_count'] = row['n']
+            members = (
+                Membership.objects.filter(company_id__in=batch, is_active=True)
+                .values('company_id', 'role').annotate(n=Count('pk'))
+            )
+            for row in members:
+                field = CompanyStats.ROLE_FIELDS.get(row['role'])
+                if field:
+                    expected[row['company_id']][field] = row['n']
+
+            # 3. Cria os que faltam e corrige os divergentes
+            now = timezone.now()
+            fields = ['partner_count', *CompanyStats.ROLE_FIELDS.values()]
+            missing, changed = [], []
+            for company_id, values in expected.items():
+                stats = existing.get(company_id)
+                if stats is None:
+                    missing.append(CompanyStats(company_id=company_id, reconciled_at=now, **values))
+                    continue
+                stats.reconciled_at = now
+                if any(getattr(stats, field) != values[field] for field in fields):
+                    for field in fields:
+                        setattr(stats, field, values[field])
+                    changed.append(stats)
+            CompanyStats.objects.bulk_create(missing, ignore_conflicts=True)
+            CompanyStats.objects.bulk_update(existing.values(), fields + ['reconciled_at'])
+
+        checked += len(batch)
+        fixed += len(missing) + len(changed)
+        last_pk = batch[-1]
+
+    return checked, fixed
+
+
+def dashboard_stats():
+    """Números da empresa ativa para a home, numa query (com quem fez a última alteração)."""
+    queryset = CompanyStats.scoped.select_related('company__updated_by')
+    stats = queryset.first()
+    if stats is None:
+        # Empresa sem registro (importada em massa, antes do reconcile): cria agora
+        reconcile([get_current_company_id()])
+        stats = queryset.first()
+    return stats
@@ -0,0 +1,14 @@
+from django import template
+
+from companies.permissions import has_capabilities
+
+register = template.Library()
+
+
+@register.filter
+def can(request, capabilities):
+    """
+    {% if request|can:"edit_company" %} ... {% endif %}
+    Várias capacidades separadas por vírgula exigem todas: "view_company,export_data".
+    """
+    return has_capabilities(getattr(request, 'membership', None), *capabilities.split(','))
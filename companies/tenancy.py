@@ -0,0 +1,283 @@
+"""
+Resolução do tenant (Membership + Company) com cache em duas camadas.
+
+1. LRU local do worker (memória do processo, TTL curto)
+2. Cache compartilhado (Redis, configurado em settings.CACHES)
+3. Banco de dados (uma única query com select_related)
+
+As chaves são versionadas (CACHE_VERSION) e invalidadas pelos signals de
+Membership/Company (ver companies/signals.py).
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.instrumentation import count
+from core.routers import PRIMARY
+from .models import Membership
+
+# Suba este número quando o formato do objeto cacheado mudar
+CACHE_VERSION = 3
+
+
+class LocalLRU:
+    """
+    LRU simples por processo, com expiração por TTL.
+    Guarda os objetos serializados (pickle) para que cada request receba
+    uma cópia própria — views podem alterar request.company sem sujar o cache.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, payload = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(
+    maxsize=getattr(settings, 'TENANT_LOCAL_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_LOCAL_CACHE_TTL', 5),
+)
+
+
+def tenant_cache_key(user_id, company_id=None):
+    # Sem company_id a chave guarda o vínculo "padrão" (primeiro ativo)
+    return f'tenant:{user_id}:{company_id or "default"}'
+
+
+# Contexto do tenant guardado na sessão: [company_id, membership_id, role]
+TENANT_SESSION_KEY = 'tenant'
+
+
+def tenant_session_context(membership):
+    return [str(membership.company_id), str(membership.pk), membership.role]
+
+
+def companies_cache_key(user_id):
+    # Lista de empresas do usuário (seletor de empresa)
+    return f'tenant:{user_id}:companies'
+
+
+def shell_version_key(user_id):
+    # Versão dos fragmentos em cache do shell (sidebar) do usuário
+    return f'tenant:{user_id}:shell'
+
+
+def _tenant_queryset(user, company_id):
+    # Uma query só, já trazendo a empresa. Sempre no primário: o resultado vai
+    # para o cache e uma réplica atrasada deixaria permissões antigas lá
+    queryset = Membership.objects.using(PRIMARY).select_related('company').filter(user=user, is_active=True)
+    if company_id:
+        queryset = queryset.filter(company_id=company_id)
+    return queryset
+
+
+def _cache_entries(user, key, membership):
+    # Calcula as permissões antes de serializar: vão junto para o cache
+    membership.capabilities
+    # O vínculo padrão também vale para a chave da empresa (próximo request vem com company_id)
+    return {key: membership, tenant_cache_key(user.pk, membership.company_id): membership}
+
+
+def resolve_tenant(user, company_id=None):
+    """
+    Retorna o Membership ativo do usuário, com a Company já carregada.
+    Com company_id busca o vínculo daquela empresa; sem, o primeiro ativo.
+    Retorna None se o usuário não tiver vínculo (não é cacheado).
+    """
+    key = tenant_cache_key(user.pk, company_id)
+
+    # 1. LRU local (zero rede, zero banco)
+    membership = local_cache.get(key)
+    if membership is not None:
+        count('tenant_cache_hit')
+        return membership
+
+    # 2. Cache compartilhado (Redis)
+    membership = cache.get(key, version=CACHE_VERSION)
+    count('tenant_cache_hit' if membership is not None else 'tenant_cache_miss')
+
+    # 3. Banco
+    if membership is None:
+        membership = _tenant_queryset(user, company_id).first()
+        if membership is None:
+            return None
+        cache.set_many(_cache_entries(user, key, membership), getattr(settings, 'TENANT_CACHE_TIMEOUT', 300), version=CACHE_VERSION)
+
+    for entry_key in _cache_entries(user, key, membership):
+        local_cache.set(entry_key, membership)
+    return membership
+
+
+async def aresolve_tenant(user, company_id=None):
+    """Versão async de resolve_tenant (cache e ORM assíncronos, para o ASGI)."""
+    key = tenant_cache_key(user.pk, company_id)
+
+    membership = local_cache.get(key)
+    if membership is not None:
+        count('tenant_cache_hit')
+        return membership
+
+    membership = await cache.aget(key, version=CACHE_VERSION)
+    count('tenant_cache_hit' if membership is not None else 'tenant_cache_miss')
+
+    if membership is None:
+        membership = await _tenant_queryset(user, company_id).afirst()
+        if membership is None:
+            return None
+        await cache.aset_many(_cache_entries(user, key, membership), getattr(settings, 'TENANT_CACHE_TIMEOUT', 300), version=CACHE_VERSION)
+
+    for entry_key in _cache_entries(user, key, membership):
+        local_cache.set(entry_key, membership)
+    return membership
+
+
+class CompanyChoice(NamedTuple):
+    """Item compacto do seletor de empresa (é o que vai para o cache)."""
+    company_id: str
+    membership_id: str
+    name: str
+    role: str
+
+    @property
+    def role_display(self):
+        return dict(Membership.ROLE_CHOICES).get(self.role, self.role)
+
+
+def _companies_queryset(user):
+    return (
+        Membership.objects.using(PRIMARY).filter(user=user, is_active=True)
+        .order_by('pk')
+        .values_list('company_id', 'pk', 'company__trade_name', 'company__legal_name', 'role')
+    )
+
+
+def _company_choices(rows):
+    return sorted(
+        (
+            CompanyChoice(str(company_id), str(pk), trade_name or legal_name, role)
+            for company_id, pk, trade_name, legal_name, role in rows
+        ),
+        key=lambda choice: choice.name.lower(),
+    )
+
+
+def user_companies(user):
+    """
+    Empresas ativas do usuário para o seletor (lista de CompanyChoice),
+    em cache nos mesmos dois níveis do tenant. Invalidada junto com ele.
+    """
+    key = companies_cache_key(user.pk)
+
+    companies = local_cache.get(key)
+    if companies is None:
+        companies = cache.get(key, version=CACHE_VERSION)
+        if companies is None:
+            companies = _company_choices(_companies_queryset(user))
+            cache.set(key, companies, getattr(settings, 'TENANT_CACHE_TIMEOUT', 300), version=CACHE_VERSION)
+        local_cache.set(key, companies)
+    return companies
+
+
+async def auser_companies(user):
+    """Versão async de user_companies (cache e ORM assíncronos, para o ASGI)."""
+    key = companies_cache_key(user.pk)
+
+    companies = local_cache.get(key)
+    if companies is None:
+        companies = await cache.aget(key, version=CACHE_VERSION)
+        if companies is None:
+            companies = _company_choices([row async for row in _companies_queryset(user)])
+            await cache.aset(key, companies, getattr(settings, 'TENANT_CACHE_TIMEOUT', 300), version=CACHE_VERSION)
+        local_cache.set(key, companies)
+    return companies
+
+
+def shell_version(user_id):
+    """
+    Token que entra na chave dos fragmentos do shell (ver templates/includes).
+    Apagado junto com o cache do tenant: o próximo request gera um token novo
+    e os fragmentos antigos deixam de ser lidos (expiram sozinhos).
+    """
+    key = shell_version_key(user_id)
+
+    version = local_cache.get(key)
+    if version is None:
+        version = cache.get(key, version=CACHE_VERSION)
+        if version is None:
+            # add: se outro worker gerou antes, fica o dele
+            cache.add(key, uuid.uuid4().hex[:12], getattr(settings, 'SHELL_CACHE_TIMEOUT', 600), version=CACHE_VERSION)
+            version = cache.get(key, version=CACHE_VERSION)
+        local_cache.set(key, version)
+    return version
+
+
+def invalidate_shell(user_ids):
+    """Descarta os fragmentos do shell dos usuários (ex.: nome do usuário mudou)."""
+    keys = [shell_version_key(user_id) for user_id in set(user_ids)]
+
+    def _invalidate():
+        local_cache.delete_many(keys)
+        cache.delete_many(keys, version=CACHE_VERSION)
+
+    transaction.on_commit(_invalidate)
+
+
+def invalidate_tenants(user_ids, company_id):
+    """
+    Remove dos dois níveis as entradas dos usuários para a empresa informada
+    (e o vínculo "padrão", a lista de empresas e a versão do shell deles, que
+    podem apontar para ela).
+    Roda só depois do commit para não recachear dados antigos.
+    """
+    keys = []
+    for user_id in set(user_ids):
+        keys.append(tenant_cache_key(user_id, company_id))
+        keys.append(tenant_cache_key(user_id))
+        keys.append(companies_cache_key(user_id))
+        keys.append(shell_version_key(user_id))
+
+    if not keys:
+        return
+
+    def _invalidate():
+        local_cache.delete_many(keys)
+        cache.delete_many(keys, version=CACHE_VERSION)
+
+    transaction.on_commit(_invalidate)
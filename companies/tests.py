@@ -1,3 +1,925 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
 
-# Create your tests here.
+from allauth.account.forms import default_token_generator
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.template import Context, Template
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from django.urls import reverse
+
+from core.management.commands.bench_asgi import gates_mode
+
+from .audit import AuditWriter
+from .cep import CepIndex, reset_index, write_index
+from .documents import format_cnpj, is_valid_cnpj
+from .exports import export_response
+from .forms import CompanyAdminForm, PartnerFormSet
+from .invitations import parse_invitations, token_generator
+from .management.commands.import_companies import Command
+from .models import ChangeEvent, Company, CompanyStats, Membership, Partner
+from .permissions import ALL, Capability, compile_capabilities, validate_role_capabilities
+from .scoping import NoActiveCompany, get_current_company_id, use_company
+from .stats import reconcile
+from .tenancy import _tenant_queryset, local_cache, resolve_tenant
+
+
+class MembershipIndexTests(TestCase):
+    """
+    As queries quentes de Membership precisam usar os índices criados para
+    elas (ver Membership.Meta.indexes). O teste lê o EXPLAIN: se alguém mudar
+    a query (ou o índice) e o plano deixar de usá-lo, falha.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('index@example.com', 'x', name='Index')
+        cls.company = Company.objects.create(legal_name='Index Ltda', cnpj='11.222.333/0001-81')
+        Membership.objects.create(user=cls.user, company=cls.company, role=Membership.ROLE_ADMIN)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tabela quase vazia: sem isso o planner prefere seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'Plano não usa {index_name}:\n{plan}')
+
+    def test_default_tenant_uses_partial_index(self):
+        # resolve_tenant sem empresa: primeiro vínculo ativo do usuário
+        queryset = _tenant_queryset(self.user, None).order_by('pk')[:1]
+        self.assertUsesIndex(queryset, 'membership_user_active_idx')
+
+    def test_tenant_for_company_uses_unique_index(self):
+        unique_index = connection.schema_editor()._create_index_name(
+            Membership._meta.db_table, ['user_id', 'company_id'], suffix='_uniq'
+        )
+        self.assertUsesIndex(_tenant_queryset(self.user, self.company.pk), unique_index)
+
+    def test_company_members_by_role_uses_composite_index(self):
+        queryset = Membership.objects.filter(company=self.company, is_active=True, role=Membership.ROLE_ADMIN)
+        self.assertUsesIndex(queryset, 'membership_company_role_idx')
+
+
+
+class TenantScopingTests(TestCase):
+    """Manager `scoped`: só a empresa ativa, por faixa de índice que começa em company_id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Escopo Ltda', cnpj='11.222.333/0001-81')
+        cls.other = Company.objects.create(legal_name='Outra Ltda', cnpj='11.444.777/0001-61')
+        Partner.objects.create(company=cls.company, name='Ana', cpf='529.982.247-25')
+        Partner.objects.create(company=cls.other, name='Bruno', cpf='111.444.777-35')
+
+    def setUp(self):
+        # Cache do tenant de outros testes (mesmo user pk depois do rollback)
+        cache.clear()
+        local_cache.clear()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_scoped_filters_active_company(self):
+        with use_company(self.company):
+            self.assertEqual([p.name for p in Partner.scoped.all()], ['Ana'])
+        with use_company(self.other.pk):
+            self.assertEqual([p.name for p in Partner.scoped.all()], ['Bruno'])
+        self.assertEqual(Partner.objects.for_company(self.other).get().name, 'Bruno')
+
+    def test_scoped_without_company_fails_closed(self):
+        with self.assertRaises(NoActiveCompany):
+            list(Partner.scoped.all())
+
+    def test_active_company_is_per_thread(self):
+        seen = []
+        with use_company(self.company):
+            thread = threading.Thread(target=lambda: seen.append(get_current_company_id()))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+
+    def test_scoped_reads_use_company_leading_indexes(self):
+        with use_company(self.company):
+            plan = Partner.scoped.order_by('name', 'pk').explain()
+            self.assertIn('partner_company_name_idx', plan)
+            plan = Membership.scoped.filter(is_active=True).explain()
+            self.assertIn('membership_company_role_idx', plan)
+
+    def test_middleware_binds_request_company(self):
+        user = get_user_model().objects.create_user('escopo@example.com', 'x', name='Escopo')
+        Membership.objects.create(user=user, company=self.company, role=Membership.ROLE_ADMIN)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('company_detail'))
+        self.assertEqual([p.name for p in response.context['partners']], ['Ana'])
+        self.assertIsNone(get_current_company_id())
+
+class CompanySwitcherTests(TestCase):
+    """Seletor de empresa: a lista vem pronta do middleware, também na view async."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('duas@example.com', 'x', name='Duas')
+        for legal_name, cnpj in (('Primeira Ltda', '11.222.333/0001-81'), ('Segunda Ltda', '11.444.777/0001-61')):
+            company = Company.objects.create(legal_name=legal_name, cnpj=cnpj)
+            Membership.objects.create(user=cls.user, company=company, role=Membership.ROLE_ADMIN)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_detail_on_cold_cache(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('company_detail'))
+        self.assertContains(response, 'Trocar empresa')
+        self.assertContains(response, 'Segunda Ltda')
+
+    async def test_async_detail_on_cold_cache(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with gates_mode(True):
+            response = await client.get(reverse('company_detail'))
+        self.assertContains(response, 'Trocar empresa')
+        self.assertContains(response, 'Segunda Ltda')
+
+    def test_sentry_tags_set_before_the_view_runs(self):
+        tags = {}
+
+        def failing_view_step():
+            # Erro capturado durante a view: as tags do tenant já estão no escopo
+            self.assertEqual(tags['role'], Membership.ROLE_ADMIN)
+            self.assertIn(tags['company'], {str(pk) for pk in Membership.objects.filter(user=self.user).values_list('company_id', flat=True)})
+            raise RuntimeError('falha na view')
+
+        self.client.force_login(self.user)
+        with mock.patch('core.instrumentation._sentry_active', return_value=True), \
+                mock.patch('sentry_sdk.set_tag', side_effect=tags.__setitem__), \
+                mock.patch('companies.views.dashboard_stats', side_effect=failing_view_step):
+            with self.assertRaisesMessage(RuntimeError, 'falha na view'):
+                self.client.get(reverse('home'))
+
+
+@override_settings(AUDIT_ASYNC=False)
+class ShellCacheTests(TestCase):
+    """A sidebar fica em cache (templates/includes/sidebar.html) e precisa refletir mudanças de Company/Membership."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('shell@example.com', 'x', name='Shell')
+        cls.company = Company.objects.create(legal_name='Shell Ltda', trade_name='Shell Antiga', cnpj='11.222.333/0001-81')
+        cls.membership = Membership.objects.create(user=cls.user, company=cls.company, role=Membership.ROLE_ADMIN)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client.force_login(self.user)
+
+    def test_company_change_refreshes_sidebar(self):
+        self.assertContains(self.client.get(reverse('home')), 'Shell Antiga')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.trade_name = 'Shell Nova'
+            self.company.save()
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Shell Nova')
+        self.assertNotContains(response, 'Shell Antiga')
+
+    def test_role_change_refreshes_sidebar(self):
+        self.assertContains(self.client.get(reverse('home')), reverse('company_detail'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membership.role = Membership.ROLE_BROKER
+            self.membership.save()
+
+        self.assertNotContains(self.client.get(reverse('home')), reverse('company_detail'))
+
+    async def test_async_profile_does_not_cache_broken_sidebar(self):
+        # Perfil (view async) primeiro com o cache frio: o fragmento gravado tem que ter o seletor
+        other = await Company.objects.acreate(legal_name='Outra Shell Ltda', cnpj='11.444.777/0001-61')
+        await Membership.objects.acreate(user=self.user, company=other, role=Membership.ROLE_ADMIN)
+        cache.clear()
+        local_cache.clear()
+
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with gates_mode(True):
+            self.assertContains(await client.get(reverse('company_detail')), 'Trocar empresa')
+            self.assertContains(await client.get(reverse('home')), 'Trocar empresa')
+
+    def test_switch_form_is_not_cached(self):
+        # O form da troca de empresa (csrf, URL atual) fica fora do fragmento
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('company_detail'))
+        self.assertContains(response, f'name="next" value="{reverse("company_detail")}"')
+
+
+class PartnerFormSetTests(TestCase):
+    """O formset de sócios grava só a diferença, com uma query por operação."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Sócios Ltda', cnpj='11.222.333/0001-81')
+        cls.partners = [
+            Partner.objects.create(company=cls.company, name=name, cpf=cpf)
+            for name, cpf in [('Ana', '529.982.247-25'), ('Bruno', '111.444.777-35'), ('Carla', '935.411.347-80')]
+        ]
+
+    def formset_data(self, rows):
+        data = {
+            'partners_list-TOTAL_FORMS': len(rows), 'partners_list-INITIAL_FORMS': len(self.partners),
+            'partners_list-MIN_NUM_FORMS': 0, 'partners_list-MAX_NUM_FORMS': 1000,
+        }
+        for i, row in enumerate(rows):
+            data.update({f'partners_list-{i}-{key}': value for key, value in row.items()})
+        return data
+
+    def test_save_writes_only_the_diff(self):
+        ana, bruno, carla = self.partners
+        formset = PartnerFormSet(self.formset_data([
+            {'id': ana.pk, 'name': 'Ana Maria', 'cpf': ana.cpf},             # alterada
+            {'id': bruno.pk, 'name': bruno.name, 'cpf': bruno.cpf},          # sem mudança
+            {'id': carla.pk, 'name': carla.name, 'cpf': carla.cpf, 'DELETE': 'on'},
+            {'name': 'Davi', 'cpf': '39053344705'},                          # novo
+        ]), instance=self.company)
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+        # SELECT + DELETE (o delete dispara os signals do histórico) + UPDATE + INSERT
+        with self.assertNumQueries(4):
+            formset.save()
+
+        partners = {p.name: p for p in self.company.partners_list.all()}
+        self.assertEqual(set(partners), {'Ana Maria', 'Bruno', 'Davi'})
+        self.assertEqual(partners['Davi'].cpf, '390.533.447-05')
+        self.assertEqual(partners['Davi'].cpf_normalized, '39053344705')
+
+    def test_unchanged_formset_saves_nothing(self):
+        formset = PartnerFormSet(self.formset_data([
+            {'id': partner.pk, 'name': partner.name, 'cpf': partner.cpf} for partner in self.partners
+        ]), instance=self.company)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with self.assertNumQueries(0):
+            formset.save()
+
+    def test_unbound_formset_loads_one_page(self):
+        PagedFormSet = type('PagedFormSet', (PartnerFormSet,), {'per_page': 2})
+
+        first = PagedFormSet(instance=self.company)
+        self.assertEqual([form.instance.name for form in first], ['Ana', 'Bruno'])
+        self.assertTrue(first.has_next)
+
+        second = PagedFormSet(instance=self.company, page=2)
+        self.assertEqual([form.instance.name for form in second], ['Carla'])
+        self.assertFalse(second.has_next)
+
+
+class CepIndexTests(TestCase):
+    """Índice de CEP offline (companies/cep.py) e o endpoint do autopreenchimento."""
+
+    ROWS = [
+        ('01310-100', 'Avenida Paulista', 'Bela Vista', 'São Paulo', 'SP'),
+        ('20040-002', 'Rua da Assembleia', 'Centro', 'Rio de Janeiro', 'RJ'),
+        ('01001000', 'Praça da Sé', 'Sé', 'São Paulo', 'SP'),
+        ('123', 'CEP inválido', '', '', ''),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cep@example.com', 'x', name='CEP')
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'cep.idx')
+        settings_override = override_settings(CEP_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def test_lookup(self):
+        self.assertEqual(write_index(self.ROWS, self.path), 3)
+        index = CepIndex(self.path)
+        self.addCleanup(index.close)
+
+        self.assertEqual(index.lookup('01310100'), {
+            'cep': '01310-100', 'address': 'Avenida Paulista', 'neighborhood': 'Bela Vista', 'city': 'São Paulo', 'state': 'SP',
+        })
+        self.assertEqual(index.lookup('01001-000')['address'], 'Praça da Sé')
+        self.assertIsNone(index.lookup('99999-999'))
+        self.assertIsNone(index.lookup('00000000'))
+        self.assertIsNone(index.lookup('123'))
+
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse('cep_lookup', args=['20040-002'])
+
+        self.assertEqual(self.client.get(url).status_code, 503)  # índice não gerado
+
+        write_index(self.ROWS, self.path)
+        reset_index()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['city'], 'Rio de Janeiro')
+        self.assertEqual(self.client.get(reverse('cep_lookup', args=['99999999'])).status_code, 404)
+
+
+class CompanyCnpjTests(TestCase):
+    """CNPJ único pelo valor normalizado, no banco e no admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Única Ltda', cnpj='11.222.333/0001-81')
+
+    def test_database_rejects_other_punctuation(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Company.objects.create(legal_name='Cópia Ltda', cnpj='11222333000181')
+
+    def test_admin_form_cleans_cnpj(self):
+        form = CompanyAdminForm({'legal_name': 'Cópia Ltda', 'cnpj': '11222333000181', 'role_capabilities': '{}'})
+        self.assertIn('cnpj', form.errors)
+        form = CompanyAdminForm({'legal_name': 'Outra Ltda', 'cnpj': '11222333000100', 'role_capabilities': '{}'})
+        self.assertEqual(form.errors['cnpj'], ['CNPJ inválido.'])
+        form = CompanyAdminForm({'legal_name': 'Outra Ltda', 'cnpj': '11444777000161', 'role_capabilities': '{}'})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['cnpj'], '11.444.777/0001-61')
+
+
+class ExportTests(TestCase):
+    """Exportações: texto do usuário nunca vira fórmula na planilha."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='=HYPERLINK("http://x")', trade_name='+Fantasia', cnpj='11.222.333/0001-81')
+        Partner.objects.create(company=cls.company, name='@Ana', cpf='529.982.247-25')
+
+    def content(self, dataset, file_format):
+        response = export_response(dataset, [self.company.pk], file_format)
+        return b''.join(response.streaming_content)
+
+    def test_csv_neutralizes_formulas(self):
+        content = self.content('companies', 'csv').decode('utf-8-sig')
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', content)
+        self.assertIn(",'+Fantasia,", content)
+        self.assertIn(",'@Ana,", self.content('partners', 'csv').decode('utf-8-sig'))
+
+    def test_xlsx_writes_strings(self):
+        with zipfile.ZipFile(io.BytesIO(self.content('partners', 'xlsx'))) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c t="inlineStr"><is><t>@Ana</t></is></c>', sheet)
+        self.assertNotIn('<f>', sheet)
+
+    def test_without_companies_exports_only_active_company(self):
+        other = Company.objects.create(legal_name='Outra Ltda', trade_name='Outra', cnpj='45.723.174/0001-10')
+        Partner.objects.create(company=other, name='Bruno', cpf='111.444.777-35')
+        with self.assertRaises(NoActiveCompany):
+            export_response('partners')
+        with use_company(self.company):
+            response = export_response('partners')
+        # O corpo é lido depois que o middleware solta a empresa ativa
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertIn('@Ana', content)
+        self.assertNotIn('Bruno', content)
+
+
+@override_settings(AUDIT_ASYNC=False)
+class ChangeEventTests(TestCase):
+    """Histórico de alterações (companies/audit.py): diff campo a campo, gravado depois do commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_superuser('audit@example.com', 'x', name='Audit')
+        cls.company = Company.objects.create(legal_name='Audit Ltda', trade_name='Audit', cnpj='11.222.333/0001-81')
+
+    def test_update_records_only_changed_fields(self):
+        company = Company.objects.get(pk=self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            company.trade_name = 'Audit Nova'
+            company.city = 'Recife'
+            company.save()
+
+        event = ChangeEvent.objects.get(object_id=company.pk, action=ChangeEvent.ACTION_UPDATE)
+        self.assertEqual(event.changes, {'trade_name': ['Audit', 'Audit Nova'], 'city': ['', 'Recife']})
+
+    def test_save_without_changes_records_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.get(pk=self.company.pk).save()
+        self.assertFalse(ChangeEvent.objects.filter(action=ChangeEvent.ACTION_UPDATE).exists())
+
+    def test_rollback_discards_events(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Partner.objects.create(company=self.company, name='Rollback', cpf='529.982.247-25')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_history_view_keyset_pagination(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ['Ana', 'Bruno', 'Carla']:
+                Partner.objects.create(company=self.company, name=name, cpf='529.982.247-25')
+
+        self.client.force_login(self.staff)
+        url = reverse('admin:companies_company_history', args=[self.company.pk])
+        with mock.patch('companies.admin.HISTORY_PAGE_SIZE', 2):
+            first = self.client.get(url)
+            self.assertContains(first, 'Carla')
+            self.assertNotContains(first, 'Ana')
+            second = self.client.get(url, {'before': first.context['next_before']})
+        self.assertContains(second, 'Ana')
+        self.assertIsNone(second.context['next_before'])
+
+
+@override_settings(AUDIT_ASYNC=True, AUDIT_FLUSH_INTERVAL=30)
+class AuditWriterTests(TransactionTestCase):
+    """flush() (atexit) não perde o lote que a thread está juntando."""
+
+    def test_flush_writes_batch_in_progress(self):
+        writer = AuditWriter()
+        events = [
+            ChangeEvent(company_id=uuid.uuid4(), model='company', object_id=uuid.uuid4(), action=ChangeEvent.ACTION_UPDATE)
+            for _ in range(2)
+        ]
+        writer.put(events)
+
+        # A thread já tirou os eventos da fila e espera o lote encher (30 s)
+        deadline = time.monotonic() + 5
+        while not writer.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(writer.queue.empty())
+
+        writer.flush()
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual(ChangeEvent.objects.count(), 2)
+
+        # Depois do flush o próximo put sobe outra thread
+        writer.put([ChangeEvent(company_id=uuid.uuid4(), model='company', object_id=uuid.uuid4(), action=ChangeEvent.ACTION_CREATE)])
+        writer.flush()
+        self.assertEqual(ChangeEvent.objects.count(), 3)
+
+
+@override_settings(AUDIT_ASYNC=False)
+class CompanyStatsTests(TestCase):
+    """Contadores do dashboard: incrementais pelos signals e conferidos pelo reconcile."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Números Ltda', cnpj='11.222.333/0001-81')
+        cls.user = get_user_model().objects.create_user('numeros@example.com', 'x', name='Números')
+
+    def stats(self):
+        return CompanyStats.objects.get(company=self.company)
+
+    def test_partners_are_counted(self):
+        partner = Partner.objects.create(company=self.company, name='Ana', cpf='529.982.247-25')
+        Partner.objects.create(company=self.company, name='Bruno', cpf='111.444.777-35')
+        self.assertEqual(self.stats().partner_count, 2)
+        partner.delete()
+        self.assertEqual(self.stats().partner_count, 1)
+
+    def test_members_follow_role_and_status(self):
+        membership = Membership.objects.create(user=self.user, company=self.company, role=Membership.ROLE_BROKER)
+        self.assertEqual((self.stats().broker_count, self.stats().admin_count), (1, 0))
+
+        # Recarregado do banco: o post_init sabe onde o vínculo estava contado
+        membership = Membership.objects.get(pk=membership.pk)
+        membership.role = Membership.ROLE_ADMIN
+        membership.save()
+        self.assertEqual((self.stats().broker_count, self.stats().admin_count), (0, 1))
+
+        membership.is_active = False
+        membership.save()
+        self.assertEqual(self.stats().member_count, 0)
+
+    def test_formset_updates_counters_once(self):
+        Partner.objects.create(company=self.company, name='Ana', cpf='529.982.247-25')
+        partner = self.company.partners_list.get()
+        data = {
+            'partners_list-TOTAL_FORMS': 3, 'partners_list-INITIAL_FORMS': 1,
+            'partners_list-MIN_NUM_FORMS': 0, 'partners_list-MAX_NUM_FORMS': 1000,
+            'partners_list-0-id': partner.pk, 'partners_list-0-name': 'Ana', 'partners_list-0-cpf': partner.cpf,
+            'partners_list-0-DELETE': 'on',
+            'partners_list-1-name': 'Bruno', 'partners_list-1-cpf': '111.444.777-35',
+            'partners_list-2-name': 'Carla', 'partners_list-2-cpf': '935.411.347-80',
+        }
+        formset = PartnerFormSet(data, instance=self.company)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with CaptureQueriesContext(connection) as queries:
+            formset.save()
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "companies_companystats"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.stats().partner_count, 2)
+
+    def test_reconcile_fixes_drift_and_missing_rows(self):
+        Partner.objects.create(company=self.company, name='Ana', cpf='529.982.247-25')
+        Membership.objects.create(user=self.user, company=self.company, role=Membership.ROLE_FINANCIAL)
+        CompanyStats.objects.filter(company=self.company).update(partner_count=7, financial_count=0)
+        other = Company.objects.create(legal_name='Sem Números Ltda', cnpj='11.444.777/0001-61')
+        CompanyStats.objects.filter(company=other).delete()
+
+        self.assertEqual(reconcile(), (2, 2))
+        stats = self.stats()
+        self.assertEqual((stats.partner_count, stats.financial_count), (1, 1))
+        self.assertIsNotNone(stats.reconciled_at)
+        self.assertTrue(CompanyStats.objects.filter(company=other).exists())
+        self.assertEqual(reconcile(), (2, 0))
+
+    def test_home_shows_counters(self):
+        cache.clear()
+        local_cache.clear()
+        Membership.objects.create(user=self.user, company=self.company, role=Membership.ROLE_ADMIN)
+        Partner.objects.create(company=self.company, name='Ana', cpf='529.982.247-25')
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['stats'].partner_count, 1)
+        self.assertEqual(response.context['stats'].member_count, 1)
+
+
+@override_settings(AUDIT_ASYNC=False)
+class InviteMembersTests(TestCase):
+    """Convite em massa: queries fixas para qualquer tamanho de lista."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Convites Ltda', cnpj='11.222.333/0001-81')
+        cls.admin = get_user_model().objects.create_user('dona@example.com', 'x', name='Dona')
+        Membership.objects.create(user=cls.admin, company=cls.company, role=Membership.ROLE_ADMIN)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client.force_login(self.admin)
+
+    def invite(self, emails, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('invite_members'), {'emails': '\n'.join(emails), 'role': 'broker', **data})
+
+    def test_parse_reports_bad_lines(self):
+        invitations, errors = parse_invitations('email\nAna@Example.com\nana@example.com;admin\nnao-e-email\nbia@example.com,chefe\n')
+        self.assertEqual([(i.email, i.role) for i in invitations], [('ana@example.com', 'broker')])
+        self.assertEqual([line for line, _ in errors], [4, 5])
+
+    def test_queries_do_not_grow_with_the_list(self):
+        self.invite(['aquece@example.com'])  # Primeiro request carrega sessão e cache do tenant
+        counts = []
+        for size, prefix in ((3, 'a'), (30, 'b')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.invite([f'{prefix}{n}@example.com' for n in range(size)])
+            self.assertEqual(response.status_code, 302)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Membership.objects.filter(company=self.company, role=Membership.ROLE_BROKER).count(), 34)
+        self.assertEqual(CompanyStats.objects.get(company=self.company).broker_count, 34)
+
+    def test_existing_users_and_members(self):
+        existing = get_user_model().objects.create_user('antigo@example.com', 'x', name='Antigo')
+        self.invite(['antigo@example.com', 'dona@example.com', 'novo@example.com,financial'])
+
+        self.assertEqual(Membership.objects.get(user=existing, company=self.company).role, Membership.ROLE_BROKER)
+        self.assertEqual(Membership.objects.get(user=self.admin).role, Membership.ROLE_ADMIN)
+        new_user = get_user_model().objects.get(email='novo@example.com')
+        self.assertFalse(new_user.has_usable_password())
+        self.assertEqual(Membership.objects.get(user=new_user).role, Membership.ROLE_FINANCIAL)
+
+        # Um e-mail por vínculo novo; conta nova leva o link de definir senha (token aceito pelo allauth)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['antigo@example.com', 'novo@example.com'])
+        token = token_generator.make_token(new_user)
+        self.assertTrue(default_token_generator.check_token(new_user, token))
+        body = next(message.body for message in mail.outbox if message.to == ['novo@example.com'])
+        self.assertIn(token, body)
+
+    def test_existing_user_matches_email_case_insensitively(self):
+        # O cadastro só normaliza o domínio: a conta fica com maiúsculas
+        existing = get_user_model().objects.create_user('Ana.Silva@example.com', 'x', name='Ana')
+        self.invite(['ana.silva@example.com'])
+
+        self.assertEqual(get_user_model().objects.filter(email__iexact='ana.silva@example.com').count(), 1)
+        self.assertEqual(Membership.objects.get(user=existing, company=self.company).role, Membership.ROLE_BROKER)
+        self.assertEqual([message.to for message in mail.outbox], [['Ana.Silva@example.com']])
+
+    def test_concurrent_membership_is_not_counted_twice(self):
+        bulk_create = Membership.objects.bulk_create
+
+        def concurrent_bulk_create(memberships, **kwargs):
+            # Outro convite grava o vínculo de paralelo@ entre o SELECT e o INSERT
+            Membership.objects.create(user=get_user_model().objects.get(email='paralelo@example.com'), company=self.company)
+            return bulk_create(memberships, **kwargs)
+
+        with mock.patch.object(Membership.objects, 'bulk_create', side_effect=concurrent_bulk_create):
+            self.invite(['paralelo@example.com', 'sozinho@example.com'])
+
+        # Contador e histórico: um vínculo pelo outro convite, um por este; e-mail só do que entrou aqui
+        self.assertEqual(CompanyStats.objects.get(company=self.company).broker_count, 2)
+        self.assertEqual(Membership.objects.filter(company=self.company, role=Membership.ROLE_BROKER).count(), 2)
+        self.assertEqual(ChangeEvent.objects.filter(model='membership', action=ChangeEvent.ACTION_CREATE).count(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [['sozinho@example.com']])
+
+    def test_financial_cannot_invite_admins(self):
+        financial = get_user_model().objects.create_user('financeiro@example.com', 'x', name='Financeiro')
+        Membership.objects.create(user=financial, company=self.company, role=Membership.ROLE_FINANCIAL)
+        self.client.force_login(financial)
+
+        # Cargo padrão acima do seu: formulário inválido; por linha: vira erro e o resto segue
+        response = self.invite(['chefe@example.com'], role=Membership.ROLE_ADMIN)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('role', response.context['form'].errors)
+        self.invite(['chefe@example.com,admin', 'colega@example.com,financial'])
+
+        self.assertFalse(Membership.objects.filter(company=self.company, user__email='chefe@example.com').exists())
+        self.assertEqual(Membership.objects.get(user__email='colega@example.com').role, Membership.ROLE_FINANCIAL)
+        self.assertEqual(Membership.objects.filter(company=self.company, role=Membership.ROLE_ADMIN).count(), 1)
+
+    def test_inactive_member_is_reactivated_with_invited_role(self):
+        former = get_user_model().objects.create_user('ex@example.com', 'x', name='Ex')
+        membership = Membership.objects.create(user=former, company=self.company, role=Membership.ROLE_ADMIN, is_active=False)
+        self.invite(['ex@example.com'])
+
+        membership.refresh_from_db()
+        self.assertTrue(membership.is_active)
+        self.assertEqual(membership.role, Membership.ROLE_BROKER)
+        self.assertEqual(CompanyStats.objects.get(company=self.company).broker_count, 1)
+        self.assertEqual(ChangeEvent.objects.get(object_id=membership.pk, action=ChangeEvent.ACTION_UPDATE).changes['is_active'], [False, True])
+        self.assertEqual([message.to for message in mail.outbox], [['ex@example.com']])
+
+    def test_account_created_concurrently_gets_no_password_link(self):
+        User = get_user_model()
+        bulk_create = User.objects.bulk_create
+
+        def concurrent_bulk_create(users, **kwargs):
+            # Cadastro em paralelo grava a conta entre o SELECT e o INSERT
+            User.objects.create_user('cadastro@example.com', 'senha-dela', name='Cadastro')
+            return bulk_create(users, **kwargs)
+
+        with mock.patch.object(User.objects, 'bulk_create', side_effect=concurrent_bulk_create):
+            self.invite(['cadastro@example.com', 'novo@example.com'])
+
+        self.assertTrue(User.objects.get(email='cadastro@example.com').check_password('senha-dela'))
+        bodies = {message.to[0]: message.body for message in mail.outbox}
+        self.assertIn(reverse('account_login'), bodies['cadastro@example.com'])
+        self.assertNotIn('/password/reset/key/', bodies['cadastro@example.com'])
+        self.assertIn('/password/reset/key/', bodies['novo@example.com'])
+
+    def test_requires_manage_users(self):
+        broker = get_user_model().objects.create_user('corretor@example.com', 'x', name='Corretor')
+        Membership.objects.create(user=broker, company=self.company, role=Membership.ROLE_BROKER)
+        self.client.force_login(broker)
+        self.assertEqual(self.client.get(reverse('invite_members')).status_code, 403)
+
+
+def _cnpj(base):
+    # CNPJ válido a partir dos 12 primeiros dígitos (procura os verificadores)
+    return next(f'{base}{digits:02d}' for digits in range(100) if is_valid_cnpj(f'{base}{digits:02d}'))
+
+
+class ImportCompaniesTests(TestCase):
+    """Comando import_companies: lotes, deduplicação, arquivo de erros e checkpoint."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name, rows):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def run_import(self, path, **options):
+        stdout = io.StringIO()
+        call_command('import_companies', path, batch_size=2, no_copy=True, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def errors(self, path):
+        with open(f'{path}.errors.jsonl', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def company_rows(self):
+        Company.objects.create(legal_name='Já Existe Ltda', cnpj=format_cnpj(_cnpj('100000000001')))
+        return [
+            {'cnpj': _cnpj('200000000001'), 'legal_name': 'Primeira Ltda'},
+            {'cnpj': format_cnpj(_cnpj('200000000001')), 'legal_name': 'Repetida no arquivo'},
+            {'cnpj': _cnpj('100000000001'), 'legal_name': 'Repetida no banco'},
+            {'cnpj': '11222333000100', 'legal_name': 'CNPJ inválido'},
+            {'cnpj': _cnpj('200000000002'), 'legal_name': 'Segunda Ltda'},
+        ]
+
+    def test_companies_in_batches_with_dedupe_and_errors(self):
+        path = self.write('empresas.csv', self.company_rows())
+        output = self.run_import(path)
+
+        self.assertIn('2 linhas', output)  # Um progresso por lote
+        self.assertIn('4 linhas', output)
+        self.assertIn('Importação concluída: 2 criados, 3 erros', output)
+        self.assertEqual(
+            set(Company.objects.exclude(legal_name='Já Existe Ltda').values_list('legal_name', flat=True)),
+            {'Primeira Ltda', 'Segunda Ltda'},
+        )
+        self.assertEqual(CompanyStats.objects.filter(company__legal_name='Segunda Ltda').count(), 1)
+        errors = {error['line']: error['errors'] for error in self.errors(path)}
+        self.assertEqual(sorted(errors), [3, 4, 5])
+        self.assertEqual(errors[5], {'cnpj': ['CNPJ inválido.']})
+        self.assertFalse(os.path.exists(f'{path}.checkpoint.json'))
+
+    def test_resume_from_checkpoint_writes_each_error_once(self):
+        path = self.write('empresas.csv', self.company_rows())
+        original = Command.import_companies
+        calls = []
+
+        def crash_on_second_batch(command, batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError('queda no meio da importação')
+            return original(command, batch)
+
+        with mock.patch.object(Command, 'import_companies', autospec=True, side_effect=crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path)
+        with open(f'{path}.checkpoint.json', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['rows_done'], 2)
+        # Erro gravado por um lote que não chegou ao checkpoint (ex.: versão anterior do comando)
+        with open(f'{path}.errors.jsonl', 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'line': 4, 'errors': {}, 'row': {}}) + '\n')
+
+        output = self.run_import(path)
+        self.assertIn('Retomando a partir da linha de dados 3.', output)
+        self.assertIn('Importação concluída: 2 criados, 3 erros', output)
+        self.assertEqual(sorted(error['line'] for error in self.errors(path)), [3, 4, 5])
+        self.assertEqual(Company.objects.filter(legal_name='Primeira Ltda').count(), 1)
+
+    def test_memberships_match_email_case_and_count_inserted(self):
+        company = Company.objects.create(legal_name='Membros Ltda', cnpj=format_cnpj(_cnpj('300000000001')))
+        ana = get_user_model().objects.create_user('Ana.Silva@example.com', 'x', name='Ana')
+        bia = get_user_model().objects.create_user('bia@example.com', 'x', name='Bia')
+        Membership.objects.create(user=bia, company=company, role=Membership.ROLE_BROKER)
+        path = self.write('membros.csv', [
+            {'cnpj': company.cnpj, 'email': 'ana.silva@example.com', 'role': 'financial'},
+            {'cnpj': company.cnpj, 'email': 'ANA.SILVA@example.com', 'role': 'admin'},
+            {'cnpj': company.cnpj, 'email': 'bia@example.com', 'role': 'admin'},
+            {'cnpj': company.cnpj, 'email': 'ninguem@example.com', 'role': 'broker'},
+        ])
+        output = self.run_import(path, kind='memberships')
+
+        self.assertIn('Importação concluída: 1 criados, 3 erros', output)
+        self.assertEqual(Membership.objects.get(user=ana).role, Membership.ROLE_FINANCIAL)
+        self.assertEqual(Membership.objects.get(user=bia).role, Membership.ROLE_BROKER)
+        self.assertEqual(get_user_model().objects.filter(email__iexact='ana.silva@example.com').count(), 1)
+        self.assertEqual(CompanyStats.objects.get(company=company).financial_count, 1)
+        self.assertEqual(
+            [(error['line'], list(error['errors'])) for error in self.errors(path)],
+            [(3, ['email']), (4, ['email']), (5, ['email'])],
+        )
+
+    def test_copy_writes_json_fields_as_json(self):
+        # Como no PostgreSQL: o get_db_prep_save do JSONField devolve o adaptador Json (str() entre aspas)
+        class QuotedJson:
+            def __init__(self, value):
+                self.value = value
+
+            def __str__(self):
+                return f"'{json.dumps(self.value)}'"
+
+        company = Company(legal_name='Json Ltda', cnpj=format_cnpj(_cnpj('400000000001')), role_capabilities={'broker': {'grant': ['export_data']}})
+        field = Company._meta.get_field('role_capabilities')
+        with mock.patch.object(connection.ops, 'adapt_json_value', side_effect=lambda value, encoder: QuotedJson(value)):
+            value = Command()._copy_value(field, company)
+        self.assertEqual(json.loads(value), {'broker': {'grant': ['export_data']}})
+
+
+@override_settings(AUDIT_ASYNC=False)
+class PermissionTests(TestCase):
+    """Capacidades por cargo (companies/permissions.py): bitset, ajustes da empresa, decorator e template."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Permissões Ltda', cnpj='11.222.333/0001-81')
+        cls.broker = get_user_model().objects.create_user('corretor@example.com', 'x', name='Corretor')
+        cls.membership = Membership.objects.create(user=cls.broker, company=cls.company, role=Membership.ROLE_BROKER)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def names(self, mask):
+        return sorted(capability.name.lower() for capability in Capability if mask & capability)
+
+    def test_financial_capabilities(self):
+        # Qualquer mudança aqui muda o que o financeiro faz em todas as empresas (inclusive convidar)
+        self.assertEqual(self.names(compile_capabilities(Membership.ROLE_FINANCIAL)), [
+            'edit_company', 'export_data', 'manage_financing', 'manage_users',
+            'view_clients', 'view_company', 'view_dashboard', 'view_proposals',
+        ])
+        self.assertEqual(self.names(compile_capabilities(Membership.ROLE_BROKER)), ['view_clients', 'view_dashboard', 'view_proposals'])
+        self.assertEqual(compile_capabilities('desconhecido'), 0)
+
+    def test_company_overrides(self):
+        overrides = {'broker': {'grant': ['export_data'], 'revoke': ['view_clients']}}
+        self.assertEqual(self.names(compile_capabilities(Membership.ROLE_BROKER, overrides)), ['export_data', 'view_dashboard', 'view_proposals'])
+        # Ajuste de um cargo não vaza para os outros
+        self.assertEqual(compile_capabilities(Membership.ROLE_ADMIN, overrides), int(ALL))
+
+    def test_validate_role_capabilities(self):
+        validate_role_capabilities({'broker': {'grant': ['export_data'], 'revoke': []}})
+        for value in (
+            [],
+            {'chefe': {'grant': []}},
+            {'broker': ['export_data']},
+            {'broker': {'grant': [], 'extra': []}},
+            {'broker': {'grant': ['voar']}},
+            {'broker': {'grant': [1]}},
+        ):
+            with self.subTest(value=value), self.assertRaises(ValidationError):
+                validate_role_capabilities(value)
+
+    def test_capability_required_and_request_can(self):
+        self.client.force_login(self.broker)
+        self.assertEqual(self.client.get(reverse('company_update')).status_code, 403)
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.wsgi_request.can('view_dashboard'))
+        self.assertFalse(response.wsgi_request.can('view_dashboard', 'edit_company'))
+
+        # Ajuste da empresa vale no próximo request (o save invalida o cache do tenant)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.role_capabilities = {'broker': {'grant': ['edit_company', 'view_company']}}
+            self.company.save()
+        self.assertEqual(self.client.get(reverse('company_update')).status_code, 200)
+
+    def test_can_filter(self):
+        template = Template('{% load permissions %}{% if request|can:"view_dashboard" %}A{% endif %}'
+                            '{% if request|can:"view_dashboard,export_data" %}B{% endif %}')
+        request = RequestFactory().get('/')
+        self.assertEqual(template.render(Context({'request': request})), '')  # Sem vínculo: nada
+        request.membership = Membership.objects.select_related('company').get(pk=self.membership.pk)
+        self.assertEqual(template.render(Context({'request': request})), 'A')
+
+
+@override_settings(AUDIT_ASYNC=False)
+class TenantCacheTests(TestCase):
+    """resolve_tenant: acerto no cache sem query; invalidação depois do commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(legal_name='Cache Ltda', cnpj='11.222.333/0001-81')
+        cls.user = get_user_model().objects.create_user('cache@example.com', 'x', name='Cache')
+        cls.membership = Membership.objects.create(user=cls.user, company=cls.company, role=Membership.ROLE_BROKER)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_warm_hit_costs_no_queries(self):
+        with self.assertNumQueries(1):
+            resolve_tenant(self.user)
+        # LRU local, depois só o cache compartilhado: nenhuma query, capacidades já calculadas
+        for clear_local in (False, True):
+            if clear_local:
+                local_cache.clear()
+            with self.subTest(clear_local=clear_local), self.assertNumQueries(0):
+                membership = resolve_tenant(self.user, self.company.pk)
+                self.assertEqual(membership.company.legal_name, 'Cache Ltda')
+                self.assertEqual(membership.capabilities, compile_capabilities(Membership.ROLE_BROKER))
+                self.assertEqual(resolve_tenant(self.user).pk, self.membership.pk)
+
+    def test_saves_and_deletes_invalidate_after_commit(self):
+        resolve_tenant(self.user)
+        membership = Membership.objects.get(pk=self.membership.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            membership.role = Membership.ROLE_FINANCIAL
+            membership.save()
+            # Antes do commit o cache continua com o valor antigo (outro request não recacheia o novo)
+            self.assertEqual(resolve_tenant(self.user).role, Membership.ROLE_BROKER)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(resolve_tenant(self.user, self.company.pk).role, Membership.ROLE_FINANCIAL)
+
+        company = Company.objects.get(pk=self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            company.legal_name = 'Cache Nova Ltda'
+            company.save()
+        self.assertEqual(resolve_tenant(self.user).company.legal_name, 'Cache Nova Ltda')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.delete()
+        self.assertIsNone(resolve_tenant(self.user))
+        self.assertIsNone(resolve_tenant(self.user, self.company.pk))
@@ -1,8 +1,27 @@
+from django.conf import settings
 from django.urls import path
+from core.routing import route_policy, AUTH_ONLY
 from . import views
 
+# Cadastro da empresa: precisa estar logado, mas ainda não tem empresa
+route_policy(AUTH_ONLY, 'create_company')
+# Consulta de documentos é da equipe (staff), não depende da empresa atual
+route_policy(AUTH_ONLY, 'company_lookup')
+# Troca de empresa funciona mesmo se a empresa atual tiver sido desativada
+route_policy(AUTH_ONLY, 'switch_company')  # Rota com parâmetro: vale o trecho antes dele
+# Autopreenchimento de endereço, usado também no cadastro (ainda sem empresa)
+route_policy(AUTH_ONLY, 'cep_lookup')
+
+# View async só com a pilha async (ASGI + ASYNC_GATES); no WSGI a síncrona evita o event loop por request
+company_detail = views.acompany_detail if settings.ASYNC_GATES else views.company_detail
+
 urlpatterns = [
     path('new/', views.create_company, name='create_company'),
-    path('profile/', views.company_detail, name='company_detail'),
+    path('profile/', company_detail, name='company_detail'),
     path('profile/edit/', views.company_update, name='company_update'),
+    path('switch/<uuid:company_id>/', views.switch_company, name='switch_company'),
+    path('lookup/', views.company_lookup, name='company_lookup'),
+    path('cep/<str:cep>/', views.cep_lookup, name='cep_lookup'),
+    path('export/<str:dataset>/', views.company_export, name='company_export'),
+    path('members/invite/', views.invite_members, name='invite_members'),
 ]
\ No newline at end of file
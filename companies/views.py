@@ -1,10 +1,24 @@
 from django.shortcuts import render, redirect
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db import transaction # Importante para salvar Pai e Filhos juntos
-from .forms import CompanyCreateForm, PartnerFormSet # Importamos o Formset aqui
-from .models import Membership
-from .decorators import role_required
+from django.db import IntegrityError, transaction # Importante para salvar Pai e Filhos juntos
+from django.http import Http404, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.text import slugify
+from .forms import CompanyCreateForm, InviteMembersForm, PartnerFormSet # Importamos o Formset aqui
+from .models import Company, Membership, Partner
+from .decorators import capability_required
+from .permissions import grantable_roles
+from .exports import DATASETS, export_response
+from .cep import get_index
+from .stats import dashboard_stats
+from . import invitations
+from .documents import companies_for_document, normalize_cnpj
+from .tenancy import TENANT_SESSION_KEY, user_companies
 
 @login_required
 def create_company(request):
@@ -15,26 +29,32 @@ def create_company(request):
         
         # Valida tanto a empresa quanto a lista de sócios
         if form.is_valid() and formset.is_valid():
-            with transaction.atomic(): # Garante que salva tudo ou nada
-                # 1. Salva a empresa
-                company = form.save(commit=False)
-                company.updated_by = request.user
-                company.save()
-                
-                # 2. Cria o vínculo de Admin
-                Membership.objects.create(
-                    user=request.user,
-                    company=company,
-                    role=Membership.ROLE_ADMIN,
-                    is_active=True
-                )
-                
-                # 3. Salva os sócios vinculados a essa empresa
-                formset.instance = company
-                formset.save()
-                
-            messages.success(request, 'Empresa e sócios cadastrados com sucesso!')
-            return redirect('home')
+            try:
+                with transaction.atomic(): # Garante que salva tudo ou nada
+                    # 1. Salva a empresa
+                    company = form.save(commit=False)
+                    company.updated_by = request.user
+                    company.save()
+
+                    # 2. Cria o vínculo de Admin
+                    Membership.objects.create(
+                        user=request.user,
+                        company=company,
+                        role=Membership.ROLE_ADMIN,
+                        is_active=True
+                    )
+
+                    # 3. Salva os sócios vinculados a essa empresa
+                    formset.instance = company
+                    formset.save()
+            except IntegrityError:
+                # Dois cadastros do mesmo CNPJ ao mesmo tempo: o validate_unique passou nos dois, o banco barrou um
+                if not Company.objects.filter(cnpj_normalized=normalize_cnpj(form.cleaned_data['cnpj'])).exists():
+                    raise
+                form.add_error('cnpj', 'Já existe uma empresa cadastrada com este CNPJ.')
+            else:
+                messages.success(request, 'Empresa e sócios cadastrados com sucesso!')
+                return redirect('home')
     else:
         # Lógica: Se for o primeiro acesso (GET)
         form = CompanyCreateForm()
@@ -46,21 +66,51 @@ def create_company(request):
     })
 
 @login_required
-@role_required([Membership.ROLE_ADMIN, Membership.ROLE_FINANCIAL])
+def dashboard(request):
+    # Home: números da empresa atual, lidos dos contadores (CompanyStats), sem COUNT
+    return render(request, 'pages/home.html', {'stats': dashboard_stats()})
+
+@login_required
+@capability_required('view_company')
 def company_detail(request):
-    # Esta é a view que estava faltando e causando o erro!
     # O middleware já colocou a empresa em request.company
-    return render(request, 'companies/company_detail.html', {'company': request.company})
+    company = request.company
+
+    return render(request, 'companies/company_detail.html', {
+        'company': company,
+        'partners': list(Partner.scoped.order_by('name', 'pk')),
+        'updated_by': company.updated_by,
+    })
 
 @login_required
-@role_required([Membership.ROLE_ADMIN, Membership.ROLE_FINANCIAL])
+@capability_required('view_company')
+async def acompany_detail(request):
+    # Versão async de company_detail, só para o ASGI com ASYNC_GATES (ver urls.py).
+    # No WSGI uma view async paga um event loop (async_to_sync) por request
+    company = request.company
+
+    # Carrega pelo ORM async tudo o que o template usaria: o render é síncrono,
+    # e query lazy durante o render levantaria SynchronousOnlyOperation
+    partners = [partner async for partner in Partner.scoped.order_by('name', 'pk')]
+    updated_by = None
+    if company.updated_by_id:
+        updated_by = await get_user_model().objects.filter(pk=company.updated_by_id).afirst()
+
+    return render(request, 'companies/company_detail.html', {
+        'company': company,
+        'partners': partners,
+        'updated_by': updated_by,
+    })
+
+@login_required
+@capability_required('edit_company')
 def company_update(request):
     company = request.company
     
     if request.method == 'POST':
         form = CompanyCreateForm(request.POST, instance=company)
         # Passamos 'instance=company' para o formset saber quais sócios carregar
-        formset = PartnerFormSet(request.POST, instance=company) 
+        formset = PartnerFormSet(request.POST, instance=company, queryset=Partner.scoped.all(), page=request.GET.get('page'))
         
         if form.is_valid() and formset.is_valid():
             with transaction.atomic():
@@ -68,15 +118,102 @@ def company_update(request):
                 company.updated_by = request.user
                 company.save()
                 
-                formset.save() # Salva edições, novos e deleções
+                formset.save() # Salva edições, novos e deleções (em lote, só o que mudou)
             
             messages.success(request, 'Dados atualizados com sucesso!')
             return redirect('company_detail')
     else:
         form = CompanyCreateForm(instance=company)
-        formset = PartnerFormSet(instance=company)
+        # Só uma página de sócios (?page=N): empresas com centenas de sócios abrem rápido
+        formset = PartnerFormSet(instance=company, queryset=Partner.scoped.all(), page=request.GET.get('page'))
 
     return render(request, 'companies/company_update.html', {
         'form': form,
         'formset': formset
-    })
\ No newline at end of file
+    })
+
+INVITE_ERRORS_SHOWN = 10
+
+@login_required
+@capability_required('manage_users')
+def invite_members(request):
+    # Convite em massa: poucas queries para qualquer tamanho de lista, e-mails pela fila (outbox)
+    # Só cargos até o de quem convida (o financeiro também gerencia usuários)
+    allowed_roles = grantable_roles(request.membership.role)
+    if request.method == 'POST':
+        form = InviteMembersForm(request.POST, request.FILES, allowed_roles=allowed_roles)
+        if form.is_valid():
+            with transaction.atomic():
+                result = invitations.invite_members(request, form.cleaned_data['invitations'])
+
+            messages.success(
+                request,
+                f'{result.added} membros adicionados ({result.created_users} contas novas). '
+                f'{result.already_members} já eram membros.',
+            )
+            for line_number, error in form.line_errors[:INVITE_ERRORS_SHOWN]:
+                messages.warning(request, f'Linha {line_number}: {error}')
+            if len(form.line_errors) > INVITE_ERRORS_SHOWN:
+                messages.warning(request, f'... e mais {len(form.line_errors) - INVITE_ERRORS_SHOWN} linhas com erro.')
+            return redirect('invite_members')
+    else:
+        form = InviteMembersForm(allowed_roles=allowed_roles)
+
+    return render(request, 'companies/invite_members.html', {'form': form})
+
+@login_required
+@capability_required('export_data')
+def company_export(request, dataset):
+    # Exporta os dados da empresa atual em streaming (?format=csv ou ?format=xlsx)
+    file_format = request.GET.get('format', 'csv')
+    if dataset not in DATASETS or file_format not in ('csv', 'xlsx'):
+        raise Http404
+
+    # Sem lista de empresas: managers scoped (empresa ativa)
+    return export_response(dataset, file_format=file_format, filename=f'{dataset}-{slugify(str(request.company))}')
+
+
+@login_required
+@require_POST
+def switch_company(request, company_id):
+    # Troca a empresa ativa: confere na lista em cache (sem query) e grava o contexto na sessão
+    company_id = str(company_id)
+    choice = next((choice for choice in user_companies(request.user) if choice.company_id == company_id), None)
+    if choice is None:
+        raise Http404
+
+    request.session[TENANT_SESSION_KEY] = [choice.company_id, choice.membership_id, choice.role]
+
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        next_url = 'home'
+    return redirect(next_url)
+
+
+LOOKUP_LIMIT = 50
+
+@staff_member_required
+def company_lookup(request):
+    # Empresas de um CPF (sócio) ou CNPJ: ?document=... (com ou sem máscara)
+    document = normalize_cnpj(request.GET.get('document'))
+    if len(document) not in (11, 14):
+        return JsonResponse({'error': 'Informe um CPF (11 dígitos) ou CNPJ (14 caracteres).'}, status=400)
+
+    companies = companies_for_document(document).order_by('pk').values('id', 'cnpj', 'legal_name', 'trade_name')[:LOOKUP_LIMIT]
+    return JsonResponse({'document': document, 'results': list(companies)})
+
+
+@login_required
+def cep_lookup(request, cep):
+    # Endereço do CEP no índice local (companies/cep.py): sem rede, microssegundos
+    index = get_index()
+    if index is None:
+        return JsonResponse({'error': 'Índice de CEP indisponível.'}, status=503)
+
+    address = index.lookup(cep)
+    if address is None:
+        return JsonResponse({'error': 'CEP não encontrado.'}, status=404)
+
+    response = JsonResponse(address)
+    patch_cache_control(response, private=True, max_age=86400)
+    return response
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        # Servidor web (gunicorn.conf.py liga): URLs e templates prontos antes do primeiro request.
+        # Só memória, nada de banco aqui (ver core/warmup.py)
+        if getattr(settings, 'WARMUP_ON_READY', False):
+            from .warmup import warm_up
+            warm_up(connect=False)
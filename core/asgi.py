@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Ajusta o settings para o ASGI (ex.: CONN_MAX_AGE=0, ver core/settings.py)
+os.environ.setdefault('SERVER_MODE', 'asgi')
 
 application = get_asgi_application()
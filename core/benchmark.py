@@ -0,0 +1,19 @@
+"""
+Utilitários para os comandos de benchmark (manage.py bench_*).
+"""
+import statistics
+import timeit
+
+
+def measure(func, number=10000, repeat=5):
+    """
+    Executa func `number` vezes, `repeat` rodadas.
+    Retorna o custo por chamada em nanossegundos (melhor rodada e mediana).
+    """
+    timings = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    per_call = [t / number * 1e9 for t in timings]
+    return {'best_ns': min(per_call), 'median_ns': statistics.median(per_call)}
+
+
+def format_row(label, result, width=40):
+    return f"{label:<{width}} {result['best_ns']:>10.0f} ns  (mediana {result['median_ns']:.0f} ns)"
@@ -0,0 +1,243 @@
+"""
+Instrumentação por request: Server-Timing + spans no Sentry.
+
+O ServerTimingMiddleware (primeiro da lista) sorteia os requests medidos
+(settings.SERVER_TIMING_SAMPLE_RATE). Nos sorteados ele guarda um
+RequestMetrics num ContextVar; o resto do código só registra números nele:
+
+    with timed('tenant'):       # trecho cronometrado (vira span no Sentry)
+        ...
+    count('tenant_cache_hit')   # contador
+
+Fora da amostra o ContextVar fica vazio e cada chamada custa uma leitura
+do ContextVar: o overhead com 100% do tráfego é desprezível.
+
+O header só vai para a resposta com DEBUG ou para usuários staff: ele
+expõe contagem de queries, cache e etapas do tenant.
+
+Etapas no header:
+    mw      middlewares até chegar na view (inclui auth e tenant)
+    auth    sessão + usuário (LoginRequiredMiddleware)
+    tenant  resolução do Membership/Company (CompanyMiddleware)
+    view    view, incluindo a renderização e os middlewares na volta
+    tpl     renderização de templates (backend InstrumentedDjangoTemplates)
+    db      queries (todas as conexões)
+    cache   hits/misses do cache de tenant
+"""
+import random
+import sys
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}  # etapa -> ms (acumulado)
+        self.counters = {}
+        self.db_queries = 0
+        self.db_ms = 0.0
+
+    def add(self, name, ms):
+        self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        # Instalado em todas as conexões durante o request (connection.execute_wrapper)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_ms += (time.perf_counter() - start) * 1000
+
+    def server_timing(self):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        entries = [f'{name};dur={ms:.1f}' for name, ms in self.durations.items()]
+        entries.append(f'db;dur={self.db_ms:.1f};desc="{self.db_queries} queries"')
+        hits = self.counters.get('tenant_cache_hit', 0)
+        misses = self.counters.get('tenant_cache_miss', 0)
+        if hits or misses:
+            entries.append(f'cache;desc="tenant {hits} hit / {misses} miss"')
+        entries.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def count(name, amount=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.counters[name] = metrics.counters.get(name, 0) + amount
+
+
+@contextmanager
+def timed(name):
+    """Cronometra o trecho no request atual (se estiver na amostra) e abre um span no Sentry."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    with _sentry_span(f'app.{name}'):
+        try:
+            yield
+        finally:
+            metrics.add(name, (time.perf_counter() - start) * 1000)
+
+
+def _sentry_active():
+    # O settings só importa o sentry_sdk quando há DSN: sem ele no sys.modules não há Sentry
+    # (e o import, caro, não vai parar no primeiro request do worker)
+    sentry_sdk = sys.modules.get('sentry_sdk')
+    return sentry_sdk is not None and sentry_sdk.get_client().is_active()
+
+
+def tag_tenant(membership):
+    """
+    Marca o Sentry com a empresa e o cargo do request (CompanyMiddleware, logo
+    que o tenant é resolvido): erros da view já saem com as tags.
+    """
+    if not _sentry_active():
+        return
+    import sentry_sdk
+    sentry_sdk.set_tag('company', str(membership.company_id))
+    sentry_sdk.set_tag('role', membership.role)
+
+
+@contextmanager
+def _sentry_span(op):
+    if not _sentry_active():
+        yield
+        return
+    import sentry_sdk
+    with sentry_sdk.start_span(op=op, name=op):
+        yield
+
+
+class ServerTimingMiddleware:
+    """
+    Primeiro middleware da lista. Nos requests sorteados mede as etapas,
+    conta queries/cache e devolve o header Server-Timing (só DEBUG/staff),
+    com os mesmos números no span do Sentry. As tags de empresa/cargo ficam
+    no CompanyMiddleware (tag_tenant).
+    """
+    # Async nativo no ASGI: sendo o primeiro da lista, um middleware só sync
+    # faria o Django embrulhar toda a cadeia async em sync_to_async/async_to_sync
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0.0)
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # process_view síncrono também viraria um sync_to_async por request
+            self.process_view = self._aprocess_view
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if not self._sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self._wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        self._finish(request, response, metrics, getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        # Mesmos passos do __call__; o usuário vem do auser() (sem query síncrona)
+        if not self._sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self._wrap_connections(metrics):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        auser = getattr(request, 'auser', None)
+        self._finish(request, response, metrics, await auser() if auser else None)
+        return response
+
+    @contextmanager
+    def _wrap_connections(self, metrics):
+        with ExitStack() as stack:
+            # O wrapper fica no objeto da conexão: vale mesmo se ela só abrir depois
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.execute_wrapper))
+            yield
+
+    def _finish(self, request, response, metrics, user):
+        # Da entrada na view até aqui (inclui os middlewares na volta)
+        view_start = getattr(request, '_timing_view_start', None)
+        if view_start is not None:
+            metrics.add('view', (time.perf_counter() - view_start) * 1000)
+        # Queries, cache e etapas do tenant não vão para qualquer cliente
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = metrics.server_timing()
+        self._span_data(metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            now = time.perf_counter()
+            metrics.add('mw', (now - metrics.started) * 1000)
+            request._timing_view_start = now
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.process_view(request, view_func, view_args, view_kwargs)
+
+    def _span_data(self, metrics):
+        if not _sentry_active():
+            return
+        import sentry_sdk
+
+        span = sentry_sdk.get_current_span()
+        if span is not None:
+            span.set_data('db.queries', metrics.db_queries)
+            span.set_data('db.ms', round(metrics.db_ms, 1))
+            for name, value in metrics.counters.items():
+                span.set_data(name, value)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('tpl'):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates que cronometra cada render (etapa 'tpl' do Server-Timing)."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
@@ -0,0 +1,153 @@
+"""
+Envio de e-mail em segundo plano (outbox).
+
+EMAIL_BACKEND = 'core.mail.OutboxEmailBackend' faz send_mail (e o allauth)
+só gravar a mensagem na tabela OutboxEmail: o request não espera o SMTP.
+Como a gravação entra na transação do request, um cadastro desfeito não
+deixa e-mail para trás.
+
+O comando send_outbox lê os pendentes em lote e envia todos pela mesma
+conexão do backend real (OUTBOX_EMAIL_BACKEND: SMTP em produção, console,
+locmem ou file em desenvolvimento e testes). Falhou? Nova tentativa com
+espera exponencial, até OUTBOX_MAX_ATTEMPTS.
+
+Em produção o worker precisa estar rodando: manage.py send_outbox --loop.
+Com DEBUG o EMAIL_BACKEND padrão é o console (códigos do allauth aparecem
+direto no terminal, sem worker).
+"""
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+def _encode_attachment(attachment):
+    filename, content, mimetype = attachment
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return [filename, base64.b64encode(content).decode('ascii'), mimetype]
+
+
+def to_outbox(message):
+    """EmailMessage -> OutboxEmail (sem gravar)."""
+    return OutboxEmail(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[[content, mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+        # Anexos MIME já montados não são suportados (o allauth não usa anexos)
+        attachments=[_encode_attachment(attachment) for attachment in message.attachments],
+    )
+
+
+def from_outbox(row, connection=None):
+    """OutboxEmail -> EmailMultiAlternatives pronto para o backend real."""
+    message = EmailMultiAlternatives(
+        subject=row.subject, body=row.body, from_email=row.from_email,
+        to=row.to, cc=row.cc, bcc=row.bcc, reply_to=row.reply_to, headers=row.headers,
+        connection=connection,
+    )
+    for content, mimetype in row.alternatives:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in row.attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Backend que só enfileira: uma query (INSERT em lote) por chamada."""
+
+    def send_messages(self, email_messages):
+        rows = [to_outbox(message) for message in email_messages if message.recipients()]
+        if rows:
+            OutboxEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def retry_delay(attempts):
+    # 1 min, 2, 4, 8... até OUTBOX_RETRY_MAX_DELAY
+    base = getattr(settings, 'OUTBOX_RETRY_BASE_DELAY', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), getattr(settings, 'OUTBOX_RETRY_MAX_DELAY', 3600)))
+
+
+def claim_batch(batch_size):
+    """
+    Reserva um lote de pendentes vencidos numa transação curta: a trava
+    (skip_locked) só dura o UPDATE que empurra o next_attempt_at para frente.
+    Outro worker não pega as linhas até OUTBOX_CLAIM_SECONDS passar.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if rows:
+            lease = now + timedelta(seconds=getattr(settings, 'OUTBOX_CLAIM_SECONDS', 300))
+            OutboxEmail.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=lease)
+    return rows
+
+
+def send_batch(batch_size=100):
+    """
+    Envia um lote de pendentes vencidos por uma conexão só.
+    Retorna (enviados, falhas). Vários workers podem rodar juntos (ver claim_batch).
+
+    O envio fica fora de transação e o resultado de cada mensagem é gravado
+    logo depois dela: se o worker cair no meio do lote, só a mensagem em
+    andamento pode sair de novo (depois da reserva vencer), não o lote todo.
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    sent = failed = 0
+
+    # 1. Reserva o lote (transação curta)
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0, 0
+
+    # 2. Envia tudo pela mesma conexão (um handshake SMTP por lote), sem trava nenhuma no banco
+    connection = get_connection(settings.OUTBOX_EMAIL_BACKEND, fail_silently=False)
+    try:
+        for row in rows:
+            try:
+                # Abre só se não estiver aberta: send_messages não fecha a conexão que recebeu aberta
+                connection.open()
+                connection.send_messages([from_outbox(row, connection)])
+            except Exception as exc:
+                row.attempts += 1
+                row.last_error = f'{type(exc).__name__}: {exc}'[:2000]
+                if row.attempts >= max_attempts:
+                    row.status = OutboxEmail.STATUS_FAILED
+                else:
+                    row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+                failed += 1
+                # A conexão pode ter caído: a próxima mensagem abre outra
+                connection.close()
+            else:
+                row.attempts += 1
+                row.status = OutboxEmail.STATUS_SENT
+                row.sent_at = timezone.now()
+                row.last_error = ''
+                sent += 1
+
+            # 3. Resultado gravado na hora (autocommit, um UPDATE pela PK)
+            OutboxEmail.objects.filter(pk=row.pk).update(
+                status=row.status, attempts=row.attempts, next_attempt_at=row.next_attempt_at,
+                last_error=row.last_error, sent_at=row.sent_at,
+            )
+    finally:
+        connection.close()
+
+    return sent, failed
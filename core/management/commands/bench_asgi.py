@@ -0,0 +1,91 @@
+import asyncio
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+
+from companies import urls as company_urls, views
+from companies.middleware import CompanyMiddleware
+from companies.models import Company, Membership
+from core.middleware import LoginRequiredMiddleware
+
+
+@contextmanager
+def gates_mode(async_capable):
+    """
+    Liga/desliga o modo async dos porteiros e a view async do perfil
+    (o mesmo que settings.ASYNC_GATES, que só vale no import).
+    """
+    previous = LoginRequiredMiddleware.async_capable
+    profile = next(pattern for pattern in company_urls.urlpatterns if pattern.name == 'company_detail')
+    previous_view = profile.callback
+    LoginRequiredMiddleware.async_capable = CompanyMiddleware.async_capable = async_capable
+    profile.callback = views.acompany_detail if async_capable else views.company_detail
+    try:
+        yield
+    finally:
+        LoginRequiredMiddleware.async_capable = CompanyMiddleware.async_capable = previous
+        profile.callback = previous_view
+
+
+class Command(BaseCommand):
+    help = 'Compara requests/s da mesma pilha de middlewares sob WSGI (Client) e ASGI (AsyncClient).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests por cenário')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests simultâneos no ASGI')
+        parser.add_argument('--path', action='append', dest='paths', help='Caminho a medir (pode repetir)')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        concurrency = options['concurrency']
+        paths = options['paths'] or ['/companies/profile/', '/']
+
+        # Libera o host 'testserver' dos clients de teste
+        setup_test_environment()
+
+        # 1. Usuário e empresa descartáveis (removidos no final)
+        user = get_user_model().objects.create_user(f'bench-{uuid.uuid4().hex[:8]}@example.com', 'bench', name='Bench')
+        company = Company.objects.create(legal_name='Bench Ltda', cnpj=uuid.uuid4().hex[:14], updated_by=user)
+        Membership.objects.create(user=user, company=company, role=Membership.ROLE_ADMIN)
+
+        try:
+            for path in paths:
+                self.stdout.write(f'{path}')
+                self.stdout.write(f'  WSGI                  sequencial {self._bench_wsgi(user, path, total):>8.0f} req/s')
+                for async_gates in (False, True):
+                    label = 'porteiros async' if async_gates else 'porteiros sync '
+                    with gates_mode(async_gates):
+                        sequential = asyncio.run(self._bench_asgi(user, path, total, 1))
+                        concurrent = asyncio.run(self._bench_asgi(user, path, total, concurrency))
+                    self.stdout.write(f'  ASGI  {label} sequencial {sequential:>8.0f} req/s | concorrência {concurrency}: {concurrent:.0f} req/s')
+        finally:
+            company.delete()
+            user.delete()
+
+    def _bench_wsgi(self, user, path, total):
+        client = Client()
+        client.force_login(user)
+        client.get(path)  # Aquece caches (tenant, templates)
+
+        start = time.perf_counter()
+        for _ in range(total):
+            client.get(path)
+        return total / (time.perf_counter() - start)
+
+    async def _bench_asgi(self, user, path, total, concurrency):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        await client.get(path)
+
+        async def worker(count):
+            for _ in range(count):
+                await client.get(path)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(total // concurrency) for _ in range(concurrency)))
+        return (total // concurrency) * concurrency / (time.perf_counter() - start)
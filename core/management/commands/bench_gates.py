@@ -0,0 +1,61 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+
+from companies.middleware import CompanyMiddleware
+from core.benchmark import format_row, measure
+from core.middleware import LoginRequiredMiddleware
+from core.routing import PUBLIC, TENANT, get_route_matcher
+
+SAMPLE_PATHS = [
+    '/',
+    '/companies/profile/',
+    '/companies/new/',
+    '/accounts/login/',
+    '/accounts/logout/',
+    '/admin/companies/company/',
+    '/static/css/app.css',
+]
+
+
+def legacy_gates(path):
+    # Cópia da lógica antiga dos dois middlewares (listas + reverse por request)
+    public_paths = ['/accounts/', '/admin/', '/static/', '/media/']
+    is_public = any(path.startswith(p) for p in public_paths)
+
+    exempt_paths = [reverse('create_company'), '/admin/', '/accounts/logout/', '/static/', '/media/']
+    is_exempt = any(path.startswith(p) for p in exempt_paths)
+    return is_public, is_exempt
+
+
+class Command(BaseCommand):
+    help = 'Mede o custo por request dos porteiros (LoginRequiredMiddleware + CompanyMiddleware).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help='Chamadas por rodada')
+        parser.add_argument('--repeat', type=int, default=5, help='Quantidade de rodadas')
+
+    def handle(self, *args, **options):
+        number, repeat = options['number'], options['repeat']
+        matcher = get_route_matcher()
+
+        def compiled_gates(path):
+            policy = matcher(path)
+            return policy == PUBLIC, policy != TENANT
+
+        # 1. Só a decisão (qual política vale para o path)
+        self.stdout.write('Decisão por path:')
+        for path in SAMPLE_PATHS:
+            legacy = measure(lambda: legacy_gates(path), number, repeat)
+            compiled = measure(lambda: compiled_gates(path), number, repeat)
+            self.stdout.write(format_row(f'  legado    {path}', legacy))
+            self.stdout.write(format_row(f'  compilado {path}', compiled))
+
+        # 2. Cadeia completa dos dois middlewares (anônimo em rota pública: passa direto)
+        chain = LoginRequiredMiddleware(CompanyMiddleware(lambda request: HttpResponse()))
+        request = RequestFactory().get('/accounts/login/')
+        request.user = AnonymousUser()
+        self.stdout.write('')
+        self.stdout.write(format_row('Cadeia completa (anônimo, /accounts/login/)', measure(lambda: chain(request), number, repeat), 48))
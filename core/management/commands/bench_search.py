@@ -0,0 +1,85 @@
+import random
+import time
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from companies.models import Company
+from core.search import search_queryset
+
+BENCH_PREFIX = 'BS'  # CNPJ das empresas semeadas: BS + 12 dígitos
+
+WORDS = [
+    'Comércio', 'Serviços', 'Contabilidade', 'Construtora', 'Transportes', 'Alimentos', 'Tecnologia',
+    'Consultoria', 'Distribuidora', 'Indústria', 'Farmácia', 'Açougue', 'Padaria', 'Imobiliária',
+    'Paulista', 'Mineira', 'Gaúcha', 'Nordeste', 'Brasil', 'São', 'João', 'Irmãos', 'Silva', 'Souza',
+]
+
+TERMS = ['contabilidade', 'acougue sao joao', 'Imobiliária Paulista', 'silva', 'BS00000012']
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca do admin (icontains em cada campo) com a busca indexada em search_text.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Empresas semeadas (padrão 1M)')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help='Execuções por termo')
+        parser.add_argument('--keep', action='store_true', help='Mantém as empresas semeadas no final')
+
+    def handle(self, *args, **options):
+        # 1. Semeia (ou completa) a tabela com empresas de teste
+        existing = Company.objects.filter(cnpj__startswith=BENCH_PREFIX).count()
+        if existing < options['rows']:
+            self._seed(existing, options['rows'], options['batch_size'])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(Company._meta.db_table)}')
+
+        # 2. Mede cada termo: primeira página (20) + contagem, como no changelist do admin
+        try:
+            self.stdout.write(f'{options["rows"]} empresas ({connection.vendor})')
+            for term in TERMS:
+                legacy = self._time(self._legacy_search(term), options['repeat'])
+                indexed = self._time(search_queryset(Company.objects.all(), term), options['repeat'])
+                self.stdout.write(f'  {term:<24} icontains {legacy:>9.1f} ms | search_text {indexed:>9.1f} ms')
+        finally:
+            if not options['keep']:
+                Company.objects.filter(cnpj__startswith=BENCH_PREFIX).delete()
+
+    def _legacy_search(self, term):
+        # O que o ModelAdmin faz com search_fields = ['legal_name', 'trade_name', 'cnpj']
+        queryset = Company.objects.all()
+        for word in term.split():
+            queryset = queryset.filter(reduce(or_, [
+                Q(**{f'{field}__icontains': word}) for field in ('legal_name', 'trade_name', 'cnpj')
+            ]))
+        return queryset
+
+    def _time(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset[:20])
+            queryset.count()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    def _seed(self, start, total, batch_size):
+        rng = random.Random(start)
+        for offset in range(start, total, batch_size):
+            companies = []
+            for i in range(offset, min(offset + batch_size, total)):
+                company = Company(
+                    legal_name=' '.join(rng.sample(WORDS, 3)) + ' Ltda',
+                    trade_name=' '.join(rng.sample(WORDS, 2)),
+                    cnpj=f'{BENCH_PREFIX}{i:012d}',
+                )
+                company.refresh_derived_fields()
+                companies.append(company)
+            Company.objects.bulk_create(companies)
+            self.stdout.write(f'  semeadas {offset + len(companies)}/{total}', ending='\r')
+        self.stdout.write('')
@@ -0,0 +1,61 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.benchmark import format_row, measure
+
+ENGINES = [
+    ('db (antes)', 'django.contrib.sessions.backends.db'),
+    ('cached_db', 'django.contrib.sessions.backends.cached_db'),
+    ('core.sessions (Redis)', 'core.sessions'),
+]
+
+TENANT_CONTEXT = ['00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002', 'admin']
+
+
+class Command(BaseCommand):
+    help = 'Mede o custo de sessão por request (carregar e, opcionalmente, gravar) em cada SESSION_ENGINE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=500, help='Requests simulados por rodada')
+        parser.add_argument('--repeat', type=int, default=5, help='Quantidade de rodadas')
+
+    def handle(self, *args, **options):
+        number, repeat = options['number'], options['repeat']
+        self.stdout.write(f'Banco: {connection.vendor}')
+
+        for label, engine in ENGINES:
+            SessionStore = import_module(engine).SessionStore
+
+            # 1. Sessão de um usuário logado com o contexto do tenant
+            session = SessionStore()
+            session.update({'_auth_user_id': '1', 'tenant': TENANT_CONTEXT})
+            session.create()
+            key = session.session_key
+
+            def read_request():
+                # Request comum: o middleware lê a sessão e não altera nada
+                store = SessionStore(key)
+                store.get('tenant')
+
+            def write_request():
+                # Troca de empresa: lê e grava
+                store = SessionStore(key)
+                store['tenant'] = list(store.get('tenant'))
+                store.save()
+
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    read_request()
+                read_queries = len(queries)
+                with CaptureQueriesContext(connection) as queries:
+                    write_request()
+                write_queries = len(queries)
+
+                self.stdout.write(f'{label}:')
+                self.stdout.write(format_row(f'  leitura ({read_queries} queries)', measure(read_request, number, repeat)))
+                self.stdout.write(format_row(f'  leitura + gravação ({write_queries} queries)', measure(write_request, number, repeat)))
+            finally:
+                SessionStore(key).delete()
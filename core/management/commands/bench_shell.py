@@ -0,0 +1,62 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from companies.models import Company, Membership
+from companies.permissions import has_capabilities
+from core.benchmark import format_row, measure
+
+TEMPLATES = ['includes/sidebar.html', 'includes/mobile-header.html', 'includes/topbar.html', 'base.html']
+
+# Desliga só o cache de fragmentos ({% cache %} usa o alias template_fragments se existir)
+NO_FRAGMENT_CACHE = {**settings.CACHES, 'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Mede o render do shell (sidebar, cabeçalhos, base.html) com e sem o cache de fragmentos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=5, help='Empresas do usuário (itens do seletor)')
+        parser.add_argument('--number', type=int, default=500, help='Renders por rodada')
+        parser.add_argument('--repeat', type=int, default=5, help='Quantidade de rodadas')
+
+    def handle(self, *args, **options):
+        number, repeat = options['number'], options['repeat']
+
+        # Dados temporários: tudo é desfeito no final (rollback)
+        with transaction.atomic():
+            request = self._request(options['companies'])
+
+            results = {}
+            for label, caches in (('sem cache', NO_FRAGMENT_CACHE), ('com cache', None)):
+                with override_settings(CACHES=caches) if caches else override_settings():
+                    for name in TEMPLATES:
+                        render = partial(render_to_string, name, request=request)
+                        render()  # aquece (templates compilados, fragmento gravado)
+                        results[label, name] = measure(render, number, repeat)
+                        self.stdout.write(format_row(f'{label:<10} {name}', results[label, name], 48))
+
+            saved_ns = results['sem cache', 'base.html']['best_ns'] - results['com cache', 'base.html']['best_ns']
+            self.stdout.write(self.style.SUCCESS(f'Economia por página (base.html): {saved_ns / 1e6:.3f} ms'))
+            transaction.set_rollback(True)
+
+    def _request(self, companies):
+        user = get_user_model()(email='bench-shell@example.com', name='Bench Shell')
+        user.set_unusable_password()
+        user.save()
+        for i in range(companies):
+            company = Company.objects.create(legal_name=f'Bench Shell {i} Ltda', cnpj=f'BSH{i:011d}')
+            Membership.objects.create(user=user, company=company, role=Membership.ROLE_ADMIN)
+
+        request = RequestFactory().get('/')
+        request.user = user
+        request.membership = Membership.objects.select_related('company').filter(user=user).first()
+        request.company = request.membership.company
+        request.can = partial(has_capabilities, request.membership)
+        return request
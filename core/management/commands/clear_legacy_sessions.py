@@ -0,0 +1,33 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Apaga em lotes as sessões da tabela antiga (django_session). Por padrão, só as expiradas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Apaga também as sessões ainda válidas (desloga quem não voltou)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Pausa entre lotes (segundos), para não segurar o banco')
+
+    def handle(self, *args, **options):
+        queryset = Session.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(expire_date__lt=timezone.now())
+
+        # Lotes pequenos pela chave: cada DELETE trava poucas linhas e termina rápido
+        deleted = 0
+        while True:
+            keys = list(queryset.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            count, _ = Session.objects.filter(session_key__in=keys).delete()
+            deleted += count
+            self.stdout.write(f'  {deleted} sessões apagadas')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'{deleted} sessões apagadas da tabela antiga.'))
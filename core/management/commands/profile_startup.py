@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Roda num processo novo (boot de verdade, sem nada importado ainda)
+BOOT_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.test import Client
+client = Client()
+client.handler.load_middleware()  # Como o WSGIHandler, que carrega os middlewares ao ser criado
+timings = {'django.setup': (time.perf_counter() - start) * 1000}
+
+if os.environ['PROFILE_WARMUP'] == '1':
+    from core.warmup import warm_up
+    for name, (amount, ms) in warm_up().items():
+        timings[f'warm_up.{name}'] = ms
+
+from django.test.utils import override_settings
+with override_settings(ALLOWED_HOSTS=['*']):
+    for label in ('1º request', '2º request'):
+        start = time.perf_counter()
+        client.get(sys.argv[1], secure=True)
+        timings[label] = (time.perf_counter() - start) * 1000
+
+sys.stdout.write(json.dumps(timings))
+"""
+
+
+def parse_importtime(stderr):
+    """Saída do -X importtime -> {módulo: (próprio us, acumulado us)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Mede o boot de um worker: import por módulo (python -X importtime) e 1º request com e sem aquecimento.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/accounts/login/', help='URL do request medido')
+        parser.add_argument('--top', type=int, default=20, help='Quantidade de módulos/pacotes listados')
+
+    def run(self, path, warmup, importtime=False):
+        env = {**os.environ, 'PROFILE_WARMUP': '1' if warmup else '0', 'WARMUP_ON_READY': 'False'}
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', BOOT_SCRIPT, path]
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode:
+            raise CommandError(f'O boot falhou:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        path, top = options['path'], options['top']
+
+        # 1. Import por módulo (tempo próprio agrupado por pacote e acumulado por módulo)
+        _, stderr = self.run(path, warmup=False, importtime=True)
+        modules = parse_importtime(stderr)
+        packages = defaultdict(int)
+        for name, (self_us, _) in modules.items():
+            packages[name.split('.')[0]] += self_us
+
+        self.stdout.write(f'Imports: {len(modules)} módulos, {sum(packages.values()) / 1000:.0f} ms')
+        self.stdout.write('Por pacote (tempo próprio):')
+        for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'  {name:<40} {us / 1000:>8.1f} ms')
+        self.stdout.write('Por módulo (acumulado):')
+        for name, (_, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:top]:
+            self.stdout.write(f'  {name:<40} {cumulative_us / 1000:>8.1f} ms')
+
+        # 2. Primeiro request frio x aquecido (processos novos, sem -X importtime)
+        for label, warmup in (('sem aquecimento', False), ('com aquecimento', True)):
+            timings, _ = self.run(path, warmup)
+            self.stdout.write(f'{label}:')
+            for name, ms in timings.items():
+                self.stdout.write(f'  {name:<40} {ms:>8.1f} ms')
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.mail import send_batch
+from core.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails da fila (OutboxEmail) em lotes, com novas tentativas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Fica rodando (worker); sem isso envia o que houver e sai')
+        parser.add_argument('--interval', type=float, default=2.0, help='Espera quando a fila está vazia (segundos)')
+
+    def handle(self, *args, **options):
+        purge_interval = getattr(settings, 'OUTBOX_PURGE_INTERVAL', 3600)
+        next_purge = 0.0
+
+        while True:
+            # Limpeza na partida e, no --loop, periodicamente (o worker pode ficar dias no ar)
+            if time.monotonic() >= next_purge:
+                self._purge_sent()
+                next_purge = time.monotonic() + purge_interval
+
+            # Esvazia a fila em lotes; cada lote usa uma conexão só
+            while True:
+                sent, failed = send_batch(options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f'{sent} enviados, {failed} com falha')
+                if sent + failed < options['batch_size']:
+                    break
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _purge_sent(self):
+        # Enviados antigos só ocupam espaço
+        keep_days = getattr(settings, 'OUTBOX_KEEP_DAYS', 7)
+        cutoff = timezone.now() - timedelta(days=keep_days)
+        deleted, _ = OutboxEmail.objects.filter(status=OutboxEmail.STATUS_SENT, sent_at__lt=cutoff).delete()
+        if deleted:
+            self.stdout.write(f'{deleted} e-mails enviados há mais de {keep_days} dias removidos')
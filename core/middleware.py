@@ -1,32 +1,101 @@
 # core/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.conf import settings
-from django.urls import reverse
+from .instrumentation import timed
+from .routers import PIN_COOKIE, end_request, start_request
+from .routing import PUBLIC, get_route_matcher
 
 class LoginRequiredMiddleware:
+    # Sync no WSGI; async nativo no ASGI quando settings.ASYNC_GATES estiver ligado
+    sync_capable = True
+    async_capable = settings.ASYNC_GATES
+
     def __init__(self, get_response):
         self.get_response = get_response
+        # Tabela de rotas compilada uma única vez (ver core/routing.py)
+        self.route_policy = get_route_matcher()
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        # 1. Lista de caminhos permitidos (Públicos)
-        # Precisamos deixar o usuário acessar a tela de login, cadastro e o admin
-        public_paths = [
-            '/accounts/',  # Rotas do Allauth (Login, Signup, Reset Senha)
-            '/admin/',     # Django Admin
-            '/static/',    # Arquivos estáticos (CSS/JS)
-            '/media/',     # Uploads
-        ]
-
-        # 2. Verifica se o caminho atual começa com algum dos permitidos
-        path = request.path_info
-        is_public = any(path.startswith(p) for p in public_paths)
-
-        # 3. A Lógica do Porteiro:
+        if self.async_mode:
+            return self.__acall__(request)
+
+        # 1. Descobre a política da rota (PUBLIC, AUTH_ONLY ou TENANT)
+        # Fica guardada no request para o CompanyMiddleware não recalcular
+        request.route_policy = self.route_policy(request.path_info)
+
+        # 2. A Lógica do Porteiro:
         # Se o usuário NÃO está logado E a página NÃO é pública...
-        if not request.user.is_authenticated and not is_public:
+        with timed('auth'):  # Primeiro acesso ao usuário: carrega a sessão e o usuário
+            is_authenticated = request.user.is_authenticated
+        if not is_authenticated and request.route_policy != PUBLIC:
             # ...Redireciona para o Login
             return redirect(settings.LOGIN_URL)
 
         # Se passou no teste, segue o fluxo normal
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+    async def __acall__(self, request):
+        request.route_policy = self.route_policy(request.path_info)
+
+        # Carrega o usuário pelo ORM async e fixa em request.user:
+        # assim views e templates não disparam query síncrona depois
+        with timed('auth'):
+            request.user = await request.auser()
+
+        if not request.user.is_authenticated and request.route_policy != PUBLIC:
+            return redirect(settings.LOGIN_URL)
+
+        return await self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes com réplicas (ver core/routers.py): o request que gravou
+    algo devolve o cookie db_pin; enquanto ele existir, as leituras do
+    usuário vão para o primário.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        token = start_request(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self._pin(response, state)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+
+        token = start_request(PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self._pin(response, state)
+
+    def _pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('subject', models.TextField(verbose_name='Assunto')),
+                ('body', models.TextField(blank=True, verbose_name='Corpo')),
+                ('from_email', models.CharField(max_length=255, verbose_name='Remetente')),
+                ('to', models.JSONField(default=list, verbose_name='Para')),
+                ('cc', models.JSONField(default=list, verbose_name='Cópia')),
+                ('bcc', models.JSONField(default=list, verbose_name='Cópia oculta')),
+                ('reply_to', models.JSONField(default=list, verbose_name='Responder para')),
+                ('headers', models.JSONField(default=dict, verbose_name='Cabeçalhos')),
+                ('alternatives', models.JSONField(default=list, verbose_name='Alternativas')),
+                ('attachments', models.JSONField(default=list, verbose_name='Anexos')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('sent', 'Enviado'), ('failed', 'Falhou')], default='pending', max_length=7, verbose_name='Situação')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+            ],
+            options={
+                'verbose_name': 'E-mail na fila',
+                'verbose_name_plural': 'Fila de e-mails',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import models
+from django.utils import timezone
+
+
+class DerivedFieldsMixin:
+    """
+    Modelos com campos calculados a partir de outros (ex.: CNPJ normalizado,
+    texto de busca). DERIVED_FIELDS = {campo calculado: [campos de origem]}.
+    save() recalcula sozinho; bulk_create/COPY precisam chamar
+    refresh_derived_fields() antes.
+    """
+    DERIVED_FIELDS = {}
+
+    def refresh_derived_fields(self):
+        raise NotImplementedError
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        # save(update_fields=[...]) só regrava o calculado se alguma origem mudou
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            kwargs['update_fields'] = update_fields | {
+                field for field, sources in self.DERIVED_FIELDS.items() if update_fields & set(sources)
+            }
+        super().save(*args, **kwargs)
+
+
+class OutboxEmail(models.Model):
+    """
+    E-mail na fila de envio (core.mail.OutboxEmailBackend). O request só
+    grava a linha; o comando send_outbox envia em lote, com novas tentativas.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    subject = models.TextField('Assunto')
+    body = models.TextField('Corpo', blank=True)
+    from_email = models.CharField('Remetente', max_length=255)
+    to = models.JSONField('Para', default=list)
+    cc = models.JSONField('Cópia', default=list)
+    bcc = models.JSONField('Cópia oculta', default=list)
+    reply_to = models.JSONField('Responder para', default=list)
+    headers = models.JSONField('Cabeçalhos', default=dict)
+    alternatives = models.JSONField('Alternativas', default=list)  # [[conteúdo, mimetype]], ex.: HTML
+    attachments = models.JSONField('Anexos', default=list)  # [[nome, conteúdo em base64, mimetype]]
+
+    status = models.CharField('Situação', max_length=7, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField('Tentativas', default=0)
+    next_attempt_at = models.DateTimeField('Próxima tentativa', default=timezone.now)
+    last_error = models.TextField('Último erro', blank=True)
+    created_at = models.DateTimeField('Criado em', auto_now_add=True)
+    sent_at = models.DateTimeField('Enviado em', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'E-mail na fila'
+        verbose_name_plural = 'Fila de e-mails'
+        indexes = [
+            # O send_outbox só lê os pendentes vencidos: índice pequeno (parcial)
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
@@ -0,0 +1,94 @@
+"""
+Operações de migração com comportamento específico do PostgreSQL.
+
+PostgresExtension/PostgresAddIndex: em outro banco (SQLite no
+desenvolvimento) não fazem nada e não mexem no estado dos modelos; os
+índices ficam fora do Meta.indexes porque o SQLite não sabe criá-los.
+PostgresAddIndex(..., concurrently=True) cria com CONCURRENTLY, como o
+AddIndexConcurrently (a migração precisa de atomic = False).
+
+Não usamos django.contrib.postgres.operations porque ele exige o driver
+do PostgreSQL instalado até para rodar as migrações no SQLite.
+"""
+from django.db.migrations import AddIndex
+from django.db.migrations.operations.base import Operation
+
+
+class PostgresExtension(Operation):
+    reversible = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(f'CREATE EXTENSION IF NOT EXISTS {schema_editor.quote_name(self.name)}')
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # A extensão pode ser usada por outros apps: não removemos
+        pass
+
+    def describe(self):
+        return f'Cria a extensão {self.name} (PostgreSQL)'
+
+
+class PostgresAddIndex(Operation):
+    reversible = True
+
+    def __init__(self, model_name, index, concurrently=False):
+        self.model_name = model_name
+        self.index = index
+        self.concurrently = concurrently
+
+    def deconstruct(self):
+        kwargs = {'model_name': self.model_name, 'index': self.index}
+        if self.concurrently:
+            kwargs['concurrently'] = True
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            model = to_state.apps.get_model(app_label, self.model_name)
+            schema_editor.add_index(model, self.index, concurrently=self.concurrently)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            model = from_state.apps.get_model(app_label, self.model_name)
+            schema_editor.remove_index(model, self.index, concurrently=self.concurrently)
+
+    def describe(self):
+        mode = 'CONCURRENTLY, ' if self.concurrently else ''
+        return f'Cria o índice {self.index.name} em {self.model_name} ({mode}PostgreSQL)'
+
+
+class AddIndexConcurrently(AddIndex):
+    """
+    AddIndex que no PostgreSQL usa CREATE INDEX CONCURRENTLY (não trava
+    escritas na tabela). A migração precisa de atomic = False. Em outros
+    bancos é um AddIndex normal.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == 'postgresql':
+                schema_editor.add_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == 'postgresql':
+                schema_editor.remove_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.remove_index(model, self.index)
+
+    def describe(self):
+        return f'Cria o índice {self.index.name} em {self.model_name} (CONCURRENTLY no PostgreSQL)'
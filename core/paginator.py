@@ -0,0 +1,37 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator para tabelas grandes no admin. Sem filtro, o total vem da
+    estimativa do PostgreSQL (pg_class.reltuples, atualizada pelo
+    autovacuum/ANALYZE) em vez de um COUNT(*) que lê a tabela inteira.
+    Com filtro (ou em tabelas pequenas) continua o COUNT exato.
+    """
+    # Abaixo disso o COUNT(*) é barato e o número exato vale mais
+    estimate_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = self._estimated_count(queryset)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+    def _estimated_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples = -1: tabela nunca analisada
+        return row[0] if row and row[0] >= 0 else None
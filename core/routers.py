@@ -0,0 +1,69 @@
+"""
+Leituras nas réplicas, escritas no primário (settings.REPLICA_DATABASES).
+
+Read-your-writes: quem acabou de gravar lê do primário por
+REPLICA_PIN_SECONDS (cookie colocado pelo ReplicaPinningMiddleware), para
+não ver dado antigo enquanto a réplica não alcança o primário. No mesmo
+request, depois da primeira escrita, todas as leituras já vão para o
+primário; dentro de transaction.atomic() também.
+
+Sem réplicas configuradas o router não interfere (tudo no default).
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'db_pin'
+
+
+class RoutingState:
+    """Estado do request atual: pinned (veio com o cookie) e wrote (gravou algo)."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing', default=None)
+
+
+def start_request(pinned):
+    return _state.set(RoutingState(pinned))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas:
+            return None
+
+        state = _state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return PRIMARY
+        # Dentro de uma transação a leitura precisa ver o que a própria transação gravou
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas têm os mesmos dados do primário
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o schema pela replicação
+        return db not in settings.REPLICA_DATABASES
@@ -0,0 +1,89 @@
+"""
+Política de acesso das rotas, compartilhada pelos dois "porteiros":
+LoginRequiredMiddleware (core) e CompanyMiddleware (companies).
+
+PUBLIC     -> não exige login nem empresa (login, admin, estáticos)
+AUTH_ONLY  -> exige login, mas não empresa ativa (ex: cadastro da empresa)
+TENANT     -> exige login e empresa ativa (padrão de qualquer rota não declarada)
+
+As regras são declaradas nos urls.py, por prefixo ou nome de URL:
+
+    route_policy(PUBLIC, '/admin/', '/static/')
+    route_policy(AUTH_ONLY, 'create_company')
+    route_policy(AUTH_ONLY, 'switch_company')  # Rota com parâmetro: vale o trecho antes dele
+
+e compiladas uma única vez (na inicialização dos middlewares) numa só regex.
+"""
+import re
+from functools import lru_cache
+from importlib import import_module
+
+from django.conf import settings
+from django.urls import get_resolver, get_script_prefix, reverse
+
+PUBLIC = 'public'
+AUTH_ONLY = 'auth_only'
+TENANT = 'tenant'
+
+DEFAULT_POLICY = TENANT
+
+# Regras declaradas pelos urls.py: (política, prefixo ou nome de URL)
+_rules = []
+
+
+def route_policy(policy, *routes):
+    """
+    Declara a política de uma ou mais rotas.
+    Itens que começam com '/' são prefixos de caminho; os demais são nomes de URL
+    (resolvidos na compilação e tratados como prefixo; ver route_prefix).
+    """
+    for route in routes:
+        _rules.append((policy, route))
+
+
+def route_prefix(route):
+    """
+    Prefixo de caminho da regra. Nome de URL vira o caminho dele; com parâmetros
+    ('switch/<uuid:company_id>/'), o trecho fixo antes do primeiro parâmetro.
+    """
+    if route.startswith('/'):
+        return route
+    possibilities = get_resolver().reverse_dict.getlist(route)
+    if not possibilities:
+        return reverse(route)  # Nome com namespace ('admin:index') ou inexistente (NoReverseMatch)
+    # [(formato, parâmetros)], ex.: ('companies/switch/%(company_id)s/', ['company_id'])
+    template = possibilities[0][0][0][0]
+    return get_script_prefix() + template.split('%(')[0]
+
+
+class RouteMatcher:
+    """
+    Casa um path com a política da regra de prefixo mais longo.
+    Chamável: matcher(path) -> política.
+    """
+
+    def __init__(self, rules):
+        policies_by_prefix = {}
+        for policy, route in rules:
+            policies_by_prefix[route_prefix(route)] = policy
+
+        # Prefixos mais longos primeiro: '/accounts/logout/' vence '/accounts/'
+        prefixes = sorted(policies_by_prefix, key=len, reverse=True)
+        self.rules = [(prefix, policies_by_prefix[prefix]) for prefix in prefixes]
+        self._policies = [policy for _, policy in self.rules]
+        self._regex = re.compile('|'.join(f'({re.escape(p)})' for p in prefixes)) if prefixes else None
+
+    def __call__(self, path):
+        if self._regex is not None:
+            match = self._regex.match(path)
+            if match:
+                # Cada alternativa é um grupo: lastindex diz qual prefixo casou
+                return self._policies[match.lastindex - 1]
+        return DEFAULT_POLICY
+
+
+@lru_cache(maxsize=None)
+def get_route_matcher():
+    # Importar o URLconf garante que todos os urls.py já declararam suas regras
+    import_module(settings.ROOT_URLCONF)
+    return RouteMatcher(_rules)
@@ -0,0 +1,78 @@
+"""
+Busca textual de Company e CustomUser (admin e autocomplete).
+
+Cada modelo guarda um `search_text`: os campos buscáveis em minúsculas e sem
+acento, calculado no save(). A busca compara esse texto já normalizado:
+
+- PostgreSQL: índice GIN trigram (pg_trgm) atende o LIKE '%termo%' e um índice
+  GIN de full-text em português pega variações da palavra (ex.: "contabil" e
+  "contabilidade"). Os dois índices são criados pelas migrações.
+- SQLite (desenvolvimento): o mesmo LIKE, sem índice.
+"""
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+
+SEARCH_CONFIG = 'portuguese'
+
+
+def normalize_search_text(*values):
+    """Junta os valores em minúsculas e sem acento ('São Paulo' -> 'sao paulo')."""
+    text = ' '.join(str(value) for value in values if value)
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def search_vector():
+    # A mesma expressão do índice GIN de full-text (ver core.operations.PostgresAddIndex)
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('search_text', config=SEARCH_CONFIG)
+
+
+def search_queryset(queryset, term):
+    """Filtra o queryset (com campo search_text) pelas palavras do termo."""
+    words = normalize_search_text(term).split()
+    if not words:
+        return queryset
+
+    # Todas as palavras precisam aparecer (em qualquer ordem)
+    condition = Q()
+    for word in words:
+        condition &= Q(search_text__contains=word)
+
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery
+        queryset = queryset.annotate(search_vector=search_vector())
+        condition |= Q(search_vector=SearchQuery(' '.join(words), config=SEARCH_CONFIG, search_type='websearch'))
+
+    return queryset.filter(condition)
+
+
+class SearchAdminMixin:
+    """
+    Troca a busca padrão do admin (icontains em cada campo de search_fields,
+    inclusive em joins) pelo search_text indexado. Também vale para o
+    autocomplete, que chama get_search_results.
+
+    search_related: FKs cujo modelo relacionado também tem search_text
+    (ex.: ['user', 'company'] no MembershipAdmin). Cada uma vira um subquery.
+    """
+    search_related = []
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+
+        has_search_text = any(field.name == 'search_text' for field in self.model._meta.concrete_fields)
+        if not self.search_related:
+            return search_queryset(queryset, search_term), False
+
+        condition = Q()
+        if has_search_text:
+            condition |= Q(pk__in=search_queryset(self.model._default_manager.all(), search_term).values('pk'))
+        for field_name in self.search_related:
+            related = self.model._meta.get_field(field_name).related_model
+            condition |= Q(**{f'{field_name}__in': search_queryset(related._default_manager.all(), search_term).values('pk')})
+
+        return queryset.filter(condition), False
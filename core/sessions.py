@@ -0,0 +1,64 @@
+"""
+Sessões no cache (Redis, settings.CACHES) com leitura da tabela antiga.
+
+Antes as sessões ficavam na tabela django_session: um SELECT em todo
+request e um UPDATE a cada alteração. Agora leitura e escrita vão só para
+o cache. Na transição, uma sessão que ainda não está no cache é procurada
+uma única vez na tabela antiga, copiada para o cache e apagada da tabela
+(o usuário continua logado). O que sobrar na tabela é limpo em lotes pelo
+comando clear_legacy_sessions.
+
+Uso: SESSION_ENGINE = 'core.sessions'
+"""
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+
+
+class SessionStore(CacheSessionStore):
+
+    def load(self):
+        try:
+            session_data = self._cache.get(self.cache_key)
+        except Exception:
+            # Chave inválida para o backend de cache: sessão nova
+            session_data = None
+        if session_data is None and self.session_key:
+            session_data = self._migrate_legacy_session()
+        if session_data is not None:
+            return session_data
+        self._session_key = None
+        return {}
+
+    async def aload(self):
+        try:
+            session_data = await self._cache.aget(await self.acache_key())
+        except Exception:
+            session_data = None
+        if session_data is None and self.session_key:
+            session_data = await self._amigrate_legacy_session()
+        if session_data is not None:
+            return session_data
+        self._session_key = None
+        return {}
+
+    def _migrate_legacy_session(self):
+        legacy = DBSessionStore(self.session_key)
+        row = legacy._get_session_from_db()
+        if row is None:
+            return None
+        session_data = legacy.decode(row.session_data)
+        self._cache.set(self.cache_key, session_data, legacy.get_expiry_age(expiry=row.expire_date))
+        row.delete()
+        return session_data
+
+    async def _amigrate_legacy_session(self):
+        legacy = DBSessionStore(self.session_key)
+        row = await legacy._aget_session_from_db()
+        if row is None:
+            return None
+        session_data = legacy.decode(row.session_data)
+        await self._cache.aset(
+            await self.acache_key(), session_data, legacy.get_expiry_age(expiry=row.expire_date),
+        )
+        await row.adelete()
+        return session_data
@@ -38,18 +38,22 @@ INSTALLED_APPS = [
     'widget_tweaks',
     
     # Meus Apps
+    'core',  # Infra do projeto (roteamento, benchmarks)
     'accounts',
     'companies',
     
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.ServerTimingMiddleware',  # Primeiro: mede todos os outros
+    'core.middleware.ReplicaPinningMiddleware',  # Leituras no primário logo depois de uma escrita
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Estáticos em Produção
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'companies.audit.AuditMiddleware',  # Usuário dos eventos do histórico de alterações
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware', # Middleware do Allauth
@@ -57,11 +61,19 @@ MIDDLEWARE = [
     'companies.middleware.CompanyMiddleware', 
 ]
 
+# Porteiros (LoginRequired/CompanyMiddleware) em modo async nativo sob ASGI.
+# Só compensa quando os middlewares acima deles também forem async:
+# os MiddlewareMixin do Django trocam de thread a cada hook (ver manage.py bench_asgi)
+ASYNC_GATES = env.bool('ASYNC_GATES', default=False)
+
+# Fração dos requests medidos pelo ServerTimingMiddleware (header Server-Timing + spans no Sentry)
+SERVER_TIMING_SAMPLE_RATE = env.float('SERVER_TIMING_SAMPLE_RATE', default=1.0 if DEBUG else 0.01)
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',  # DjangoTemplates + tempo de render
         'DIRS': [os.path.join(BASE_DIR, "templates")],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,6 +81,8 @@ TEMPLATES = [
                 'django.template.context_processors.request', # Necessário para o Allauth
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'companies.context_processors.company_switcher',  # Seletor de empresa da sidebar
+                'companies.context_processors.shell_cache',  # Chave do cache da sidebar
             ],
         },
     },
@@ -81,6 +95,24 @@ DATABASES = {
     'default': env.db('DATABASE_URL')
 }
 
+# Réplicas de leitura (opcional): DATABASE_REPLICA_URLS=postgres://...,postgres://...
+# Viram os aliases replica_1, replica_2... e o ReplicaRouter manda as leituras para elas
+REPLICA_DATABASES = []
+for i, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), start=1):
+    DATABASES[f'replica_{i}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica_{i}')
+
+# Conexões persistentes, conferidas antes de reutilizar (evita erro depois de restart/failover do banco).
+# No ASGI (SERVER_MODE=asgi, definido pelo core/asgi.py) o padrão é 0: cada request async roda num contexto próprio e conexão
+# persistente por contexto não é reaproveitada (a documentação do Django recomenda desligar); use um pooler
+SERVER_MODE = env('SERVER_MODE', default='wsgi')
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=0 if SERVER_MODE == 'asgi' else 60)
+    database['CONN_HEALTH_CHECKS'] = True
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10  # Depois de uma escrita, o usuário lê do primário por esse tempo (atraso da réplica)
+
 # 6. Modelo de Usuário Customizado (Sem username, com nome e telefone)
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
@@ -154,12 +186,26 @@ ACCOUNT_EMAIL_VERIFICATION_BY_CODE_ENABLED = True
 ACCOUNT_EMAIL_SUBJECT_PREFIX = '[Meu Projeto] '
 
 
+# Os e-mails vão para a fila (OutboxEmail) e o worker `manage.py send_outbox --loop`
+# envia pelo backend real (OUTBOX_EMAIL_BACKEND). Ver core/mail.py.
+# Com DEBUG vão direto para o console: sem o worker rodando os códigos do allauth não apareceriam
+EMAIL_BACKEND = env(
+    'EMAIL_BACKEND',
+    default='django.core.mail.backends.console.EmailBackend' if DEBUG else 'core.mail.OutboxEmailBackend',
+)
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_CLAIM_SECONDS = 300       # Reserva de um lote pelo worker (se ele cair, outro pega depois disso)
+OUTBOX_RETRY_BASE_DELAY = 60     # Segundos; dobra a cada tentativa
+OUTBOX_RETRY_MAX_DELAY = 3600
+OUTBOX_KEEP_DAYS = 7             # Enviados ficam na tabela por esse tempo
+OUTBOX_PURGE_INTERVAL = 3600     # Segundos entre limpezas dos enviados no send_outbox --loop
+
 if DEBUG:
-    EMAIL_BACKEND = 'django.core. mail.backends.console.EmailBackend'
+    OUTBOX_EMAIL_BACKEND = env('OUTBOX_EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 else:
-    EMAIL_BACKEND = 'django.core.mail. backends.smtp.EmailBackend'
+    OUTBOX_EMAIL_BACKEND = env('OUTBOX_EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
     EMAIL_HOST = env('EMAIL_HOST', default='smtp.gmail.com')
-    EMAIL_PORT = env. int('EMAIL_PORT', default=587)
+    EMAIL_PORT = env.int('EMAIL_PORT', default=587)
     EMAIL_USE_TLS = True
     EMAIL_HOST_USER = env('EMAIL_HOST_USER')
     EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
@@ -198,23 +244,46 @@ ACCOUNT_LOGOUT_ON_PASSWORD_CHANGE = True
 ACCOUNT_PREVENT_ENUMERATION = True  # 👈 IMPORTANTE!
 
 # Adicione ao settings.py
+# REDIS_URL aceita qualquer URL de cache do django-environ (ex: locmemcache:// em testes)
 CACHES = {
-    'default': {
-        'BACKEND': 'django. core.cache.backends.redis.RedisCache',
-        'LOCATION': env('REDIS_URL', default='redis://127.0.0. 1:6379/1'),
-    }
+    'default': env.cache('REDIS_URL', default='redis://127.0.0.1:6379/1'),
 }
 
+# Sessões no cache (Redis), com leitura única da tabela antiga na transição (ver core/sessions.py)
+SESSION_ENGINE = env('SESSION_ENGINE', default='core.sessions')
+
+# Cache do tenant (companies/tenancy.py): LRU local por worker na frente do Redis
+TENANT_CACHE_TIMEOUT = 300      # Segundos no Redis
+TENANT_LOCAL_CACHE_TTL = 5      # Segundos no LRU do worker (atraso máximo entre workers)
+TENANT_LOCAL_CACHE_SIZE = 1024  # Entradas por worker
+
+# Índice de CEP offline (manage.py build_cep_index, ver companies/cep.py)
+CEP_INDEX_PATH = env('CEP_INDEX_PATH', default=str(BASE_DIR / 'data' / 'cep.idx'))
+
+# Histórico de alterações (companies/audit.py): gravado em lote por uma thread do worker
+AUDIT_ASYNC = env.bool('AUDIT_ASYNC', default=True)
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0  # Segundos
+
+# Fragmento em cache do shell (sidebar) por usuário/empresa/cargo
+SHELL_CACHE_TIMEOUT = 600
+
+# Aquecimento do worker no CoreConfig.ready (o gunicorn.conf.py liga; ver core/warmup.py)
+WARMUP_ON_READY = env.bool('WARMUP_ON_READY', default=False)
 
-import sentry_sdk
 
 if not DEBUG:
-    sentry_sdk. init(
-        dsn=env('SENTRY_DSN', default=''),
-        send_default_pii=True,
-        traces_sample_rate=0.1,  # 10% das transações
-    )
-    
+    # Sentry só é importado e iniciado se houver DSN (o import e as integrações pesam no boot)
+    SENTRY_DSN = env('SENTRY_DSN', default='')
+    if SENTRY_DSN:
+        import sentry_sdk
+
+        sentry_sdk.init(
+            dsn=SENTRY_DSN,
+            send_default_pii=True,
+            traces_sample_rate=0.1,  # 10% das transações
+        )
+
     # Headers de segurança
     SECURE_SSL_REDIRECT = True
     SECURE_HSTS_SECONDS = 31536000
@@ -0,0 +1,12 @@
+"""
+Settings dos testes (o manage.py usa este módulo no comando test).
+
+As do projeto, mais um alias de réplica de verdade (espelho do default) para
+os testes do ReplicaRouter verem a query ir para outra conexão. Fica fora do
+REPLICA_DATABASES: os testes que precisam dele ligam com override_settings.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, REPLICA_DATABASES
+
+if not REPLICA_DATABASES:
+    DATABASES['replica_test'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
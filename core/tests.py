@@ -0,0 +1,636 @@
+import io
+import json
+import os
+import time
+from importlib import import_module
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from companies.documents import CNPJ_WEIGHTS, format_cnpj, format_cpf
+from companies.models import Company, Membership, Partner
+from companies.tenancy import local_cache
+from core.instrumentation import ServerTimingMiddleware
+from core.mail import claim_batch, send_batch
+from core.middleware import ReplicaPinningMiddleware
+from core.operations import PostgresAddIndex
+from core.models import OutboxEmail
+from core.routers import PIN_COOKIE, PRIMARY, ReplicaRouter, end_request, start_request
+from core.routing import AUTH_ONLY, PUBLIC, TENANT, RouteMatcher, get_route_matcher, route_prefix
+from core.search import search_queryset
+from core.sessions import SessionStore
+from core.warmup import warm_up
+
+# Arquivo com os números de cada rodada (para comparar execuções ao longo do tempo)
+BUDGET_RESULTS_PATH = os.environ.get('BUDGET_RESULTS_PATH', os.path.join(settings.BASE_DIR, 'budget_results.json'))
+
+# Multiplica os orçamentos de tempo (CI lento: BUDGET_TIME_FACTOR=3)
+BUDGET_TIME_FACTOR = float(os.environ.get('BUDGET_TIME_FACTOR', '1'))
+
+# Tamanho da base semeada
+COMPANIES = 30
+PARTNERS_PER_COMPANY = 20
+MEMBERS_PER_COMPANY = 5
+
+
+def make_cpf(n):
+    # CPF válido (dígitos verificadores calculados) a partir de um número
+    digits = [int(d) for d in f'{100_000_000 + n:09d}']
+    for position in (9, 10):
+        digits.append(sum(d * (position + 1 - i) for i, d in enumerate(digits)) * 10 % 11 % 10)
+    return format_cpf(''.join(map(str, digits)))
+
+
+def make_cnpj(n):
+    digits = [int(d) for d in f'{10_000_000 + n:08d}0001']
+    for position in (12, 13):
+        remainder = sum(d * w for d, w in zip(digits, CNPJ_WEIGHTS[13 - position:])) % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    return format_cnpj(''.join(map(str, digits)))
+
+
+def partner_formset_data(company, prefix='partners_list'):
+    # POST do PartnerFormSet com todos os sócios atuais (o primeiro com o nome alterado)
+    partners = list(company.partners_list.order_by('pk'))
+    data = {
+        f'{prefix}-TOTAL_FORMS': len(partners),
+        f'{prefix}-INITIAL_FORMS': len(partners),
+        f'{prefix}-MIN_NUM_FORMS': 0,
+        f'{prefix}-MAX_NUM_FORMS': 1000,
+    }
+    for i, partner in enumerate(partners):
+        data.update({
+            f'{prefix}-{i}-id': partner.pk,
+            f'{prefix}-{i}-name': partner.name + (' (editado)' if i == 0 else ''),
+            f'{prefix}-{i}-cpf': partner.cpf,
+            f'{prefix}-{i}-email': partner.email,
+            f'{prefix}-{i}-phone': partner.phone,
+        })
+    return data
+
+
+def company_data(company):
+    return {
+        'cnpj': company.cnpj, 'legal_name': company.legal_name, 'trade_name': company.trade_name,
+        'state_registration': '', 'phone': '', 'email': '', 'website': '',
+        'zip_code': '', 'address': '', 'number': '', 'complement': '', 'neighborhood': '', 'city': '', 'state': '',
+    }
+
+
+class ViewBudgetTests(TestCase):
+    """
+    Orçamento de queries e de tempo por view, passando pela pilha completa de
+    middlewares (self.client). Cada cenário mede um request "quente" (caches
+    de tenant e templates já carregados), como em produção.
+
+    Estourou o orçamento de queries? Provavelmente um N+1 novo. Se o aumento
+    for intencional, ajuste o número no cenário.
+
+    As sessões ficam no cache (core.sessions): ler a sessão não custa query.
+
+    Os resultados vão para BUDGET_RESULTS_PATH (JSON).
+    """
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+
+        # 1. Base multi-tenant: várias empresas, cada uma com sócios e membros
+        cls.companies = []
+        for i in range(COMPANIES):
+            company = Company.objects.create(legal_name=f'Empresa {i} Ltda', trade_name=f'Empresa {i}', cnpj=make_cnpj(i))
+            partners = [Partner(company=company, name=f'Sócio {j}', cpf=make_cpf(j)) for j in range(PARTNERS_PER_COMPANY)]
+            for partner in partners:
+                partner.refresh_derived_fields()
+            Partner.objects.bulk_create(partners)
+            cls.companies.append(company)
+
+        # Membros em lote (create_user calcularia o hash de senha de cada um)
+        members = [
+            User(email=f'membro-{i}-{j}@example.com', name=f'Membro {i}.{j}')
+            for i in range(COMPANIES) for j in range(MEMBERS_PER_COMPANY)
+        ]
+        for member in members:
+            member.set_unusable_password()
+            member.refresh_derived_fields()
+        User.objects.bulk_create(members)
+        Membership.objects.bulk_create([
+            Membership(user=member, company=cls.companies[n // MEMBERS_PER_COMPANY], role=Membership.ROLE_BROKER)
+            for n, member in enumerate(User.objects.filter(email__startswith='membro-').order_by('pk'))
+        ])
+
+        # 2. Usuários dos cenários
+        cls.owner = User.objects.create_user('dono@example.com', 'x', name='Dono')
+        for company in cls.companies[:3]:
+            Membership.objects.create(user=cls.owner, company=company, role=Membership.ROLE_ADMIN)
+        # Empresa que o CompanyMiddleware escolhe sem seleção na sessão (primeiro vínculo ativo)
+        cls.owner_company = Membership.objects.filter(user=cls.owner).order_by('pk').first().company
+        cls.newcomer = User.objects.create_user('novo@example.com', 'x', name='Sem Empresa')
+        cls.staff = User.objects.create_superuser('staff@example.com', 'x', name='Staff')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with open(BUDGET_RESULTS_PATH, 'w', encoding='utf-8') as f:
+            json.dump({
+                'vendor': connection.vendor,
+                'dataset': {'companies': COMPANIES, 'partners_per_company': PARTNERS_PER_COMPANY, 'members_per_company': MEMBERS_PER_COMPANY},
+                'results': dict(sorted(cls.results.items())),
+            }, f, indent=2, ensure_ascii=False)
+
+    def assertWithinBudget(self, name, user, method, url, max_queries, max_ms, data=None, status=200, warm_up=True):
+        self.client.force_login(user)
+        send = getattr(self.client, method)
+
+        # Aquece (cache do tenant, templates) com o mesmo request; POST só se for idempotente
+        if warm_up:
+            send(url, data)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = send(url, data)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+        budget_ms = max_ms * BUDGET_TIME_FACTOR
+        self.results[name] = {
+            'queries': len(queries), 'max_queries': max_queries,
+            'ms': round(elapsed_ms, 2), 'max_ms': budget_ms,
+            'ok': len(queries) <= max_queries and elapsed_ms <= budget_ms,
+        }
+
+        self.assertEqual(response.status_code, status)
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{name}: {len(queries)} queries (orçamento {max_queries}):\n'
+            + '\n'.join(q['sql'] for q in queries.captured_queries),
+        )
+        self.assertLessEqual(elapsed_ms, budget_ms, f'{name}: {elapsed_ms:.1f} ms (orçamento {budget_ms:.0f} ms)')
+
+    # --- Páginas do sistema ------------------------------------------------
+
+    def test_home(self):
+        # Números do dashboard: uma query nos contadores (CompanyStats), qualquer que seja o tamanho da empresa
+        self.assertWithinBudget('home', self.owner, 'get', reverse('home'), max_queries=2, max_ms=150)
+
+    def test_company_detail(self):
+        self.assertWithinBudget('company_detail', self.owner, 'get', reverse('company_detail'), max_queries=3, max_ms=150)
+
+    def test_company_update_get(self):
+        self.assertWithinBudget('company_update GET', self.owner, 'get', reverse('company_update'), max_queries=3, max_ms=250)
+
+    def test_company_update_post(self):
+        company = self.owner_company
+        data = {**company_data(company), **partner_formset_data(company)}
+        self.assertWithinBudget(
+            'company_update POST', self.owner, 'post', reverse('company_update'), data=data, status=302,
+            max_queries=9, max_ms=300,
+        )
+
+    def test_create_company_get(self):
+        self.assertWithinBudget('create_company GET', self.newcomer, 'get', reverse('create_company'), max_queries=2, max_ms=150)
+
+    def test_create_company_post(self):
+        data = {
+            **company_data(Company(legal_name='Nova Empresa Ltda', cnpj=make_cnpj(COMPANIES))),
+            'partners_list-TOTAL_FORMS': 2, 'partners_list-INITIAL_FORMS': 0,
+            'partners_list-MIN_NUM_FORMS': 0, 'partners_list-MAX_NUM_FORMS': 1000,
+            'partners_list-0-name': 'Sócia A', 'partners_list-0-cpf': make_cpf(1),
+            'partners_list-1-name': 'Sócio B', 'partners_list-1-cpf': make_cpf(2),
+        }
+        # Aquece só com o GET (o POST cria a empresa)
+        self.client.force_login(self.newcomer)
+        self.client.get(reverse('create_company'))
+        self.assertWithinBudget(
+            'create_company POST', self.newcomer, 'post', reverse('create_company'), data=data, status=302,
+            # +2: registro de contadores da empresa nova e o UPDATE dos contadores (membro + sócios)
+            max_queries=11, max_ms=300, warm_up=False,
+        )
+
+    # --- Admin -------------------------------------------------------------
+
+    def test_admin_company_changelist(self):
+        self.assertWithinBudget('admin company', self.staff, 'get', reverse('admin:companies_company_changelist'), max_queries=4, max_ms=300)
+
+    def test_admin_membership_changelist(self):
+        self.assertWithinBudget('admin membership', self.staff, 'get', reverse('admin:companies_membership_changelist'), max_queries=4, max_ms=300)
+
+    def test_admin_user_changelist(self):
+        self.assertWithinBudget('admin user', self.staff, 'get', reverse('admin:accounts_customuser_changelist'), max_queries=4, max_ms=300)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    # Backend "fora do ar" para testar as novas tentativas
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP indisponível')
+
+
+class CrashingEmailBackend(BaseEmailBackend):
+    # Worker que morre no meio do lote: a primeira mensagem sai, a segunda derruba o processo
+    def send_messages(self, email_messages):
+        if len(mail.outbox) >= 1:
+            raise SystemExit
+        mail.outbox.extend(email_messages)
+        return len(email_messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='core.mail.OutboxEmailBackend',
+    OUTBOX_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class OutboxEmailTests(TestCase):
+    """E-mails vão para a fila no request e saem pelo send_outbox (locmem no lugar do SMTP)."""
+
+    def send(self):
+        message = EmailMultiAlternatives('Código', 'Seu código: 123', 'noreply@example.com', ['ana@example.com'])
+        message.attach_alternative('<p>Seu código: <b>123</b></p>', 'text/html')
+        message.send()
+
+    def test_send_only_enqueues(self):
+        with self.assertNumQueries(1):
+            self.send()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.STATUS_PENDING)
+
+    def test_send_outbox_delivers_batch(self):
+        for _ in range(3):
+            self.send()
+        call_command('send_outbox', stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.STATUS_SENT).exists())
+
+    def test_claimed_rows_are_skipped(self):
+        self.send()
+        self.assertEqual(len(claim_batch(10)), 1)
+        # Outro worker (ou o mesmo, antes da reserva vencer) não pega a linha
+        self.assertEqual(send_batch(), (0, 0))
+        self.assertGreater(OutboxEmail.objects.get().next_attempt_at, timezone.now())
+
+    @override_settings(OUTBOX_EMAIL_BACKEND='core.tests.CrashingEmailBackend')
+    def test_crash_keeps_sent_messages(self):
+        self.send()
+        self.send()
+        with self.assertRaises(SystemExit):
+            send_batch()
+
+        # A primeira já ficou como enviada; a outra espera a reserva vencer
+        self.assertEqual(len(mail.outbox), 1)
+        statuses = list(OutboxEmail.objects.order_by('pk').values_list('status', flat=True))
+        self.assertEqual(statuses, [OutboxEmail.STATUS_SENT, OutboxEmail.STATUS_PENDING])
+
+    @override_settings(OUTBOX_EMAIL_BACKEND='core.tests.FailingEmailBackend', OUTBOX_MAX_ATTEMPTS=2)
+    def test_failure_retries_with_backoff(self):
+        self.send()
+        call_command('send_outbox', stdout=io.StringIO())
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_PENDING, 1))
+        self.assertIn('SMTP indisponível', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Ainda não venceu: o send_outbox não tenta de novo
+        call_command('send_outbox', stdout=io.StringIO())
+        self.assertEqual(OutboxEmail.objects.get().attempts, 1)
+
+        # Última tentativa: desiste
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        call_command('send_outbox', stdout=io.StringIO())
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_FAILED, 2))
+
+    @override_settings(OUTBOX_PURGE_INTERVAL=0)
+    def test_loop_purges_periodically(self):
+        def old_sent_email():
+            OutboxEmail.objects.create(
+                subject='Antigo', from_email='noreply@example.com', to=['ana@example.com'],
+                status=OutboxEmail.STATUS_SENT, sent_at=timezone.now() - timezone.timedelta(days=30),
+            )
+
+        class StopLoop(Exception):
+            pass
+
+        old_sent_email()
+        sleeps = []
+
+        def sleep(seconds):
+            # Entre as voltas do worker chega mais um e-mail enviado há muito tempo
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                raise StopLoop
+            old_sent_email()
+
+        with mock.patch('core.management.commands.send_outbox.time.sleep', side_effect=sleep), self.assertRaises(StopLoop):
+            call_command('send_outbox', loop=True, stdout=io.StringIO())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Decisão do router (sem banco): réplica por padrão, primário depois de escrever."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.token = start_request(pinned=False)
+        self.addCleanup(end_request, self.token)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Company), 'replica_1')
+
+    def test_reads_after_write_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Company), PRIMARY)
+        self.assertEqual(self.router.db_for_read(Company), PRIMARY)
+
+    def test_pinned_request_reads_primary(self):
+        token = start_request(pinned=True)
+        self.addCleanup(end_request, token)
+        self.assertEqual(self.router.db_for_read(Company), PRIMARY)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas_no_routing(self):
+        self.assertIsNone(self.router.db_for_read(Company))
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate(PRIMARY, 'companies'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'companies'))
+
+
+@override_settings(REPLICA_DATABASES=['replica_test'])
+class ReplicaPinningTests(TestCase):
+    """O request que grava devolve o cookie que manda as próximas leituras para o primário."""
+    databases = {'default', 'replica_test'}
+
+    def middleware(self, view):
+        return ReplicaPinningMiddleware(view)(RequestFactory().post('/'))
+
+    def test_write_sets_pin_cookie(self):
+        def view(request):
+            OutboxEmail.objects.create(subject='x', body='x', from_email='a@example.com', to=['b@example.com'])
+            return HttpResponse()
+
+        cookie = self.middleware(view).cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertTrue(cookie['httponly'])
+
+    def test_read_only_request_has_no_cookie(self):
+        def view(request):
+            list(Company.objects.all())
+            return HttpResponse()
+
+        self.assertNotIn(PIN_COOKIE, self.middleware(view).cookies)
+
+
+@override_settings(REPLICA_DATABASES=['replica_test'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Com um alias de réplica de verdade (replica_test, espelho do default, ver core/settings_test.py):
+    a leitura vai para a conexão da réplica; depois de uma escrita, para a do primário.
+    TransactionTestCase: dentro do atomic do TestCase tudo já iria para o primário.
+    """
+    databases = {'default', 'replica_test'}
+
+    def middleware(self, view):
+        return ReplicaPinningMiddleware(view)(RequestFactory().post('/'))
+
+    def test_queries_follow_the_router(self):
+        def view(request):
+            with CaptureQueriesContext(connections['replica_test']) as replica, \
+                    CaptureQueriesContext(connections[PRIMARY]) as primary:
+                self.assertEqual(Company.objects.all().db, 'replica_test')
+                list(Company.objects.all())
+                self.assertEqual((len(replica), len(primary)), (1, 0))
+
+                OutboxEmail.objects.create(subject='x', body='x', from_email='a@example.com', to=['b@example.com'])
+                self.assertEqual(Company.objects.all().db, PRIMARY)
+                list(Company.objects.all())
+            self.assertEqual(len(replica), 1)
+            self.assertEqual(len(primary), 2)  # INSERT + leitura
+            return HttpResponse()
+
+        self.middleware(view)
+
+    def test_pinned_request_reads_primary(self):
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+
+        def view(request):
+            self.assertEqual(Company.objects.all().db, PRIMARY)
+            return HttpResponse()
+
+        ReplicaPinningMiddleware(view)(request)
+
+    def test_reads_inside_atomic_go_to_primary(self):
+        def view(request):
+            with transaction.atomic():
+                self.assertEqual(Company.objects.all().db, PRIMARY)
+            self.assertEqual(Company.objects.all().db, 'replica_test')
+            return HttpResponse()
+
+        self.middleware(view)
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1.0, DEBUG=False)
+class ServerTimingTests(SimpleTestCase):
+    """Server-Timing só para staff (ou DEBUG), nos modos sync e async."""
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+
+        async def auser():
+            return user
+        request.auser = auser
+        return request
+
+    def test_header_only_for_staff(self):
+        middleware = ServerTimingMiddleware(lambda request: HttpResponse())
+        self.assertIn('Server-Timing', middleware(self.request(get_user_model()(is_staff=True))))
+        self.assertNotIn('Server-Timing', middleware(self.request(get_user_model()())))
+        self.assertNotIn('Server-Timing', middleware(self.request(AnonymousUser())))
+
+    async def test_async_mode(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = ServerTimingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertTrue(iscoroutinefunction(middleware.process_view))
+        response = await middleware(self.request(get_user_model()(is_staff=True)))
+        self.assertIn('total;dur=', response['Server-Timing'])
+        response = await middleware(self.request(AnonymousUser()))
+        self.assertNotIn('Server-Timing', response)
+
+
+class WarmupTests(TestCase):
+    """Aquecimento do worker (core/warmup.py): roda inteiro sem request nenhum."""
+
+    def test_warm_up_compiles_templates_and_connects(self):
+        timings = warm_up()
+        self.assertEqual(list(timings), ['urls', 'templates', 'storage', 'connections'])
+        # Pelo menos os templates do projeto (base, includes, páginas)
+        self.assertGreaterEqual(timings['templates'][0], 10)
+        self.assertGreaterEqual(timings['connections'][0], 1)
+
+
+@override_settings(SESSION_ENGINE='core.sessions')
+class LegacySessionTests(TestCase):
+    """Sessões (core/sessions.py): a da tabela antiga vai para o cache no primeiro request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('sessao@example.com', 'x', name='Sessão')
+        company = Company.objects.create(legal_name='Sessão Ltda', cnpj=make_cnpj(1))
+        Membership.objects.create(user=cls.user, company=company, role=Membership.ROLE_ADMIN)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def legacy_session(self, **extra):
+        # Sessão como o backend antigo (django_session) gravava depois do login
+        store = DBSessionStore()
+        store[SESSION_KEY] = str(self.user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = self.user.get_session_auth_hash()
+        store.update(extra)
+        store.create()
+        return store.session_key
+
+    def test_legacy_cookie_keeps_user_logged_in(self):
+        session_key = self.legacy_session()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.user)
+        # Copiada para o cache e apagada da tabela: o próximo request não passa pelo banco antigo
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        self.assertEqual(SessionStore(session_key).load()[SESSION_KEY], str(self.user.pk))
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+
+    async def test_async_load_migrates(self):
+        session_key = await sync_to_async(self.legacy_session)(tema='escuro')
+        self.assertEqual((await SessionStore(session_key).aload())['tema'], 'escuro')
+        self.assertFalse(await Session.objects.filter(session_key=session_key).aexists())
+        self.assertEqual((await SessionStore(session_key).aload())['tema'], 'escuro')
+
+    def test_unknown_key_is_a_new_session(self):
+        store = SessionStore('chave-que-nao-existe-em-lugar-nenhum')
+        self.assertEqual(store.load(), {})
+        self.assertIsNone(store.session_key)
+
+    def test_clear_legacy_sessions(self):
+        now = timezone.now()
+        for n in range(3):
+            Session.objects.create(session_key=f'expirada{n}', session_data='', expire_date=now - timezone.timedelta(days=1))
+        Session.objects.create(session_key='valida', session_data='', expire_date=now + timezone.timedelta(days=1))
+
+        stdout = io.StringIO()
+        call_command('clear_legacy_sessions', batch_size=2, sleep=0, stdout=stdout)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['valida'])
+        self.assertIn('3 sessões apagadas da tabela antiga.', stdout.getvalue())
+
+        call_command('clear_legacy_sessions', all=True, sleep=0, stdout=io.StringIO())
+        self.assertFalse(Session.objects.exists())
+
+
+class RouteMatcherTests(SimpleTestCase):
+    """Política das rotas (core/routing.py): prefixo mais longo vence; nomes viram prefixos."""
+
+    def test_longest_prefix_wins(self):
+        matcher = RouteMatcher([
+            (PUBLIC, '/accounts/'),
+            (TENANT, '/accounts/email/'),
+            (AUTH_ONLY, '/accounts/email/change/'),
+        ])
+        self.assertEqual(matcher('/accounts/login/'), PUBLIC)
+        self.assertEqual(matcher('/accounts/email/'), TENANT)
+        self.assertEqual(matcher('/accounts/email/change/1/'), AUTH_ONLY)
+        self.assertEqual(matcher('/companies/profile/'), TENANT)  # Não declarada: padrão
+        self.assertEqual(RouteMatcher([])('/qualquer/'), TENANT)
+
+    def test_named_routes_resolve_to_prefixes(self):
+        self.assertEqual(route_prefix('create_company'), reverse('create_company'))
+        # Com parâmetro: o trecho fixo antes dele
+        self.assertEqual(route_prefix('switch_company'), '/companies/switch/')
+        self.assertEqual(route_prefix('cep_lookup'), '/companies/cep/')
+        self.assertEqual(route_prefix('admin:index'), '/admin/')
+
+    def test_project_policies(self):
+        matcher = get_route_matcher()
+        self.assertEqual(matcher(reverse('account_login')), PUBLIC)
+        self.assertEqual(matcher(reverse('create_company')), AUTH_ONLY)
+        self.assertEqual(matcher(reverse('switch_company', args=['6f1c2a8e-0d3b-4f5e-9a7c-1b2d3e4f5a6b'])), AUTH_ONLY)
+        self.assertEqual(matcher(reverse('cep_lookup', args=['01001000'])), AUTH_ONLY)
+        self.assertEqual(matcher(reverse('company_detail')), TENANT)
+        self.assertEqual(matcher(reverse('home')), TENANT)
+
+
+class SearchTests(TestCase):
+    """Busca pelo search_text (core/search.py), direto e pelo admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounting = Company.objects.create(legal_name='Contabilidade São Paulo Ltda', trade_name='Conta SP', cnpj=make_cnpj(1))
+        cls.bakery = Company.objects.create(legal_name='Padaria Paulista Ltda', cnpj=make_cnpj(2))
+        cls.ana = get_user_model().objects.create_user('ana@example.com', 'x', name='Ana Gonçalves')
+        cls.bruno = get_user_model().objects.create_user('bruno@example.com', 'x', name='Bruno')
+        cls.ana_membership = Membership.objects.create(user=cls.ana, company=cls.bakery)
+        cls.bruno_membership = Membership.objects.create(user=cls.bruno, company=cls.accounting)
+
+    def search(self, term):
+        return set(search_queryset(Company.objects.all(), term))
+
+    def test_search_queryset(self):
+        self.assertEqual(self.search('sao paulo'), {self.accounting})  # Sem acento, qualquer caixa
+        self.assertEqual(self.search('PAULO contabilidade'), {self.accounting})  # Qualquer ordem
+        self.assertEqual(self.search('paul'), {self.accounting, self.bakery})
+        self.assertEqual(self.search(self.bakery.cnpj_normalized[:8]), {self.bakery})
+        self.assertEqual(self.search('paulo padaria'), set())  # Todas as palavras no mesmo registro
+        self.assertEqual(self.search('   '), {self.accounting, self.bakery})
+
+    def test_admin_search(self):
+        request = RequestFactory().get('/admin/')
+        company_admin = admin.site._registry[Company]
+        queryset, may_have_duplicates = company_admin.get_search_results(request, Company.objects.all(), 'conta sp')
+        self.assertEqual(set(queryset), {self.accounting})
+        self.assertFalse(may_have_duplicates)
+
+        # search_related: acha o vínculo pelo nome do usuário ou da empresa
+        membership_admin = admin.site._registry[Membership]
+        for term, expected in (('goncalves', {self.ana_membership}), ('contabilidade', {self.bruno_membership}), ('', None)):
+            with self.subTest(term=term):
+                queryset, _ = membership_admin.get_search_results(request, Membership.objects.all(), term)
+                self.assertEqual(set(queryset), expected or {self.ana_membership, self.bruno_membership})
+
+    def test_postgres_indexes_are_built_concurrently(self):
+        migration = import_module('companies.migrations.0005_company_search_text').Migration
+        operations = [op for op in migration.operations if isinstance(op, PostgresAddIndex)]
+        self.assertEqual(len(operations), 2)
+        self.assertFalse(migration.atomic)
+
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'postgresql'
+        state = mock.Mock()
+        for operation in operations:
+            operation.database_forwards('companies', schema_editor, state, state)
+        self.assertEqual([call.kwargs for call in schema_editor.add_index.call_args_list], [{'concurrently': True}] * 2)
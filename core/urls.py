@@ -1,14 +1,27 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from django.views.generic import TemplateView
+from core.routing import route_policy, PUBLIC
+from companies.views import dashboard
 
 
+def trigger_error(request):
+    # Rota de teste do Sentry: gera um erro de propósito
+    division_by_zero = 1 / 0
+
+
+# Política de acesso (ver core/routing.py). O que não estiver aqui exige login + empresa.
+route_policy(PUBLIC,
+    '/accounts/',  # Rotas do Allauth (Login, Signup, Reset Senha, Logout)
+    '/admin/',     # Django Admin (tem o próprio login)
+    '/static/',    # Arquivos estáticos (CSS/JS)
+    '/media/',     # Uploads
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('companies/', include('companies.urls')), # <--- Adicione isso
-    path('', TemplateView.as_view(template_name='pages/home.html'), name='home'),
+    path('', dashboard, name='home'),
     path('sentry-debug/', trigger_error), 
 ]
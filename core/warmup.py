@@ -0,0 +1,100 @@
+"""
+Aquecimento do worker: faz antes do primeiro request o que ele pagaria.
+
+Sem isso o primeiro request de cada worker (deploy, autoscale, restart por
+max_requests) monta o resolver de URLs, compila os templates, importa o
+boto3 e abre as conexões com banco e Redis.
+
+Duas etapas (ver gunicorn.conf.py):
+
+1. warm_up(connect=False), no CoreConfig.ready com WARMUP_ON_READY: só
+   memória (URLs, templates, storage). Com preload_app roda uma vez no
+   master e os workers herdam tudo pronto no fork
+2. warm_connections(), no post_worker_init do gunicorn: conexões são por
+   processo, então só depois do fork
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def warm_urls():
+    # Resolver completo (reverse monta todos os padrões) + política de acesso das rotas
+    from django.urls import get_resolver, reverse
+
+    from .routing import get_route_matcher
+
+    reverse('home')
+    get_route_matcher()
+    return len(get_resolver().url_patterns)
+
+
+def warm_templates():
+    """Compila os templates do projeto e dos apps (ficam no cache do loader)."""
+    from django.template import TemplateSyntaxError, engines
+    from django.template.autoreload import get_template_directories
+
+    names = set()
+    for directory in get_template_directories():
+        directory = Path(directory)
+        names.update(path.relative_to(directory).as_posix() for path in directory.rglob('*.html'))
+
+    compiled = 0
+    for engine in engines.all():
+        for name in sorted(names):
+            try:
+                engine.get_template(name)
+            except (TemplateSyntaxError, ImportError):
+                # Template de app que não usamos (tag de um app fora do INSTALLED_APPS)
+                logger.debug('Template %s não compilou no aquecimento', name, exc_info=True)
+                continue
+            compiled += 1
+    return compiled
+
+
+def warm_storage():
+    # Instancia o storage padrão: com S3 é aqui que o boto3 é importado
+    from django.core.files.storage import storages
+
+    storages['default']
+    return 1
+
+
+def warm_connections():
+    """Abre as conexões do processo (banco e caches). Falha não impede o worker de subir."""
+    opened = 0
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+            opened += 1
+        except Exception:
+            logger.warning('Aquecimento: banco %s indisponível', alias, exc_info=True)
+    for alias in settings.CACHES:
+        try:
+            caches[alias].get('warmup')
+            opened += 1
+        except Exception:
+            logger.warning('Aquecimento: cache %s indisponível', alias, exc_info=True)
+    return opened
+
+
+def warm_up(connect=True):
+    """Roda as etapas e devolve {etapa: (quantidade, ms)}."""
+    steps = [('urls', warm_urls), ('templates', warm_templates), ('storage', warm_storage)]
+    if connect:
+        steps.append(('connections', warm_connections))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        amount = step()
+        timings[name] = (amount, (time.perf_counter() - start) * 1000)
+
+    logger.info('Aquecimento: %s', ', '.join(f'{name} {amount} em {ms:.0f} ms' for name, (amount, ms) in timings.items()))
+    return timings
@@ -1,60 +1,316 @@
+"""
+Gera contexto_projeto.txt: árvore de pastas + conteúdo dos arquivos de código.
+
+Uma única passada pela árvore (respeitando o .gitignore), leitura dos
+arquivos em paralelo (threads) e saída sempre na mesma ordem.
+
+    python gerar_contexto.py                 # gera tudo
+    python gerar_contexto.py --incremental   # só relê o que mudou desde a última vez
+
+No modo incremental o manifesto (contexto_projeto.manifest.json) guarda,
+para cada arquivo, mtime/tamanho/hash e onde a seção dele está no arquivo
+gerado. Arquivo sem mudança tem a seção copiada do arquivo anterior, sem
+ser lido de novo. O manifesto vale só para o arquivo de saída que o gerou
+(caminho, tamanho e mtime): com outro --output, ou saída alterada por fora,
+tudo é relido.
+"""
+import argparse
+import codecs
+import hashlib
+import json
 import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CONFIGURAÇÃO: O que ignorar ---
 IGNORE_DIRS = {'.git', '__pycache__', 'venv', '.venv', 'env', 'media', 'staticfiles', '.vscode', '.idea'}
-IGNORE_FILES = {'db.sqlite3', '.env', 'package-lock.json', 'poetry.lock', 'gerar_contexto.py', 'contexto_projeto.txt'}
+IGNORE_FILES = {
+    'db.sqlite3', '.env', 'package-lock.json', 'poetry.lock', 'gerar_contexto.py',
+    'contexto_projeto.txt', 'contexto_projeto.manifest.json', 'contexto_projeto.manifest.json.tmp',
+}
 ALLOWED_EXTENSIONS = {'.py', '.html', '.css', '.js', '.txt', '.md'}
 
-def should_process(path, name):
-    if name in IGNORE_DIRS or name in IGNORE_FILES:
-        return False
-    return True
+OUTPUT_FILE = 'contexto_projeto.txt'
+MANIFEST_FILE = 'contexto_projeto.manifest.json'
+MAX_FILE_SIZE = 1024 * 1024   # Arquivos maiores entram só na árvore
+SNIFF_SIZE = 8192             # Bytes lidos para decidir se é binário
+CHUNK_SIZE = 64 * 1024
+
+BINARY_MESSAGE = '[Arquivo binário ou erro de leitura]'
+
+
+# --- .gitignore ---
+
+def _gitignore_regex(pattern):
+    # Padrão do gitignore -> regex sobre o caminho relativo (com "/")
+    anchored = pattern.startswith('/') or '/' in pattern.rstrip('/')
+    pattern = pattern.strip('/')
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[':
+            end = pattern.find(']', i)
+            if end == -1:
+                regex += re.escape(pattern[i])
+                i += 1
+            else:
+                regex += pattern[i:end + 1]
+                i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(('' if anchored else '(?:.*/)?') + regex + '$')
+
+
+class GitIgnore:
+    """Regras de um .gitignore (a última regra que casar vale; "!" desfaz)."""
+
+    def __init__(self, base, lines):
+        self.base = base  # Pasta do .gitignore, relativa à raiz ('' na raiz)
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            self.rules.append((_gitignore_regex(line), negate, line.endswith('/')))
+
+    @classmethod
+    def load(cls, directory, base):
+        try:
+            with open(os.path.join(directory, '.gitignore'), encoding='utf-8') as f:
+                return cls(base, f.readlines())
+        except OSError:
+            return None
+
+    def match(self, rel_path, is_dir):
+        if self.base:
+            if not rel_path.startswith(self.base + '/'):
+                return None
+            rel_path = rel_path[len(self.base) + 1:]
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+def is_ignored(rel_path, is_dir, gitignores):
+    ignored = False
+    for gitignore in gitignores:
+        result = gitignore.match(rel_path, is_dir)
+        if result is not None:
+            ignored = result
+    return ignored
+
+
+# --- Passada única pela árvore ---
+
+def walk(root, exclude=()):
+    """
+    Percorre a árvore uma vez, em ordem alfabética (sem os caminhos em exclude).
+    Retorna (linhas da árvore, arquivos de conteúdo [(caminho relativo, stat)]).
+    """
+    tree = []
+    files = []
+
+    def visit(directory, rel_dir, level, gitignores):
+        gitignore = GitIgnore.load(directory, rel_dir)
+        if gitignore is not None:
+            gitignores = gitignores + [gitignore]
+
+        tree.append(f"{' ' * 4 * level}{os.path.basename(directory) if rel_dir else '.'}/")
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            return
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if is_dir:
+                if entry.name not in IGNORE_DIRS and not is_ignored(rel_path, True, gitignores):
+                    subdirs.append((entry.path, rel_path))
+                continue
+            if entry.name in IGNORE_FILES or rel_path in exclude or is_ignored(rel_path, False, gitignores):
+                continue
+            tree.append(f"{' ' * 4 * (level + 1)}{entry.name}")
+            if os.path.splitext(entry.name)[1] in ALLOWED_EXTENSIONS:
+                files.append((rel_path, entry.stat()))
+
+        # Como no os.walk: arquivos da pasta primeiro, depois as subpastas
+        for path, rel_path in subdirs:
+            visit(path, rel_path, level + 1, gitignores)
+
+    visit(root, '', 0, [])
+    return tree, files
+
+
+# --- Leitura dos arquivos ---
+
+def read_section(root, rel_path, size):
+    """
+    Lê o arquivo em blocos e devolve (seção em bytes, sha1 do conteúdo).
+    Binário é detectado pelo começo do arquivo (byte nulo ou UTF-8 inválido).
+    """
+    display_path = f'./{rel_path}'
+    header = f'\n\n--- INICIO DO ARQUIVO: {display_path} ---\n'.encode('utf-8')
+    footer = f'\n--- FIM DO ARQUIVO: {display_path} ---\n'.encode('utf-8')
+
+    if size > MAX_FILE_SIZE:
+        body = f'[Arquivo grande: {size // 1024} KB, ignorado]'.encode('utf-8')
+        return header + body + footer, None
 
-def get_file_content(filepath):
+    digest = hashlib.sha1()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = []
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception:
-        return "[Arquivo binário ou erro de leitura]"
-
-def main():
-    output_file = 'contexto_projeto.txt'
-    
-    with open(output_file, 'w', encoding='utf-8') as out:
-        # 1. Cabeçalho
-        out.write("=== ESTRUTURA DO PROJETO DJANGO ===\n")
-        
-        # 2. Desenha a árvore de pastas
-        for root, dirs, files in os.walk('.'):
-            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS] # Filtra pastas na hora
-            
-            level = root.replace('.', '').count(os.sep)
-            indent = ' ' * 4 * (level)
-            out.write(f"{indent}{os.path.basename(root)}/\n")
-            
-            subindent = ' ' * 4 * (level + 1)
-            for f in files:
-                if f not in IGNORE_FILES:
-                    out.write(f"{subindent}{f}\n")
-        
-        out.write("\n\n=== CONTEÚDO DOS ARQUIVOS ===\n")
-        
-        # 3. Copia o conteúdo dos arquivos relevantes
-        for root, dirs, files in os.walk('.'):
-            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
-            
-            for file in files:
-                if file in IGNORE_FILES:
-                    continue
-                
-                _, ext = os.path.splitext(file)
-                if ext in ALLOWED_EXTENSIONS:
-                    filepath = os.path.join(root, file)
-                    out.write(f"\n\n--- INICIO DO ARQUIVO: {filepath} ---\n")
-                    out.write(get_file_content(filepath))
-                    out.write(f"\n--- FIM DO ARQUIVO: {filepath} ---\n")
-
-    print(f"✅ Sucesso! O arquivo '{output_file}' foi gerado na raiz.")
+        with open(os.path.join(root, rel_path), 'rb') as f:
+            first = True
+            while True:
+                chunk = f.read(SNIFF_SIZE if first else CHUNK_SIZE)
+                if not chunk:
+                    break
+                if first and b'\0' in chunk:
+                    raise ValueError('binário')
+                first = False
+                decoder.decode(chunk)  # Só valida o UTF-8; a saída reaproveita os bytes
+                digest.update(chunk)
+                chunks.append(chunk)
+        decoder.decode(b'', final=True)
+    except (OSError, ValueError):
+        return header + BINARY_MESSAGE.encode('utf-8') + footer, None
+
+    return header + b''.join(chunks) + footer, digest.hexdigest()
+
+
+def _output_signature(output):
+    # Identifica o arquivo gerado: os offsets do manifesto só valem para ele
+    stat = os.stat(output)
+    return {'path': os.path.abspath(output), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_manifest(output, manifest_path):
+    """Seções da última execução, se o manifesto for deste mesmo arquivo de saída (senão, {})."""
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('max_file_size') != MAX_FILE_SIZE or manifest.get('output') != _output_signature(output):
+            return {}
+        return manifest['files']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera o arquivo de contexto do projeto (árvore + conteúdo).')
+    parser.add_argument('--root', default='.')
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--incremental', action='store_true', help='Relê só os arquivos alterados desde a última execução')
+    parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    args = parser.parse_args(argv)
+
+    root = args.root
+    output = os.path.join(root, args.output)
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+
+    # 1. Uma passada: árvore + lista de arquivos (com stat)
+    # O próprio arquivo de saída (com --output fora do padrão) não entra nele mesmo
+    rel_output = os.path.relpath(output, root).replace(os.sep, '/')
+    tree, files = walk(root, exclude={rel_output, f'{rel_output}.tmp'})
+
+    previous = load_manifest(output, manifest_path) if args.incremental else {}
+    old_output = open(output, 'rb') if previous else None
+
+    # 2. Reaproveita as seções sem mudança (mtime e tamanho iguais); o resto vai para as threads
+    def section_for(item):
+        rel_path, stat = item
+        entry = previous.get(rel_path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return None
+        return read_section(root, rel_path, stat.st_size)
+
+    tmp_output = f'{output}.tmp'
+    manifest = {}
+    reused = changed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool, open(tmp_output, 'wb') as out:
+        out.write(b'=== ESTRUTURA DO PROJETO DJANGO ===\n')
+        out.write('\n'.join(tree).encode('utf-8') + b'\n')
+        out.write('\n\n=== CONTEÚDO DOS ARQUIVOS ==='.encode('utf-8') + b'\n')
+
+        # 3. Escreve na ordem da árvore; no máximo workers*4 arquivos lidos à frente (memória limitada)
+        pending = deque()
+        items = iter(files)
+
+        def submit_next():
+            item = next(items, None)
+            if item is not None:
+                pending.append((item, pool.submit(section_for, item)))
+
+        for _ in range(args.workers * 4):
+            submit_next()
+
+        while pending:
+            (rel_path, stat), future = pending.popleft()
+            submit_next()
+            result = future.result()
+            offset = out.tell()
+
+            if result is None:
+                entry = previous[rel_path]
+                old_output.seek(entry['offset'])
+                out.write(old_output.read(entry['length']))
+                sha1 = entry['sha1']
+                reused += 1
+            else:
+                section, sha1 = result
+                out.write(section)
+                if previous.get(rel_path, {}).get('sha1') == sha1 and sha1 is not None:
+                    reused += 1  # Só o mtime mudou (checkout, touch)
+                else:
+                    changed += 1
+
+            manifest[rel_path] = {
+                'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': sha1,
+                'offset': offset, 'length': out.tell() - offset,
+            }
+
+    if old_output is not None:
+        old_output.close()
+
+    # 4. Troca de uma vez (quem estiver lendo o arquivo antigo não vê arquivo pela metade)
+    # e grava o manifesto amarrado a este arquivo (caminho, tamanho, mtime), também atômico
+    os.replace(tmp_output, output)
+    _write_atomic(manifest_path, {'max_file_size': MAX_FILE_SIZE, 'output': _output_signature(output), 'files': manifest})
+
+    print(f"✅ Sucesso! O arquivo '{args.output}' foi gerado na raiz ({changed} alterados, {reused} sem mudança).")
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+Configuração do gunicorn (lida automaticamente: gunicorn core.wsgi).
+
+preload_app carrega o Django uma vez no master, já aquecido (URLs,
+templates, storage: ver core/warmup.py); os workers herdam tudo no fork.
+Cada worker abre as próprias conexões antes de aceitar requests.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('WARMUP_ON_READY', 'True')
+
+wsgi_app = 'core.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+# Reciclagem de worker (vazamento de memória) espalhada no tempo, para não reiniciar todos juntos
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+
+def post_worker_init(worker):
+    # Roda no worker depois de carregar o app e antes do primeiro request
+    from core.warmup import warm_connections
+
+    warm_connections()